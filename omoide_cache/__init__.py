@@ -1,9 +1,62 @@
-from .cache import Cache, ExpireMode, RefreshMode
+import importlib
+from .cache import Cache, ExpireMode, RefreshMode, WarmUpReport
+from .cache_config import CacheConfig
+from .tiered_cache import TieredCache, TierMode
 from .cache_decorator import omoide_cache
+from .cache_write_decorator import omoide_cache_put, omoide_cache_evict
+from .write_behind import WriteBehindQueue
+from .compact_storage import ResultStorage
+from .freeze import ResultProtection, register_freezer
+from .arguments_retention import ArgumentsRetention
+from .observers import CacheObserver, EvictCause, RecordingObserver, OpenTelemetryObserver
+from .fingerprint import Fingerprinter
+from .memory_watchdog import MemoryWatchdog
+from .clock import Clock, MonotonicClock, ManualClock
+from .trace import TraceRecorder, read_trace
 
 __all__ = [
     'Cache',
+    'CacheConfig',
+    'Clock',
+    'MonotonicClock',
+    'ManualClock',
     'ExpireMode',
     'RefreshMode',
-    'omoide_cache'
+    'ResultStorage',
+    'ResultProtection',
+    'register_freezer',
+    'ArgumentsRetention',
+    'WarmUpReport',
+    'TieredCache',
+    'TierMode',
+    'CacheObserver',
+    'EvictCause',
+    'RecordingObserver',
+    'OpenTelemetryObserver',
+    'Fingerprinter',
+    'MemoryWatchdog',
+    'InvalidationBus',
+    'DiskCache',
+    'WriteBehindQueue',
+    'TraceRecorder',
+    'read_trace',
+    'omoide_cache',
+    'omoide_cache_put',
+    'omoide_cache_evict'
 ]
+
+
+# Modules with heavy imports of their own (sockets, inspect), imported on first access, so "import omoide_cache" stays fast
+_LAZY_EXPORTS = {
+    'InvalidationBus': 'omoide_cache.invalidation_bus',
+    'DiskCache': 'omoide_cache.disk_cache',
+}
+
+
+def __getattr__(name):
+    module_name = _LAZY_EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError('module ' + __name__ + ' has no attribute ' + name)
+    value = getattr(importlib.import_module(module_name), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,99 @@
+import sys
+import threading
+from omoide_cache.trace import hash_key
+
+
+# Online estimate of the miss ratio curve, used to grow or shrink max_allowed_size of a cache within given bounds
+# A sample of keys (selected by key hash, so a key is either always sampled or never) is replayed against three shadow
+# simulations of the cache's size expire mode: at current size, one step smaller and one step larger (all scaled by the sample rate)
+# After each window of sampled accesses, the size grows if the larger shadow got noticeably more hits (relative to the current one),
+# and shrinks if the smaller shadow lost almost nothing
+
+# Rough per entry overhead of the cache maps on top of key and result, used for the memory budget
+ENTRY_OVERHEAD_BYTES = 400
+
+
+class AdaptiveSizer:
+    def __init__(self, size_expire_mode: str, initial_size: int, min_size: int, max_size: int, memory_budget_bytes: int = -1,
+                 window: int = 1000, step_ratio: float = 0.25, min_gain: float = 0.05, min_gain_hits: int = 5, max_shadow_keys: int = 1000):
+        # Imported here, as simulator itself depends on the cache module
+        from omoide_cache.simulator import POLICIES
+
+        if min_size < 1 or max_size < min_size:
+            raise RuntimeError('Adaptive sizing bounds are invalid: min_size=' + str(min_size) + ', max_size=' + str(max_size))
+        self.min_size = min_size
+        self.max_size = max_size
+        self.memory_budget_bytes = memory_budget_bytes
+        self.window = window
+        self.step_ratio = step_ratio
+        self.min_gain = min_gain                        # Relative change of hits that is worth growing for
+        self.min_gain_hits = min_gain_hits              # Smaller differences in a window are treated as noise
+        self.size = min(max(initial_size, min_size), max_size)
+
+        # Keys with hash below the threshold are sampled, so shadows never track more than about max_shadow_keys keys
+        self.sample_rate = min(1.0, max_shadow_keys / float(max_size))
+        self.sample_threshold = int(self.sample_rate * 2 ** 64)
+
+        policy = POLICIES[size_expire_mode]
+        self.shadows = [policy(1), policy(1), policy(1)]
+        self._resize_shadows()
+        self.shadow_hits = [0, 0, 0]
+        self.sampled_accesses = 0
+
+        # Estimated size of an entry in bytes
+        self.bytes_per_entry = 0.0
+        self._lock = threading.Lock()
+
+    def _shadow_sizes(self):
+        smaller_size = max(self.min_size, int(self.size * (1.0 - self.step_ratio)))
+        larger_size = min(self.max_size, max(self.size + 1, int(self.size * (1.0 + self.step_ratio))))
+        return [max(1, int(round(size * self.sample_rate))) for size in (smaller_size, self.size, larger_size)]
+
+    def _resize_shadows(self):
+        for shadow, size in zip(self.shadows, self._shadow_sizes()):
+            shadow.resize(size)
+
+    # Called on each access, returns new size if it has changed, otherwise None
+    def record_access(self, key, result) -> int:
+        key_hash = hash_key(key)
+        if key_hash >= self.sample_threshold:
+            return None
+
+        with self._lock:
+            for i in range(0, 3):
+                if self.shadows[i].access(key_hash):
+                    self.shadow_hits[i] = self.shadow_hits[i] + 1
+            self.sampled_accesses = self.sampled_accesses + 1
+
+            # Running average of the entry size
+            entry_bytes = sys.getsizeof(key) + sys.getsizeof(result) + ENTRY_OVERHEAD_BYTES
+            self.bytes_per_entry = entry_bytes if self.bytes_per_entry == 0.0 else 0.99 * self.bytes_per_entry + 0.01 * entry_bytes
+
+            if self.sampled_accesses < self.window:
+                return None
+            return self._adjust()
+
+    def _adjust(self) -> int:
+        smaller_hits, current_hits, larger_hits = self.shadow_hits
+        worth_growing = larger_hits - current_hits >= max(self.min_gain_hits, self.min_gain * current_hits)
+        worth_shrinking = current_hits - smaller_hits < max(self.min_gain_hits, self.min_gain / 2.0 * current_hits)
+        self.shadow_hits = [0, 0, 0]
+        self.sampled_accesses = 0
+
+        # Upper bound given by the memory budget
+        max_size = self.max_size
+        if self.memory_budget_bytes > 0 and self.bytes_per_entry > 0:
+            max_size = max(self.min_size, min(max_size, int(self.memory_budget_bytes / self.bytes_per_entry)))
+
+        old_size = self.size
+        if self.size > max_size:
+            self.size = max_size
+        elif worth_growing and self.size < max_size:
+            self.size = min(max_size, max(self.size + 1, int(self.size * (1.0 + self.step_ratio))))
+        elif worth_shrinking and self.size > self.min_size:
+            self.size = max(self.min_size, int(self.size * (1.0 - self.step_ratio)))
+
+        if self.size == old_size:
+            return None
+        self._resize_shadows()
+        return self.size
@@ -0,0 +1,63 @@
+import weakref
+from typing import List, Dict, Tuple
+
+
+# How a cache keeps arguments of each key, they are only needed to re-compute a key on refresh (and for invalidate_where)
+class ArgumentsRetention:
+    AUTO = 'AUTO'                                       # STRONG if refresh is enabled, NONE otherwise (default)
+    NONE = 'NONE'                                       # Arguments are not kept at all
+    STRONG = 'STRONG'                                   # Arguments are kept as is, so they stay alive as long as the key is cached
+    WEAK = 'WEAK'                                       # Arguments are kept as weak references where possible, keys with dead arguments are dropped instead of refreshed
+    COMPACT = 'COMPACT'                                 # Arguments are kept in the form given by arguments_dumper, and restored by arguments_loader
+
+
+def resolve_arguments_retention(arguments_retention: str, refresh_enabled: bool) -> str:
+    if arguments_retention == ArgumentsRetention.AUTO:
+        return ArgumentsRetention.STRONG if refresh_enabled else ArgumentsRetention.NONE
+    if arguments_retention not in (ArgumentsRetention.NONE, ArgumentsRetention.STRONG, ArgumentsRetention.WEAK, ArgumentsRetention.COMPACT):
+        raise RuntimeError('Arguments retention ' + str(arguments_retention) + ' is not implemented yet')
+    if arguments_retention == ArgumentsRetention.NONE and refresh_enabled:
+        raise RuntimeError('Refresh needs arguments of each key, arguments retention cannot be NONE')
+    return arguments_retention
+
+
+# Stands in for a weak reference for values that can't be weakly referenced (ints, strings, tuples, ...)
+class _StrongReference:
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __call__(self):
+        return self.value
+
+
+def _reference(value):
+    try:
+        return weakref.ref(value)
+    except TypeError:
+        return _StrongReference(value)
+
+
+def _dereference(reference):
+    value = reference()
+    if value is None and isinstance(reference, weakref.ref):
+        raise LookupError('Argument is no longer alive')
+    return value
+
+
+class WeakArguments:
+    __slots__ = ('positional_references', 'keyword_references')
+
+    def __init__(self, positional_arguments: List, keyword_arguments: Dict):
+        self.positional_references = tuple(_reference(value) for value in positional_arguments)
+        self.keyword_references = {name: _reference(value) for name, value in keyword_arguments.items()}
+
+    # Returns (positional_arguments, keyword_arguments), or None if any of them was garbage collected
+    def resolve(self) -> Tuple[List, Dict]:
+        try:
+            positional_arguments = tuple(_dereference(reference) for reference in self.positional_references)
+            keyword_arguments = {name: _dereference(reference) for name, reference in self.keyword_references.items()}
+        except LookupError:
+            return None
+        return positional_arguments, keyword_arguments
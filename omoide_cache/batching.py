@@ -0,0 +1,82 @@
+import threading
+from concurrent.futures import Future
+from typing import List, Dict, Tuple, Callable
+
+
+# Micro-batching of cache misses (the DataLoader pattern)
+# The first miss of a batch becomes its leader and waits up to window_ms for other misses to join, then computes all of them
+# with a single batch_call_to_execute([(positional_arguments, keyword_arguments), ...]) call, that must return results in the same order
+# A batch that reaches max_size is computed right away by the thread that filled it
+# Concurrent misses of a key that is already in flight don't join the batch again, they wait for the pending result
+
+
+class _Batch:
+    __slots__ = ('entries', 'closed')
+
+    def __init__(self):
+        self.entries = []                               # [(key, positional_arguments, keyword_arguments, future)]
+        self.closed = threading.Event()
+
+
+class MissBatcher:
+    def __init__(self, batch_call_to_execute: Callable[[List[Tuple[List, Dict]]], List], window_ms: float = 5, max_size: int = 100):
+        if max_size < 1:
+            raise RuntimeError('batch_max_size cannot be less than 1')
+        self.batch_call_to_execute = batch_call_to_execute
+        self.window_s = max(0.0, window_ms / 1000.0)
+        self.max_size = max_size
+        self.number_of_batches = 0
+        self._pending = {}                              # {key -> future of its result}
+        self._batch = None
+        self._lock = threading.Lock()
+
+    def compute(self, key, positional_arguments: List, keyword_arguments: Dict):
+        batch_to_run = None
+        leader_of = None
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None:
+                future = Future()
+                self._pending[key] = future
+                if self._batch is None:
+                    self._batch = _Batch()
+                    leader_of = self._batch
+                self._batch.entries.append((key, positional_arguments, keyword_arguments, future))
+                if len(self._batch.entries) >= self.max_size:
+                    batch_to_run = self._take_batch()
+
+        # Leader waits for the window to pass (or for the batch to be taken when full)
+        if leader_of is not None and batch_to_run is None:
+            leader_of.closed.wait(self.window_s)
+            with self._lock:
+                if self._batch is leader_of:
+                    batch_to_run = self._take_batch()
+
+        if batch_to_run is not None:
+            self._run(batch_to_run)
+        return future.result()
+
+    # Must be called under the lock
+    def _take_batch(self) -> _Batch:
+        batch = self._batch
+        self._batch = None
+        batch.closed.set()
+        return batch
+
+    def _run(self, batch: _Batch):
+        try:
+            results = list(self.batch_call_to_execute([(positional_arguments, keyword_arguments) for key, positional_arguments, keyword_arguments, future in batch.entries]))
+            if len(results) != len(batch.entries):
+                raise RuntimeError('batch_call_to_execute returned ' + str(len(results)) + ' results for ' + str(len(batch.entries)) + ' calls')
+        except BaseException as exception:
+            for key, positional_arguments, keyword_arguments, future in batch.entries:
+                future.set_exception(exception)
+        else:
+            for (key, positional_arguments, keyword_arguments, future), result in zip(batch.entries, results):
+                future.set_result(result)
+        finally:
+            with self._lock:
+                self.number_of_batches = self.number_of_batches + 1
+                for key, positional_arguments, keyword_arguments, future in batch.entries:
+                    if self._pending.get(key) is future:
+                        self._pending.pop(key)
@@ -0,0 +1,53 @@
+import sys
+import argparse
+from omoide_cache.benchmarks.benchmark import Target, SIZE_EXPIRE_MODES, REFRESH_MODES, build_configs, run_suite, save_results, load_results, compare_results
+from omoide_cache.benchmarks.workloads import Workload
+
+
+# Usage:
+#   python -m omoide_cache.benchmarks --output baseline.json
+#   python -m omoide_cache.benchmarks --baseline baseline.json --output current.json
+#   python -m omoide_cache.benchmarks --sizes 10000 --keys 50000 --samples 5 10 --refresh-modes NONE
+def main():
+    parser = argparse.ArgumentParser(prog='python -m omoide_cache.benchmarks', description='Benchmark omoide cache over synthetic workloads')
+    parser.add_argument('--workloads', nargs='+', default=Workload.ALL, choices=Workload.ALL)
+    parser.add_argument('--threads', nargs='+', type=int, default=[1, 4])
+    parser.add_argument('--sizes', nargs='+', type=int, default=[100, 1000])
+    parser.add_argument('--targets', nargs='+', default=[Target.CACHE, Target.DECORATOR], choices=[Target.CACHE, Target.DECORATOR])
+    parser.add_argument('--expire-modes', nargs='+', default=SIZE_EXPIRE_MODES, choices=SIZE_EXPIRE_MODES)
+    parser.add_argument('--refresh-modes', nargs='+', default=REFRESH_MODES, choices=REFRESH_MODES)
+    parser.add_argument('--keys', type=int, default=1000, help='Number of distinct keys in each workload')
+    parser.add_argument('--operations', type=int, default=10000, help='Number of operations in each run')
+    parser.add_argument('--samples', nargs='+', type=int, default=[], help='Also run each benchmark with sampled eviction of given sample sizes')
+    parser.add_argument('--output', help='Save results as JSON to this path')
+    parser.add_argument('--baseline', help='Compare results with a JSON saved by a previous run')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='Relative throughput drop (or absolute hit rate drop) reported as regression')
+    arguments = parser.parse_args()
+
+    configs = build_configs(workloads=arguments.workloads, thread_counts=arguments.threads, sizes=arguments.sizes,
+                            number_of_keys=arguments.keys, number_of_operations=arguments.operations, targets=arguments.targets,
+                            size_expire_modes=arguments.expire_modes, refresh_modes=arguments.refresh_modes,
+                            extra_cache_arguments=[{}] + [{'size_expire_samples': samples} for samples in arguments.samples])
+
+    def print_result(result):
+        print('%-100s %12.0f ops/s  p50 %8.2f us  p99 %8.2f us  hit rate %6.3f  %8.1f bytes/entry' % (
+            result['name'], result['ops_per_s'], result['p50_latency_us'], result['p99_latency_us'], result['hit_rate'], result['bytes_per_entry']))
+
+    suite_results = run_suite(configs, progress_callback=print_result)
+    if arguments.output:
+        save_results(suite_results, arguments.output)
+
+    if arguments.baseline:
+        rows = compare_results(load_results(arguments.baseline), suite_results, tolerance=arguments.tolerance)
+        print()
+        for row in rows:
+            print('%-100s throughput x%5.2f  hit rate %+6.3f  %+8.1f bytes/entry%s' % (
+                row['name'], row['throughput_ratio'], row['hit_rate_delta'], row['bytes_per_entry_delta'], '  REGRESSED' if row['regressed'] else ''))
+        number_of_regressions = len([row for row in rows if row['regressed']])
+        print('\n' + str(number_of_regressions) + ' of ' + str(len(rows)) + ' benchmarks regressed')
+        if number_of_regressions > 0:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
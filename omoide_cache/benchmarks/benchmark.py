@@ -0,0 +1,258 @@
+import sys
+import json
+import time
+import platform
+import threading
+import itertools
+import tracemalloc
+from typing import List, Dict
+from omoide_cache.cache import Cache, ExpireMode, RefreshMode
+from omoide_cache.cache_decorator import omoide_cache
+from omoide_cache.clock import ManualClock, MONOTONIC_CLOCK
+from omoide_cache.benchmarks.workloads import Workload, WRITE, build_workload
+
+
+# Benchmark runner for Cache and the decorator
+# Time inside the cache is simulated with a BenchmarkClock that moves forward a fixed tick per operation, so expiry and refresh
+# are due at the same operations in each run, while throughput and latency are measured with the real performance counter
+
+SIZE_EXPIRE_MODES = [ExpireMode.ACCESSED_TIME_BASED, ExpireMode.COMPUTED_TIME_BASED, ExpireMode.ACCESS_COUNT_BASED]
+REFRESH_MODES = [RefreshMode.NONE, RefreshMode.COUPLED, RefreshMode.INDEPENDENT]
+
+
+class Target:
+    CACHE = 'CACHE'                                     # Cache.get() called directly
+    DECORATOR = 'DECORATOR'                             # Method decorated with omoide_cache
+
+
+# Simulated time moves only in tick(), one tick per operation, under a lock, so no tick is lost when threads call it at once
+# Background work (coupled refreshes and the periodic independent refresh) runs in daemon threads as with the default clock,
+# instead of synchronously inside the get() that started it as ManualClock does, so latencies don't include refresh scans
+class BenchmarkClock(ManualClock):
+    def __init__(self, tick_s: float):
+        super().__init__()
+        self.tick_s = tick_s
+        self._tick_lock = threading.Lock()
+        self._threads = []
+        self._threads_lock = threading.Lock()
+
+    def tick(self):
+        with self._tick_lock:
+            self.advance(self.tick_s)
+
+    def call_later(self, delay_s: float, callback, *args):
+        return super().call_later(delay_s, self.call_soon, callback, *args)
+
+    def call_soon(self, callback, *args):
+        thread = MONOTONIC_CLOCK.call_soon(callback, *args)
+        with self._threads_lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            self._threads.append(thread)
+        return thread
+
+    # Waits for background work still running after the measured part of a run, so it doesn't slow down the next one
+    def join(self, timeout_s: float = 5.0):
+        deadline = time.time() + timeout_s
+        with self._threads_lock:
+            threads = list(self._threads)
+        for thread in threads:
+            thread.join(max(0.0, deadline - time.time()))
+
+
+class BenchmarkConfig:
+    def __init__(self, workload: str = Workload.ZIPFIAN, number_of_threads: int = 1,
+                 max_allowed_size: int = 100, size_expire_mode: str = ExpireMode.ACCESS_COUNT_BASED, refresh_mode: str = RefreshMode.NONE,
+                 number_of_keys: int = 1000, number_of_operations: int = 10000, target: str = Target.CACHE,
+                 tick_ms: float = 1.0, seed: int = 0, cache_arguments: Dict = None):
+        self.workload = workload
+        self.number_of_threads = number_of_threads
+        self.max_allowed_size = max_allowed_size
+        self.size_expire_mode = size_expire_mode
+        self.refresh_mode = refresh_mode
+        self.number_of_keys = number_of_keys
+        self.number_of_operations = number_of_operations
+        self.target = target
+        self.tick_ms = tick_ms
+        self.seed = seed
+        self.cache_arguments = cache_arguments if cache_arguments is not None else {}
+
+    # Unique name, used to match results of two runs
+    def name(self) -> str:
+        name = '/'.join([self.target, self.workload, 'threads=' + str(self.number_of_threads), 'size=' + str(self.max_allowed_size), self.size_expire_mode, 'refresh=' + self.refresh_mode])
+        for key in sorted(self.cache_arguments):
+            name = name + '/' + key + '=' + str(self.cache_arguments[key])
+        return name
+
+    def build_cache_arguments(self, clock: BenchmarkClock) -> Dict:
+        cache_arguments = dict(max_allowed_size=self.max_allowed_size, size_expire_mode=self.size_expire_mode, clock=clock)
+        if self.refresh_mode != RefreshMode.NONE:
+            cache_arguments.update(refresh_duration_s=1, refresh_mode=self.refresh_mode, refresh_period_s=1)
+        cache_arguments.update(self.cache_arguments)
+        return cache_arguments
+
+
+def _call(x: int) -> int:
+    return x * 2
+
+
+def _build_get(config: BenchmarkConfig, clock: BenchmarkClock):
+    cache_arguments = config.build_cache_arguments(clock)
+
+    if config.target == Target.CACHE:
+        cache = Cache(_call, **cache_arguments)
+        return cache, lambda key: cache.get([key]), lambda key: cache.invalidate([key]), lambda key: cache.is_cached([key])
+
+    elif config.target == Target.DECORATOR:
+        class BenchmarkService:
+            @omoide_cache(**cache_arguments)
+            def method(self, x: int) -> int:
+                return x * 2
+        service = BenchmarkService()
+        cache = service.method.cache
+        return cache, service.method, service.method.invalidate, lambda key: cache.is_cached((service, key))
+
+    else:
+        raise RuntimeError('Benchmark target ' + str(config.target) + ' is not implemented yet')
+
+
+def _percentile(sorted_values: List[int], percentile: float) -> int:
+    if not sorted_values:
+        return 0
+    index = min(len(sorted_values) - 1, int(round(percentile / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def measure_bytes_per_entry(config: BenchmarkConfig) -> float:
+    clock = BenchmarkClock(config.tick_ms / 1000.0)
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        cache, get, invalidate, is_cached = _build_get(config, clock)
+        for key in range(0, config.max_allowed_size):
+            get(key)
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    cache.close()
+    clock.join()
+    return (after - before) / float(max(1, len(cache.results_map)))
+
+
+def run_benchmark(config: BenchmarkConfig) -> Dict:
+    operations = build_workload(config.workload, config.number_of_keys, config.number_of_operations, seed=config.seed)
+    clock = BenchmarkClock(config.tick_ms / 1000.0)
+    cache, get, invalidate, is_cached = _build_get(config, clock)
+
+    # Operations are split between threads round-robin, each thread keeps its own latencies
+    latencies_per_thread = [[] for i in range(0, config.number_of_threads)]
+    hits_per_thread = [0 for i in range(0, config.number_of_threads)]
+    reads_per_thread = [0 for i in range(0, config.number_of_threads)]
+    barrier = threading.Barrier(config.number_of_threads + 1)
+
+    def run_thread(thread_index: int):
+        latencies = latencies_per_thread[thread_index]
+        barrier.wait()
+        for operation, key in itertools.islice(operations, thread_index, None, config.number_of_threads):
+            clock.tick()
+            if operation == WRITE:
+                t1 = time.perf_counter_ns()
+                invalidate(key)
+                t2 = time.perf_counter_ns()
+            else:
+                if is_cached(key):
+                    hits_per_thread[thread_index] = hits_per_thread[thread_index] + 1
+                reads_per_thread[thread_index] = reads_per_thread[thread_index] + 1
+                t1 = time.perf_counter_ns()
+                get(key)
+                t2 = time.perf_counter_ns()
+            latencies.append(t2 - t1)
+
+    threads = [threading.Thread(target=run_thread, args=[i], daemon=True) for i in range(0, config.number_of_threads)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    t1 = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    t2 = time.perf_counter()
+    cache.close()
+    clock.join()
+
+    latencies = sorted(itertools.chain.from_iterable(latencies_per_thread))
+    reads = sum(reads_per_thread)
+    return {
+        'name': config.name(),
+        'ops_per_s': len(latencies) / max(t2 - t1, 1e-9),
+        'p50_latency_us': _percentile(latencies, 50) / 1000.0,
+        'p99_latency_us': _percentile(latencies, 99) / 1000.0,
+        'hit_rate': sum(hits_per_thread) / float(reads) if reads > 0 else 0.0,
+        'bytes_per_entry': measure_bytes_per_entry(config),
+    }
+
+
+# Full matrix of workloads, thread counts, cache sizes and all size expire / refresh mode combinations
+# Each combination is repeated for every dict of extra cache arguments (e.g. [{}, {'size_expire_samples': 5}] to compare exact and sampled eviction)
+def build_configs(workloads: List[str] = None, thread_counts: List[int] = None, sizes: List[int] = None,
+                  number_of_keys: int = 1000, number_of_operations: int = 10000, targets: List[str] = None,
+                  size_expire_modes: List[str] = None, refresh_modes: List[str] = None,
+                  extra_cache_arguments: List[Dict] = None) -> List[BenchmarkConfig]:
+    configs = []
+    for target in (targets if targets is not None else [Target.CACHE, Target.DECORATOR]):
+        for workload in (workloads if workloads is not None else Workload.ALL):
+            for number_of_threads in (thread_counts if thread_counts is not None else [1, 4]):
+                for max_allowed_size in (sizes if sizes is not None else [100, 1000]):
+                    for size_expire_mode in (size_expire_modes if size_expire_modes is not None else SIZE_EXPIRE_MODES):
+                        for refresh_mode in (refresh_modes if refresh_modes is not None else REFRESH_MODES):
+                            for cache_arguments in (extra_cache_arguments if extra_cache_arguments is not None else [{}]):
+                                configs.append(BenchmarkConfig(
+                                    workload=workload, number_of_threads=number_of_threads,
+                                    max_allowed_size=max_allowed_size, size_expire_mode=size_expire_mode, refresh_mode=refresh_mode,
+                                    number_of_keys=number_of_keys, number_of_operations=number_of_operations, target=target,
+                                    cache_arguments=cache_arguments
+                                ))
+    return configs
+
+
+def run_suite(configs: List[BenchmarkConfig], progress_callback=None) -> Dict:
+    results = []
+    for config in configs:
+        result = run_benchmark(config)
+        results.append(result)
+        if progress_callback is not None:
+            progress_callback(result)
+    return {
+        'python': sys.version.split()[0],
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+
+
+def save_results(suite_results: Dict, path: str):
+    with open(path, 'w') as file:
+        json.dump(suite_results, file, indent=2, sort_keys=True)
+
+
+def load_results(path: str) -> Dict:
+    with open(path, 'r') as file:
+        return json.load(file)
+
+
+# Returns a comparison row for each benchmark present in both runs, regressed is True if throughput or hit rate dropped by more than tolerance
+def compare_results(baseline: Dict, current: Dict, tolerance: float = 0.1) -> List[Dict]:
+    baseline_by_name = {result['name']: result for result in baseline['results']}
+    rows = []
+    for result in current['results']:
+        baseline_result = baseline_by_name.get(result['name'])
+        if baseline_result is None:
+            continue
+        throughput_ratio = result['ops_per_s'] / max(baseline_result['ops_per_s'], 1e-9)
+        hit_rate_delta = result['hit_rate'] - baseline_result['hit_rate']
+        rows.append({
+            'name': result['name'],
+            'throughput_ratio': throughput_ratio,
+            'hit_rate_delta': hit_rate_delta,
+            'bytes_per_entry_delta': result['bytes_per_entry'] - baseline_result['bytes_per_entry'],
+            'regressed': throughput_ratio < 1.0 - tolerance or hit_rate_delta < -tolerance,
+        })
+    return rows
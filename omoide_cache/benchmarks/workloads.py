@@ -0,0 +1,69 @@
+import random
+import bisect
+import itertools
+from typing import Iterator, Tuple, List
+
+
+# Synthetic access patterns for benchmarks, each workload yields (operation, key) tuples
+# Operation is either READ (a regular get) or WRITE (the key is invalidated, as if the data behind it changed)
+# All workloads are seeded, so the same parameters always produce the same sequence
+
+READ = 'READ'
+WRITE = 'WRITE'
+
+
+class Workload:
+    ZIPFIAN = 'ZIPFIAN'                                 # Few hot keys receive most of the reads
+    UNIFORM = 'UNIFORM'                                 # All keys are equally likely
+    SCAN = 'SCAN'                                       # Sequential passes over a key range, mixed with a small hot set
+    MIXED = 'MIXED'                                     # Zipfian reads with a share of writes
+
+    ALL = [ZIPFIAN, UNIFORM, SCAN, MIXED]
+
+
+def zipfian(number_of_keys: int, number_of_operations: int, exponent: float = 1.0, seed: int = 0) -> Iterator[Tuple[str, int]]:
+    generator = random.Random(seed)
+    cumulative_weights = list(itertools.accumulate(1.0 / (rank ** exponent) for rank in range(1, number_of_keys + 1)))
+    total_weight = cumulative_weights[-1]
+    for i in range(0, number_of_operations):
+        yield READ, bisect.bisect_left(cumulative_weights, generator.random() * total_weight)
+
+
+def uniform(number_of_keys: int, number_of_operations: int, seed: int = 0) -> Iterator[Tuple[str, int]]:
+    generator = random.Random(seed)
+    for i in range(0, number_of_operations):
+        yield READ, generator.randrange(number_of_keys)
+
+
+def scan(number_of_keys: int, number_of_operations: int, hot_ratio: float = 0.2, seed: int = 0) -> Iterator[Tuple[str, int]]:
+    generator = random.Random(seed)
+    number_of_hot_keys = max(1, number_of_keys // 100)
+    scan_position = 0
+    for i in range(0, number_of_operations):
+        if generator.random() < hot_ratio:
+            yield READ, generator.randrange(number_of_hot_keys)
+        else:
+            yield READ, number_of_hot_keys + scan_position
+            scan_position = (scan_position + 1) % max(1, number_of_keys - number_of_hot_keys)
+
+
+def mixed(number_of_keys: int, number_of_operations: int, write_ratio: float = 0.1, seed: int = 0) -> Iterator[Tuple[str, int]]:
+    generator = random.Random(seed + 1)
+    for operation, key in zipfian(number_of_keys, number_of_operations, seed=seed):
+        if generator.random() < write_ratio:
+            yield WRITE, key
+        else:
+            yield operation, key
+
+
+def build_workload(workload: str, number_of_keys: int, number_of_operations: int, seed: int = 0) -> List[Tuple[str, int]]:
+    if workload == Workload.ZIPFIAN:
+        return list(zipfian(number_of_keys, number_of_operations, seed=seed))
+    elif workload == Workload.UNIFORM:
+        return list(uniform(number_of_keys, number_of_operations, seed=seed))
+    elif workload == Workload.SCAN:
+        return list(scan(number_of_keys, number_of_operations, seed=seed))
+    elif workload == Workload.MIXED:
+        return list(mixed(number_of_keys, number_of_operations, seed=seed))
+    else:
+        raise RuntimeError('Workload ' + str(workload) + ' is not implemented yet')
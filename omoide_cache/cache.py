@@ -1,8 +1,33 @@
+import sys
 import time
+import math
+import atexit
+import logging
+import random
+import weakref
 import threading
-import traceback
 import operator
-from typing import List, Dict
+from concurrent.futures import Executor, ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import List, Dict, Tuple, Callable, Iterable, Iterator
+from omoide_cache.process_call import build_call_reference, execute_call, load_result
+from omoide_cache.clock import Clock, MONOTONIC_CLOCK
+from omoide_cache.trace import TraceRecorder, hash_key
+from omoide_cache.adaptive_sizing import AdaptiveSizer
+from omoide_cache.compact_storage import ResultStorage, CompactResultMap, CompactMetadataMap
+from omoide_cache.arguments_retention import ArgumentsRetention, WeakArguments, resolve_arguments_retention
+from omoide_cache.batching import MissBatcher
+from omoide_cache.observers import CacheObserver, EvictCause, cache_name
+from omoide_cache.log import logger, RateLimitedWarning
+from omoide_cache.fingerprint import Fingerprinter, DEFAULT_FINGERPRINTER
+from omoide_cache.stream import RecordedStream
+from omoide_cache.freeze import ResultProtection, freeze
+
+
+# Marker for keys that are missing in a map, as None can be a valid cached result
+_MISSING = object()
+
+# Number of best eviction candidates kept between rounds of sampled eviction
+EVICTION_POOL_SIZE = 16
 
 
 class ExpireMode:
@@ -18,23 +43,225 @@ class RefreshMode:
     INDEPENDENT = 'INDEPENDENT'                         # Cache results will be periodically checked and re-computed in a separate thread
 
 
+# What a size expire mode drops first: the key with the lowest score in the scores map (the key being accessed is spared if spare last accessed is set)
+# Policy of a cache is looked up once from its size expire mode, so evictions don't compare mode strings
+class SizeExpirePolicy:
+    def __init__(self, scores_map: Callable[['Cache'], Dict], spare_last_accessed: bool):
+        self.scores_map = scores_map
+        self.spare_last_accessed = spare_last_accessed
+
+
+SIZE_EXPIRE_POLICIES = {
+    ExpireMode.ACCESSED_TIME_BASED: SizeExpirePolicy(operator.attrgetter('last_accessed_map'), False),
+    ExpireMode.COMPUTED_TIME_BASED: SizeExpirePolicy(operator.attrgetter('last_computed_map'), False),
+    ExpireMode.ACCESS_COUNT_BASED: SizeExpirePolicy(operator.attrgetter('access_counter_map'), True),
+}
+
+
+# Ties go to the key inserted first, compact maps scan their columns for it instead of listing their items
+def _find_key_with_lowest_score(scores_map, excluded_key: str = None) -> str:
+    if type(scores_map) is CompactMetadataMap:
+        return scores_map.find_key_with_lowest_value(excluded_key)
+    if excluded_key is not None:
+        return min((p for p in scores_map.items() if p[0] != excluded_key), key=operator.itemgetter(1))[0]
+    return min(scores_map.items(), key=operator.itemgetter(1))[0]
+
+
+# How results are converted once, before they are stored: iterators are recorded (see RecordedStream), and results are frozen if protection is set
+# Preparer of a cache is looked up once from its result protection, called as preparer(cache, result)
+def _prepare_unprotected_result(cache, result):
+    if isinstance(result, Iterator):
+        return RecordedStream(result, max_items=cache.stream_max_items, spill_after_items=cache.stream_spill_after_items)
+    return result
+
+
+def _prepare_frozen_result(cache, result):
+    if isinstance(result, Iterator):
+        return RecordedStream(result, max_items=cache.stream_max_items, spill_after_items=cache.stream_spill_after_items, freeze_items=True)
+    return freeze(result)
+
+
+RESULT_PREPARERS = {
+    ResultProtection.NONE: _prepare_unprotected_result,
+    ResultProtection.FREEZE: _prepare_frozen_result,
+}
+
+
+# Streams dropped from the cache are released, so their spill file is closed once their readers are done
+def _release_result(result):
+    if type(result) is RecordedStream:
+        result.release()
+
+
+# How a cache keeps arguments of each key, looked up once from its arguments retention (see ArgumentsRetention)
+# dump(cache, positional_arguments, keyword_arguments) gives the form kept in the arguments map (dump is None if arguments are not kept),
+# resolve(cache, arguments) restores (positional_arguments, keyword_arguments) from it, or returns None if they are gone
+class ArgumentsPolicy:
+    def __init__(self, dump: Callable, resolve: Callable):
+        self.dump = dump
+        self.resolve = resolve
+
+
+def _dump_strong_arguments(cache, positional_arguments: List, keyword_arguments: Dict):
+    return positional_arguments, keyword_arguments
+
+
+def _resolve_strong_arguments(cache, arguments):
+    return arguments
+
+
+def _dump_weak_arguments(cache, positional_arguments: List, keyword_arguments: Dict):
+    return WeakArguments(positional_arguments, keyword_arguments)
+
+
+def _resolve_weak_arguments(cache, arguments):
+    return arguments.resolve()
+
+
+def _dump_compact_arguments(cache, positional_arguments: List, keyword_arguments: Dict):
+    return cache.arguments_dumper(positional_arguments, keyword_arguments)
+
+
+def _resolve_compact_arguments(cache, arguments):
+    return cache.arguments_loader(arguments)
+
+
+ARGUMENTS_POLICIES = {
+    ArgumentsRetention.NONE: ArgumentsPolicy(None, _resolve_strong_arguments),
+    ArgumentsRetention.STRONG: ArgumentsPolicy(_dump_strong_arguments, _resolve_strong_arguments),
+    ArgumentsRetention.WEAK: ArgumentsPolicy(_dump_weak_arguments, _resolve_weak_arguments),
+    ArgumentsRetention.COMPACT: ArgumentsPolicy(_dump_compact_arguments, _resolve_compact_arguments),
+}
+
+
+# Summary of a single Cache.warm() run
+class WarmUpReport:
+    def __init__(self):
+        self.computed = 0                               # Number of keys that were computed and stored
+        self.skipped = 0                                # Number of keys that were already cached (or repeated in the input)
+        self.failed = 0                                 # Number of keys whose computation raised an exception
+        self.stopped_by_size = False                    # True if warm-up stopped early because the cache was full
+        self.duration_s = 0.0
+
+    def __repr__(self):
+        return 'WarmUpReport{computed=' + str(self.computed) + ', skipped=' + str(self.skipped) + ', failed=' + str(self.failed) + \
+               ', stopped_by_size=' + str(self.stopped_by_size) + ', duration_s=' + str(round(self.duration_s, 3)) + '}'
+
+
+# Checks the settings that don't depend on the cached call, so a wrong one fails where the cache (or its CacheConfig) is created,
+# instead of on some later call or inside a refresh thread
+def validate_cache_settings(max_allowed_size: int = 100, size_expire_mode: str = ExpireMode.ACCESS_COUNT_BASED,
+                            refresh_duration_s: int = -1, refresh_mode: str = RefreshMode.COUPLED, refresh_period_s: int = -1,
+                            ttl_jitter_ratio: float = 0, adaptive_min_size: int = -1, adaptive_max_size: int = -1,
+                            result_storage: str = ResultStorage.OBJECT, result_protection: str = ResultProtection.NONE,
+                            arguments_retention: str = ArgumentsRetention.AUTO, arguments_dumper=None, arguments_loader=None,
+                            batch_call_to_execute=None, batch_max_size: int = 100):
+    if max_allowed_size < 1:
+        raise RuntimeError("max_allowed_size cannot be less than 1")
+    if size_expire_mode not in SIZE_EXPIRE_POLICIES:
+        raise RuntimeError('Size expire mode ' + str(size_expire_mode) + ' is not implemented yet')
+    refresh_enabled = refresh_duration_s > 0
+    if refresh_enabled and refresh_mode not in (RefreshMode.COUPLED, RefreshMode.INDEPENDENT):
+        raise RuntimeError('Refresh mode ' + str(refresh_mode) + ' is not implemented yet')
+    if refresh_enabled and refresh_mode == RefreshMode.INDEPENDENT and refresh_period_s < 1:
+        raise RuntimeError('Refresh mode INDEPENDENT needs refresh_period_s of at least 1, but it is ' + str(refresh_period_s))
+    if not 0 <= ttl_jitter_ratio < 1:
+        raise RuntimeError('ttl_jitter_ratio must be at least 0 and less than 1')
+    if adaptive_max_size > 0 and max(1, adaptive_min_size) > adaptive_max_size:
+        raise RuntimeError('Adaptive sizing bounds are invalid: min_size=' + str(adaptive_min_size) + ', max_size=' + str(adaptive_max_size))
+    if resolve_arguments_retention(arguments_retention, refresh_enabled) == ArgumentsRetention.COMPACT and (arguments_dumper is None or arguments_loader is None):
+        raise RuntimeError('Arguments retention COMPACT needs both arguments_dumper and arguments_loader')
+    if result_storage not in (ResultStorage.OBJECT, ResultStorage.FLOAT, ResultStorage.INT, ResultStorage.BYTES):
+        raise RuntimeError('Result storage ' + str(result_storage) + ' is not implemented yet')
+    if result_protection not in (ResultProtection.NONE, ResultProtection.FREEZE):
+        raise RuntimeError('Result protection ' + str(result_protection) + ' is not implemented yet')
+    if batch_call_to_execute is not None and batch_max_size < 1:
+        raise RuntimeError('batch_max_size cannot be less than 1')
+
+
+# concurrent.futures only imports its process pool (and multiprocessing with it) on first use, so it's not imported here for the isinstance check
+# An executor can only be a process pool if that module was already imported
+def _is_process_pool(executor) -> bool:
+    process_module = sys.modules.get('concurrent.futures.process')
+    return process_module is not None and isinstance(executor, process_module.ProcessPoolExecutor)
+
+
 class Cache:
     def __init__(self,
                  call_to_execute,
-                 max_allowed_size: int = 100, size_expire_mode: str = ExpireMode.ACCESS_COUNT_BASED,
+                 max_allowed_size: int = 100, size_expire_mode: str = ExpireMode.ACCESS_COUNT_BASED, size_expire_samples: int = -1,
                  expire_by_computed_duration_s: int = -1, expire_by_access_duration_s: int = -1,
                  refresh_duration_s: int = -1, refresh_mode: str = RefreshMode.COUPLED, refresh_period_s: int = -1,
-                 debug: bool = False
+                 early_refresh_beta: float = -1, ttl_jitter_ratio: float = 0,
+                 adaptive_min_size: int = -1, adaptive_max_size: int = -1, adaptive_memory_budget_bytes: int = -1,
+                 result_storage: str = ResultStorage.OBJECT, compact_bytes_width: int = 32,
+                 result_protection: str = ResultProtection.NONE,
+                 arguments_retention: str = ArgumentsRetention.AUTO,
+                 arguments_dumper: Callable[[List, Dict], object] = None, arguments_loader: Callable[[object], Tuple[List, Dict]] = None,
+                 batch_call_to_execute: Callable[[List[Tuple[List, Dict]]], List] = None, batch_window_ms: float = 5, batch_max_size: int = 100,
+                 stream_max_items: int = -1, stream_spill_after_items: int = -1,
+                 tag_fn: Callable[[List, Dict], Iterable] = None,
+                 observers: List[CacheObserver] = None,
+                 invalidation_bus=None, invalidation_channel: str = None,
+                 disk_cache=None,
+                 fingerprinter: Fingerprinter = None, ignored_positional_arguments: int = 0,
+                 executor: Executor = None,
+                 clock: Clock = None,
+                 trace_recorder: TraceRecorder = None,
+                 debug: bool = False,
+                 _settings_validated: bool = False
                  ):
+        # Settings that come from a CacheConfig were checked when it was created
+        if not _settings_validated:
+            validate_cache_settings(max_allowed_size=max_allowed_size, size_expire_mode=size_expire_mode,
+                                    refresh_duration_s=refresh_duration_s, refresh_mode=refresh_mode, refresh_period_s=refresh_period_s,
+                                    ttl_jitter_ratio=ttl_jitter_ratio, adaptive_min_size=adaptive_min_size, adaptive_max_size=adaptive_max_size,
+                                    result_storage=result_storage, result_protection=result_protection,
+                                    arguments_retention=arguments_retention, arguments_dumper=arguments_dumper, arguments_loader=arguments_loader,
+                                    batch_call_to_execute=batch_call_to_execute, batch_max_size=batch_max_size)
+
         # Main method that is used to populate the cache
         self.call_to_execute = call_to_execute
 
+        # Optional executor where misses and refreshes are computed (e.g. a ProcessPoolExecutor for CPU-bound calls)
+        # For process pools the call is sent by reference, so it must be a module level function or a class method
+        self.executor = executor
+        self.call_reference = None
+        if _is_process_pool(self.executor):
+            self.call_reference = build_call_reference(self.call_to_execute)
+
+        # Optional batch version of the main method, called as batch_call_to_execute([(positional_arguments, keyword_arguments), ...])
+        # and returning results in the same order. Misses that arrive within batch window (or until batch max size is reached) are computed together
+        # Batches run on the thread of the first miss, not on the executor. Refreshes and warm-up still use the main method
+        self.miss_batcher = None
+        if batch_call_to_execute is not None:
+            self.miss_batcher = MissBatcher(batch_call_to_execute, window_ms=batch_window_ms, max_size=batch_max_size)
+
         # If cache becomes larger than that - some results will be removed
         # Elements will be dropped from cache according to this expire mode
         self.max_allowed_size = max_allowed_size
         self.size_expire_mode = size_expire_mode
-        if self.max_allowed_size < 1:
-            raise RuntimeError("max_allowed_size cannot be less than 1")
+        self._size_expire_policy = SIZE_EXPIRE_POLICIES[self.size_expire_mode]
+
+        # Cap on max allowed size set by shrink() under memory pressure, until restore_capacity() is called
+        self._configured_max_allowed_size = self.max_allowed_size
+        self._pressure_max_size = None
+
+        # If size expire samples is set - the key to drop is chosen among that many random keys instead of all keys (much cheaper for large caches)
+        # Leave at -1 to disable
+        self.size_expire_samples = size_expire_samples
+        self._sampling_keys = []                        # Keys that can be sampled, may contain already dropped keys
+        self._eviction_pool = []                        # Best candidates from previous rounds [(score, key)]
+        self._random = random.Random()
+
+        # If adaptive max size is set - max allowed size becomes just the initial size, and will be adjusted between adaptive min/max sizes
+        # Cache will grow while more space gives noticeably more hits (and memory budget allows it), and shrink while less space loses almost nothing
+        # Leave at -1 to disable
+        self.adaptive_sizer = None
+        if adaptive_max_size > 0:
+            self.adaptive_sizer = AdaptiveSizer(self.size_expire_mode, self.max_allowed_size, max(1, adaptive_min_size), adaptive_max_size, memory_budget_bytes=adaptive_memory_budget_bytes)
+            self.max_allowed_size = self.adaptive_sizer.size
+            self._configured_max_allowed_size = self.max_allowed_size
 
         # If cache has some elements that were not computed for a long time - we will drop them
         # Leave at -1 to disable
@@ -54,18 +281,84 @@ class Cache:
         self.refresh_enabled = self.refresh_duration_ms > 0
         self.refresh_mode = refresh_mode
         self.refresh_period_s = refresh_period_s
-
-        # Debug flag
+        self._refresh_coupled_enabled = self.refresh_enabled and self.refresh_mode == RefreshMode.COUPLED
+
+        # If early refresh beta is set - keys are re-computed before they are due, with a probability that grows as they get closer to it,
+        # and with how long they took to compute (XFetch), so keys computed together don't all get re-computed on the same tick
+        # This applies to refresh, or (if refresh is disabled) to expire by computed, where get() then re-computes the key early
+        # 1 is a good default, larger values re-compute earlier. Leave at -1 to disable
+        self.early_refresh_beta = early_refresh_beta
+        self.early_refresh_enabled = self.early_refresh_beta > 0 and (self.refresh_enabled or self.expire_by_computed_enabled)
+        self.early_expire_enabled = self.early_refresh_enabled and not self.refresh_enabled and self.expire_by_computed_enabled
+
+        # If TTL jitter ratio is set - refresh and expire by computed durations of each key are shortened by up to that ratio
+        # The jitter of a key is derived from the key itself, so it stays the same for the key's lifetime. Leave at 0 to disable
+        self.ttl_jitter_ratio = ttl_jitter_ratio
+
+        # Arguments of each key are only kept if refresh needs them (AUTO), or as given by arguments retention
+        # With WEAK retention arguments (including "self" of decorated methods) don't stay alive because of the cache
+        # With COMPACT retention arguments are stored as arguments_dumper(positional_arguments, keyword_arguments) (e.g. just an id),
+        # and restored with arguments_loader(dumped_arguments), that returns (positional_arguments, keyword_arguments) or None if they are gone
+        self.arguments_retention = resolve_arguments_retention(arguments_retention, self.refresh_enabled)
+        self.arguments_dumper = arguments_dumper
+        self.arguments_loader = arguments_loader
+        self._arguments_policy = ARGUMENTS_POLICIES[self.arguments_retention]
+
+        # Arguments with the default repr that can't be weakly referenced are fingerprinted by their address (see Fingerprinter._identity_serial),
+        # unless arguments are kept strongly they are kept alive while their key is cached, so no new object can get the same address (and key)
+        self._keep_address_arguments = self.arguments_retention != ArgumentsRetention.STRONG
+        self.address_arguments_map = {}                 # {key -> its arguments that are fingerprinted by address}
+
+        # If result storage is not OBJECT - results of that fixed type and their timestamps / access counters are kept in typed arrays,
+        # indexed by slot number, instead of boxed objects in separate dicts (about 70 bytes per entry instead of about 350 with default retention, arguments kept for refresh come on top)
+        # Compact bytes width is the number of bytes reserved per slot for BYTES results
+        self.result_storage = result_storage
+        self.compact_bytes_width = compact_bytes_width
+        self._compact_storage_enabled = self.result_storage != ResultStorage.OBJECT
+
+        # If result protection is FREEZE - results are converted once into immutable or read-only forms when they are stored (see freeze.py),
+        # so hits can return the shared result without copies, and callers can't change it for each other
+        self.result_protection = result_protection
+        self._result_preparer = RESULT_PREPARERS[self.result_protection]
+
+        # Optional function that assigns tags to each computed key, called as tag_fn(positional_arguments, keyword_arguments)
+        # Keys can later be dropped in bulk with invalidate_by_tag()
+        self.tag_fn = tag_fn
+
+        # Keys are fixed size digests of the arguments, built by the fingerprinter (register handlers on your own instance for custom types)
+        self.fingerprinter = fingerprinter if fingerprinter is not None else DEFAULT_FINGERPRINTER
+
+        # Number of leading positional arguments left out of keys, e.g. 1 for "self" of decorated methods, which get a cache per object anyway
+        # Keys then don't depend on the object, so they are the same in each process (see InvalidationBus)
+        self.ignored_positional_arguments = ignored_positional_arguments
+
+        # Time source and scheduler for all expiry and refresh logic, monotonic by default
+        self.clock = clock if clock is not None else MONOTONIC_CLOCK
+
+        # Optional recorder of every access (key hash, timestamp, hit or miss), to be replayed later by the simulator
+        self.trace_recorder = trace_recorder
+
+        # Debug flag, debug messages go to the "omoide_cache" logger (at DEBUG level, so it must be enabled too)
         self.debug = debug
 
+        # Warnings that may repeat on every call under load
+        self._failed_drop_warning = RateLimitedWarning()
+        self._failed_drops_reset_warning = RateLimitedWarning()
+        self._failed_refresh_warning = RateLimitedWarning()
+
         # Terminate flag
         self.terminated = False
 
+        # Scheduled independent refresh, and running coupled refresh threads (handles given by the clock), so they can be stopped on close()
+        self._refresh_timer = None
+        self._refresh_threads = set()
+        self._refresh_threads_lock = threading.Lock()
+
         # Map that stores the results {key -> result}
         self.results_map = {}
         self.results_map_lock = threading.Lock()
 
-        # Map that stores arguments {key -> (positional_arguments, keyword_arguments)}
+        # Map that stores arguments {key -> (positional_arguments, keyword_arguments)}, in the form given by arguments retention
         self.arguments_map = {}
         self.arguments_map_lock = threading.Lock()
 
@@ -81,18 +374,122 @@ class Cache:
         self.access_counter_map = {}
         self.access_counter_map_lock = threading.Lock()
 
+        # Map that stores how long each key took to compute {key -> duration in nano-seconds}, only filled if early refresh is enabled
+        self.compute_duration_map = {}
+
+        # Map that stores reverse tag index {tag -> set of keys}, and map that stores tags of each key {key -> tuple of tags}
+        self.tags_map = {}
+        self.key_tags_map = {}
+        self.tags_map_lock = threading.Lock()
+
+        # Observers of hits, misses, loads, evictions and refreshes (e.g. for tracing), see CacheObserver
+        self.observers = list(observers) if observers is not None else []
+
+        # Results that are iterators (e.g. generators) are recorded as they are consumed, and replayed to each caller (see RecordedStream)
+        # Streams longer than max items are not cached, items past spill after items are kept in a temporary file. Leave at -1 to disable
+        self.stream_max_items = stream_max_items
+        self.stream_spill_after_items = stream_spill_after_items
+
+        # Optional persistent tier, misses of get() are looked up there before computing them, and stored there once computed
+        # Keys in memory remember their key in the disk tier, so invalidation by tag, by predicate or from other processes drops persisted results too
+        self.disk_cache = disk_cache
+        self.disk_keys_map = {}                         # {key -> its key in the disk tier}
+
+        # Optional InvalidationBus, invalidations of this cache are sent to caches of the same channel in other processes and the other way around
+        # Channel is the qualified name of the cached function by default, so the same cache in each process gets the same channel
+        self.invalidation_bus = invalidation_bus
+        self.invalidation_channel = invalidation_channel if invalidation_channel is not None else cache_name(self)
+        if self.invalidation_bus is not None:
+            self.invalidation_bus.attach(self, self.invalidation_channel)
+
+        # In compact mode results and metadata maps are replaced by views over shared typed columns
+        if self._compact_storage_enabled:
+            self._create_compact_maps()
+
+        # Track all live caches, without keeping them alive
+        _live_caches.add(self)
+
+        # Path of get() is picked once for the enabled features: caches without expiry, coupled or early refresh and adaptive sizing
+        # take the plain path, that doesn't check for any of them (debug is checked on each call, so it can be switched on later)
+        self._plain_get_enabled = self._is_plain()
+
         # Launch periodic refresh
         if self.refresh_enabled:
             if self.refresh_mode == RefreshMode.INDEPENDENT:
                 self._refresh_independent()
 
+    # Same as the constructor, with the settings of a config (see CacheConfig), one config can be used for any number of caches
+    # Settings are not checked again, so caches created per object (e.g. for decorated methods) don't pay for it
+    @classmethod
+    def from_config(cls, call_to_execute, config) -> 'Cache':
+        return cls(call_to_execute, _settings_validated=True, **config.cache_arguments())
+
     # Core methods
     #-------------------------------------------------------------------------------------------------------------------
-    def _build_key(self, positional_arguments: List, keyword_arguments: Dict) -> str:
-        return 'Key{positional_arguments=' + str(positional_arguments) + '; keyword_arguments=' + str(keyword_arguments) + '}'
+    def _build_key(self, positional_arguments: List, keyword_arguments: Dict) -> bytes:
+        if self.ignored_positional_arguments:
+            positional_arguments = positional_arguments[self.ignored_positional_arguments:]
+        return self.fingerprinter.fingerprint(positional_arguments, keyword_arguments)
+
+    # Key is only passed for misses of get(), which are the ones that can be batched and persisted
+    def _compute_result(self, positional_arguments: List, keyword_arguments: Dict, key: str = None):
+        if self.disk_cache is not None and key is not None:
+            disk_key = self.disk_cache.build_key(positional_arguments, keyword_arguments)
+            result = self.disk_cache.load(disk_key, _MISSING)
+            if result is _MISSING:
+                result = self._compute_result_now(positional_arguments, keyword_arguments, key)
+                if isinstance(result, Iterator):
+                    return result
+                self.disk_cache.store(disk_key, result)
+            if disk_key is not None:
+                self.disk_keys_map[key] = disk_key
+            return result
+        return self._compute_result_now(positional_arguments, keyword_arguments, key)
+
+    def _compute_result_now(self, positional_arguments: List, keyword_arguments: Dict, key: str = None):
+        if self.miss_batcher is not None and key is not None:
+            result = self.miss_batcher.compute(key, positional_arguments, keyword_arguments)
+        elif self.executor is None:
+            result = self.call_to_execute(*positional_arguments, **keyword_arguments)
+        else:
+            result = load_result(self._submit_computation(self.executor, positional_arguments, keyword_arguments).result())
+        return result
 
-    def _compute_result(self, positional_arguments: List, keyword_arguments: Dict):
-        return self.call_to_execute(*positional_arguments, **keyword_arguments)
+    def _compute_result_observed(self, positional_arguments: List, keyword_arguments: Dict, key: str):
+        for observer in self.observers:
+            observer.on_miss(self, key)
+            observer.on_load_start(self, key)
+        t1 = time.perf_counter_ns()
+        try:
+            result = self._compute_result(positional_arguments, keyword_arguments, key)
+        except BaseException as exception:
+            for observer in self.observers:
+                observer.on_load_end(self, key, time.perf_counter_ns() - t1, exception)
+            raise
+        for observer in self.observers:
+            observer.on_load_end(self, key, time.perf_counter_ns() - t1, None)
+        return result
+
+    # Result of the returned future must be passed through load_result()
+    def _submit_computation(self, executor: Executor, positional_arguments: List, keyword_arguments: Dict) -> Future:
+        if _is_process_pool(executor):
+            call_reference = self.call_reference if self.call_reference is not None else build_call_reference(self.call_to_execute)
+            return executor.submit(execute_call, call_reference, positional_arguments, keyword_arguments)
+        return executor.submit(self.call_to_execute, *positional_arguments, **keyword_arguments)
+
+    # Caches are never shipped to other processes, they get unpickled as None
+    # This allows to pickle the objects that own a cache (e.g. "self" of decorated methods) when computing in a process pool
+    def __reduce__(self):
+        return _unpickle_cache, ()
+
+    # Debug messages are only built if this is True
+    def _debug_enabled(self) -> bool:
+        return self.debug and logger.isEnabledFor(logging.DEBUG)
+
+    # Observers and trace recorder are handled by both paths of get() (see _get_stored_or_computed()), so they can still be added later
+    def _is_plain(self) -> bool:
+        return not (self.expire_by_computed_enabled or self.expire_by_access_enabled or self._refresh_coupled_enabled or self.early_refresh_enabled or
+                    self.adaptive_sizer is not None)
     #-------------------------------------------------------------------------------------------------------------------
 
 
@@ -101,25 +498,138 @@ class Cache:
     #-------------------------------------------------------------------------------------------------------------------
     def _update_in_result_map(self, key: str, result):
         with self.results_map_lock:
+            replaced_result = self.results_map.get(key)
             self.results_map[key] = result
+        _release_result(replaced_result)
 
     def _update_in_arguments_map(self, key: str, positional_arguments: List, keyword_arguments: Dict):
+        dump = self._arguments_policy.dump
+        if dump is None:
+            return
+        arguments = dump(self, positional_arguments, keyword_arguments)
         with self.arguments_map_lock:
-            self.arguments_map[key] = (positional_arguments, keyword_arguments)
+            self.arguments_map[key] = arguments
+
+    # Returns (positional_arguments, keyword_arguments) of the key, or None if the key was dropped or its arguments are gone
+    def _load_arguments(self, key: str) -> Tuple[List, Dict]:
+        arguments = self.arguments_map.get(key, _MISSING)
+        if arguments is _MISSING:
+            return None
+        return self._resolve_arguments(arguments)
+
+    # Arguments are given in the form they are kept in the arguments map
+    def _resolve_arguments(self, arguments) -> Tuple[List, Dict]:
+        return self._arguments_policy.resolve(self, arguments)
 
     def _update_in_last_computed_map(self, key):
         with self.last_computed_map_lock:
-            self.last_computed_map[key] = time.time_ns()
+            self.last_computed_map[key] = self.clock.time_ns()
 
     def _update_in_last_accessed_map(self, key):
         with self.last_accessed_map_lock:
-            self.last_accessed_map[key] = time.time_ns()
+            self.last_accessed_map[key] = self.clock.time_ns()
 
     def _update_in_access_counter_map(self, key):
         with self.access_counter_map_lock:
             old_value = self.access_counter_map.get(key, 0)
             new_value = old_value + 1
             self.access_counter_map[key] = new_value
+
+    def _update_in_tags_map(self, key: str, positional_arguments: List, keyword_arguments: Dict):
+        tags = tuple(self.tag_fn(positional_arguments, keyword_arguments))
+        with self.tags_map_lock:
+            self.key_tags_map[key] = tags
+            for tag in tags:
+                self.tags_map.setdefault(tag, set()).add(key)
+
+    def _remove_from_tags_map(self, key: str):
+        with self.tags_map_lock:
+            tags = self.key_tags_map.pop(key, ())
+            for tag in tags:
+                keys = self.tags_map.get(tag)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        self.tags_map.pop(tag)
+
+    # Drops the key from every map, raises KeyError if the key is missing in one of the maps
+    # Result goes last, as in compact mode metadata of a key only exists while its result does
+    def _remove_from_maps(self, key: str, cause: str):
+        if self._arguments_policy.dump is not None:
+            self.arguments_map.pop(key)
+        self.last_computed_map.pop(key)
+        self.last_accessed_map.pop(key)
+        self.access_counter_map.pop(key)
+        _release_result(self.results_map.pop(key))
+        self.compute_duration_map.pop(key, None)
+        self.address_arguments_map.pop(key, None)
+        self.disk_keys_map.pop(key, None)
+        self._remove_from_tags_map(key)
+        if self.observers:
+            self._notify_evict(key, cause)
+
+    # Drops the key from every map, silently skipping maps where it is already missing
+    def _discard_from_maps(self, key: str, cause: str) -> bool:
+        existed = key in self.results_map
+        self.arguments_map.pop(key, None)
+        self.last_computed_map.pop(key, None)
+        self.last_accessed_map.pop(key, None)
+        self.access_counter_map.pop(key, None)
+        _release_result(self.results_map.pop(key, None))
+        self.compute_duration_map.pop(key, None)
+        self.address_arguments_map.pop(key, None)
+        self.disk_keys_map.pop(key, None)
+        self._remove_from_tags_map(key)
+        if existed and self.observers:
+            self._notify_evict(key, cause)
+        return existed
+
+    def _reset_maps(self):
+        if self.observers:
+            for key in list(self.results_map):
+                self._notify_evict(key, EvictCause.CLEARED)
+        for result in self.results_map.values():
+            _release_result(result)
+        self.results_map = {}
+        self.arguments_map = {}
+        self.last_computed_map = {}
+        self.last_accessed_map = {}
+        self.access_counter_map = {}
+        self.compute_duration_map = {}
+        self.address_arguments_map = {}
+        self.disk_keys_map = {}
+        if self._compact_storage_enabled:
+            self._create_compact_maps()
+        with self.tags_map_lock:
+            self.tags_map = {}
+            self.key_tags_map = {}
+        self._sampling_keys = []
+        self._eviction_pool = []
+
+    def _keep_address_arguments_of(self, key: str, positional_arguments: List, keyword_arguments: Dict):
+        kept = []
+        for value in self.fingerprinter.identity_values(positional_arguments[self.ignored_positional_arguments:], keyword_arguments):
+            try:
+                weakref.ref(value)
+            except TypeError:
+                kept.append(value)
+        if kept:
+            with self.arguments_map_lock:
+                self.address_arguments_map[key] = kept
+
+    def _notify_evict(self, key: str, cause: str):
+        for observer in self.observers:
+            observer.on_evict(self, key, cause)
+
+    def _notify_refresh(self, key: str, duration_ns: int):
+        for observer in self.observers:
+            observer.on_refresh(self, key, duration_ns)
+
+    def _create_compact_maps(self):
+        self.results_map = CompactResultMap(self.result_storage, bytes_width=self.compact_bytes_width)
+        self.last_computed_map = CompactMetadataMap(self.results_map, 'last_computed')
+        self.last_accessed_map = CompactMetadataMap(self.results_map, 'last_accessed')
+        self.access_counter_map = CompactMetadataMap(self.results_map, 'access_counter')
     #-------------------------------------------------------------------------------------------------------------------
 
 
@@ -127,28 +637,37 @@ class Cache:
     # Public access method, main thing exposed to the user
     #-------------------------------------------------------------------------------------------------------------------
     def get(self, positional_arguments: List, keyword_arguments: Dict = {}):
+        if self._plain_get_enabled and not self.debug:
+            key = self._build_key(positional_arguments, keyword_arguments)
+            with self.results_map_lock:
+                result = self.results_map.get(key, _MISSING)
+            result = self._get_stored_or_computed(key, positional_arguments, keyword_arguments, result)
+            self._assert_expire_max_size(key)
+            return result
+
         t1 = time.time()
 
         # Build key
         key = self._build_key(positional_arguments, keyword_arguments)
 
-        # If the key is not currently stored
-        needs_to_be_computed = False
+        # Get key from the map
         with self.results_map_lock:
-            if key not in self.results_map:
-                needs_to_be_computed = True
-        if needs_to_be_computed:
-            computed_result = self._compute_result(positional_arguments, keyword_arguments)
-            self._update_in_result_map(key, computed_result)
-            self._update_in_arguments_map(key, positional_arguments, keyword_arguments)
-            self._update_in_last_computed_map(key)
+            result = self.results_map.get(key, _MISSING)
 
-        # Get key from the map
-        result = self.results_map[key]
+        # Key that is about to expire may be re-computed early
+        if self.early_expire_enabled and result is not _MISSING and self._is_due_for_early_expire(key):
+            result = _MISSING
 
-        # Update all map data
-        self._update_in_last_accessed_map(key)
-        self._update_in_access_counter_map(key)
+        # Hit or miss, and update all map data
+        result = self._get_stored_or_computed(key, positional_arguments, keyword_arguments, result)
+
+        # Adjust size
+        if self.adaptive_sizer is not None:
+            new_size = self.adaptive_sizer.record_access(key, result)
+            if new_size is not None:
+                self._set_max_allowed_size(new_size)
+                if self._debug_enabled():
+                    logger.debug('Cache.get(): Adaptive sizing changed max_allowed_size to %d', new_size)
 
         # Track size
         self._assert_expire_max_size(key)
@@ -156,18 +675,236 @@ class Cache:
         self._assert_expire_by_computed_duration()
 
         # Force refresh
-        if self.refresh_enabled:
-            if self.refresh_mode == RefreshMode.COUPLED:
-                self._refresh_coupled()
+        if self._refresh_coupled_enabled:
+            self._refresh_coupled()
 
-        t2 = time.time()
-        if self.debug:
-            print('Cache.get() With positional_arguments=' + str(positional_arguments) + ', keyword_arguments=' + str(keyword_arguments) + ' took ' + str(round(t2 - t1, 2)) + ' seconds')
+        if self._debug_enabled():
+            t2 = time.time()
+            logger.debug('Cache.get() With positional_arguments=%s, keyword_arguments=%s took %.2f seconds', positional_arguments, keyword_arguments, t2 - t1)
         return result
 
-    # Use this only if refresh independent is selected
-    def terminate(self):
+    # Common part of both paths of get(), for the result found in the map (or _MISSING): replays streams, records the access,
+    # computes and stores misses, notifies observers and updates access maps. Returns what the caller gets
+    def _get_stored_or_computed(self, key: str, positional_arguments: List, keyword_arguments: Dict, result):
+        # Streams are replayed to each caller, the ones that can't be replayed anymore are computed again
+        if type(result) is RecordedStream:
+            reader = result.replay()
+            result = _MISSING if reader is None else reader
+
+        # Record the access
+        if self.trace_recorder is not None:
+            self.trace_recorder.record(key, self.clock.time_ns(), result is not _MISSING)
+
+        # If the key is not currently stored (it might also have been invalidated in the meantime)
+        if result is _MISSING:
+            t3 = time.perf_counter_ns()
+            if self.observers:
+                result = self._compute_result_observed(positional_arguments, keyword_arguments, key)
+            else:
+                result = self._compute_result(positional_arguments, keyword_arguments, key)
+            if self.early_refresh_enabled:
+                self.compute_duration_map[key] = time.perf_counter_ns() - t3
+            result = self._store_computed_result(key, positional_arguments, keyword_arguments, result)
+        elif self.observers:
+            for observer in self.observers:
+                observer.on_hit(self, key)
+
+        self._update_in_last_accessed_map(key)
+        self._update_in_access_counter_map(key)
+        return result
+
+    # Stores the result of a miss (see RESULT_PREPARERS), returns what the caller gets
+    # Reader of a stream is taken before the stream is stored, so no other reader can abandon it before that
+    def _store_computed_result(self, key: str, positional_arguments: List, keyword_arguments: Dict, result):
+        result = self._result_preparer(self, result)
+        returned_result = result.replay() if type(result) is RecordedStream else result
+        self._update_in_result_map(key, result)
+        if self.size_expire_samples > 0:
+            self._add_sampling_key(key)
+        self._update_in_arguments_map(key, positional_arguments, keyword_arguments)
+        self._update_in_last_computed_map(key)
+        if self._keep_address_arguments:
+            self._keep_address_arguments_of(key, positional_arguments, keyword_arguments)
+        if self.tag_fn is not None:
+            self._update_in_tags_map(key, positional_arguments, keyword_arguments)
+        return returned_result
+
+    # Pre-populate the cache ahead of traffic. Positional arguments are streamed from the iterable (so it can be a generator),
+    # and the same keyword arguments are used for each of them. Results are computed on a thread pool of given concurrency
+    # (that goes through the cache executor if there's one), or directly on the given executor.
+    # Warmed keys are not counted as accessed, and no expire checks are done per insert. Warm-up stops once the cache is full.
+    def warm(self, positional_arguments_iterable: Iterable[List], keyword_arguments: Dict = {},
+             concurrency: int = 1, executor: Executor = None,
+             progress_callback: Callable[[WarmUpReport], None] = None, max_rate_per_s: float = -1) -> WarmUpReport:
+        t1 = time.time()
+        report = WarmUpReport()
+        if concurrency < 1:
+            raise RuntimeError('Warm-up concurrency cannot be less than 1')
+
+        own_executor = executor is None
+        if own_executor:
+            executor = ThreadPoolExecutor(max_workers=concurrency)
+
+        # Only a limited number of computations is kept in flight, so the iterable is never materialized
+        max_in_flight = 2 * concurrency
+        in_flight = {}                                  # {future -> (key, positional_arguments)}
+        in_flight_keys = set()
+        min_submit_interval_s = 1.0 / max_rate_per_s if max_rate_per_s > 0 else 0.0
+        next_submit_time = time.time()
+
+        def collect(futures):
+            for future in futures:
+                key, positional_arguments = in_flight.pop(future)
+                in_flight_keys.discard(key)
+                try:
+                    result = load_result(future.result())
+                except Exception:
+                    report.failed = report.failed + 1
+                    if self._debug_enabled():
+                        logger.debug('Cache.warm(): Failed to compute positional_arguments=%s', positional_arguments, exc_info=True)
+                else:
+                    self._insert_warm_result(key, positional_arguments, keyword_arguments, result)
+                    report.computed = report.computed + 1
+                if progress_callback is not None:
+                    progress_callback(report)
+
+        try:
+            for positional_arguments in positional_arguments_iterable:
+                # Respect the size limit
+                if len(self.results_map) + len(in_flight) >= self.max_allowed_size:
+                    report.stopped_by_size = True
+                    break
+
+                key = self._build_key(positional_arguments, keyword_arguments)
+                if key in self.results_map or key in in_flight_keys:
+                    report.skipped = report.skipped + 1
+                    continue
+
+                # Respect the rate limit
+                if min_submit_interval_s > 0:
+                    now = time.time()
+                    if now < next_submit_time:
+                        time.sleep(next_submit_time - now)
+                    next_submit_time = max(now, next_submit_time) + min_submit_interval_s
+
+                if own_executor:
+                    future = executor.submit(self._compute_result, positional_arguments, keyword_arguments)
+                else:
+                    future = self._submit_computation(executor, positional_arguments, keyword_arguments)
+                in_flight[future] = (key, positional_arguments)
+                in_flight_keys.add(key)
+
+                if len(in_flight) >= max_in_flight:
+                    done, not_done = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                    collect(done)
+
+            # Wait for the rest
+            done, not_done = wait(list(in_flight))
+            collect(done)
+        finally:
+            if own_executor:
+                executor.shutdown(wait=True)
+
+        t2 = time.time()
+        report.duration_s = t2 - t1
+        if self._debug_enabled():
+            logger.debug('Cache.warm(): Completed %s', report)
+        return report
+
+    def _insert_warm_result(self, key: str, positional_arguments: List, keyword_arguments: Dict, result):
+        self._update_in_result_map(key, self._result_preparer(self, result))
+        if self.size_expire_samples > 0:
+            self._add_sampling_key(key)
+        self._update_in_arguments_map(key, positional_arguments, keyword_arguments)
+        self._update_in_last_computed_map(key)
+        self._update_in_last_accessed_map(key)
+        with self.access_counter_map_lock:
+            self.access_counter_map.setdefault(key, 0)
+        if self._keep_address_arguments:
+            self._keep_address_arguments_of(key, positional_arguments, keyword_arguments)
+        if self.tag_fn is not None:
+            self._update_in_tags_map(key, positional_arguments, keyword_arguments)
+
+    # Stores a result that was computed elsewhere (e.g. returned by a method that saved it), it is not counted as accessed
+    # The result replaces the persisted one, and caches of the same channel in other processes drop their result of the key
+    def put(self, positional_arguments: List, keyword_arguments: Dict, result):
+        key = self._build_key(positional_arguments, keyword_arguments)
+        self._publish_invalidation([key])
+        if self.disk_cache is not None:
+            disk_key = self.disk_cache.build_key(positional_arguments, keyword_arguments)
+            if isinstance(result, Iterator):
+                self.disk_cache.discard(disk_key)
+            else:
+                self.disk_cache.store(disk_key, result)
+                if disk_key is not None:
+                    self.disk_keys_map[key] = disk_key
+        self._put_local(key, positional_arguments, keyword_arguments, result)
+
+    # Same as put(), but only for this cache (e.g. for results demoted from an upper tier, that were persisted and published when computed)
+    def _put_local(self, key: str, positional_arguments: List, keyword_arguments: Dict, result):
+        if self.observers and key in self.results_map:
+            self._notify_evict(key, EvictCause.REPLACED)
+        self._insert_warm_result(key, positional_arguments, keyword_arguments, result)
+        self._assert_expire_max_size(key)
+
+    # Stops all refreshes, no new refresh will be started after this call
+    # Waits up to timeout_s for already running refreshes to finish, returns True if all of them did
+    # Trace recorder of the cache is closed too, accesses made after that are not recorded
+    def close(self, timeout_s: float = 5.0) -> bool:
         self.terminated = True
+        if self.trace_recorder is not None:
+            self.trace_recorder.close()
+        if self.invalidation_bus is not None:
+            self.invalidation_bus.detach(self, self.invalidation_channel)
+
+        # Cancel scheduled refresh
+        timer = self._refresh_timer
+        if timer is not None:
+            timer.cancel()
+
+        # Join refresh threads within the deadline
+        deadline = time.time() + timeout_s
+        with self._refresh_threads_lock:
+            threads = list(self._refresh_threads)
+        if timer is not None:
+            threads.append(timer)
+        for thread in threads:
+            if thread is threading.current_thread():
+                continue
+            thread.join(max(0.0, deadline - time.time()))
+        with self._refresh_threads_lock:
+            self._refresh_threads = {thread for thread in self._refresh_threads if thread.is_alive()}
+        return not any(thread.is_alive() for thread in threads if thread is not threading.current_thread())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    # Use this only if refresh independent is selected, same as close() but doesn't wait for a running refresh
+    def terminate(self):
+        self.close(timeout_s=0)
+
+    # Evicts the given fraction of stored keys (chosen by size expire mode), and keeps max allowed size that low until restore_capacity()
+    # Meant to be called under memory pressure (see MemoryWatchdog), returns the number of dropped keys
+    def shrink(self, fraction: float) -> int:
+        number_of_keys = len(self.results_map)
+        self._pressure_max_size = max(1, int(min(number_of_keys, self.max_allowed_size) * (1.0 - fraction)))
+        self._set_max_allowed_size(self._configured_max_allowed_size)
+        self._assert_expire_max_size(None, EvictCause.MEMORY_PRESSURE)
+        return max(0, number_of_keys - len(self.results_map))
+
+    def restore_capacity(self):
+        self._pressure_max_size = None
+        self._set_max_allowed_size(self._configured_max_allowed_size)
+
+    # Target size is the configured one (or the one picked by adaptive sizing), capped while under memory pressure
+    def _set_max_allowed_size(self, target_size: int):
+        self._configured_max_allowed_size = target_size
+        if self._pressure_max_size is not None:
+            target_size = min(target_size, self._pressure_max_size)
+        self.max_allowed_size = target_size
 
     def is_cached(self, positional_arguments: List, keyword_arguments: Dict = {}) -> bool:
         key = self._build_key(positional_arguments, keyword_arguments)
@@ -176,9 +913,92 @@ class Cache:
 
 
 
+    # Invalidation methods, each of them returns the number of dropped keys
+    #-------------------------------------------------------------------------------------------------------------------
+    def invalidate(self, positional_arguments: List, keyword_arguments: Dict = {}) -> int:
+        key = self._build_key(positional_arguments, keyword_arguments)
+        self._publish_invalidation([key])
+        if self.disk_cache is not None and key not in self.disk_keys_map:
+            self.disk_cache.discard(self.disk_cache.build_key(positional_arguments, keyword_arguments))
+        return self._invalidate_keys([key])
+
+    # Same keyword arguments are used with each of the positional arguments
+    def invalidate_many(self, positional_arguments_list: Iterable[List], keyword_arguments: Dict = {}) -> int:
+        positional_arguments_list = list(positional_arguments_list)
+        keys = [self._build_key(positional_arguments, keyword_arguments) for positional_arguments in positional_arguments_list]
+        self._publish_invalidation(keys)
+        if self.disk_cache is not None:
+            for key, positional_arguments in zip(keys, positional_arguments_list):
+                if key not in self.disk_keys_map:
+                    self.disk_cache.discard(self.disk_cache.build_key(positional_arguments, keyword_arguments))
+        return self._invalidate_keys(keys)
+
+    def invalidate_by_tag(self, tag) -> int:
+        with self.tags_map_lock:
+            keys = list(self.tags_map.get(tag, ()))
+        self._publish_invalidation(keys)
+        return self._invalidate_keys(keys)
+
+    # Predicate is called as predicate(positional_arguments, keyword_arguments) for each stored key, so this one is linear in cache size
+    # Needs arguments to be retained, keys whose arguments are gone (WEAK or COMPACT retention) are skipped
+    def invalidate_where(self, predicate: Callable[[List, Dict], bool]) -> int:
+        if self._arguments_policy.dump is None:
+            raise RuntimeError('invalidate_where() needs arguments of each key, but arguments retention is NONE')
+        with self.arguments_map_lock:
+            keys = list(self.arguments_map)
+        keys_to_invalidate = []
+        for key in keys:
+            arguments = self._load_arguments(key)
+            if arguments is not None and predicate(arguments[0], arguments[1]):
+                keys_to_invalidate.append(key)
+        self._publish_invalidation(keys_to_invalidate)
+        return self._invalidate_keys(keys_to_invalidate)
+
+    def clear(self) -> int:
+        if self.invalidation_bus is not None:
+            self.invalidation_bus.publish(self.invalidation_channel, None)
+        if self.disk_cache is not None:
+            self.disk_cache.clear()
+        with self.results_map_lock:
+            number_of_keys = len(self.results_map)
+            self._reset_maps()
+        if self._debug_enabled():
+            logger.debug('Cache.clear(): Dropped %d keys', number_of_keys)
+        return number_of_keys
+
+    # Invalidated keys are dropped from the disk tier too, keys that are not in memory are only known to it by their arguments (see invalidate())
+    def _invalidate_keys(self, keys: List[str], cause: str = EvictCause.INVALIDATED) -> int:
+        if self.disk_cache is not None and cause == EvictCause.INVALIDATED:
+            for key in keys:
+                self.disk_cache.discard(self.disk_keys_map.get(key))
+        number_of_keys = 0
+        with self.results_map_lock:
+            for key in keys:
+                if self._discard_from_maps(key, cause):
+                    number_of_keys = number_of_keys + 1
+                    if self._debug_enabled():
+                        logger.debug('Cache._invalidate_keys(): Dropped %s', key)
+        return number_of_keys
+
+    def _publish_invalidation(self, keys: List[str]):
+        if self.invalidation_bus is not None and keys:
+            self.invalidation_bus.publish(self.invalidation_channel, keys)
+
+    # Invalidation received from another process, keys computed after it was sent are newer than the invalidation and are kept
+    # Keys are None if all keys were invalidated
+    def _invalidate_keys_computed_before(self, keys: List[str], version_ns: int) -> int:
+        with self.last_computed_map_lock:
+            if keys is None:
+                keys = list(self.last_computed_map)
+            keys = [key for key in keys if self.last_computed_map.get(key, version_ns) < version_ns]
+        return self._invalidate_keys(keys)
+    #-------------------------------------------------------------------------------------------------------------------
+
+
+
     # Expire methods
     #-------------------------------------------------------------------------------------------------------------------
-    def _assert_expire_max_size(self, last_accessed_key: str):
+    def _assert_expire_max_size(self, last_accessed_key: str, cause: str = EvictCause.SIZE):
         while len(self.results_map) > self.max_allowed_size:
             with self.results_map_lock and self.arguments_map_lock and self.last_computed_map_lock and self.last_accessed_map_lock and self.access_counter_map_lock:
                 key = self._find_key_to_remove_for_expire_max_size(last_accessed_key)
@@ -187,32 +1007,23 @@ class Cache:
                 while not dropped and number_of_tries < 10:
                     # Try to drop the key, if a key error occurs (key is missing in one of the maps) - we need to try another key
                     try:
-                        self.results_map.pop(key)
-                        self.arguments_map.pop(key)
-                        self.last_computed_map.pop(key)
-                        self.last_accessed_map.pop(key)
-                        self.access_counter_map.pop(key)
+                        self._remove_from_maps(key, cause)
                         dropped = True
                     except KeyError as keyError:
-                        print('Cache._assert_expire_max_size(): WARNING! Failed to drop key ' + str(key) + ', will retry with new one')
-                        print('Cache._assert_expire_max_size(): WARNING! stacktrace:', traceback.format_exc())
+                        self._failed_drop_warning.warning('Cache._assert_expire_max_size(): Failed to drop key %s, will retry with new one', key, exc_info=True)
                         key = self._find_key_to_remove_for_expire_max_size(last_accessed_key)
                         dropped = False
                         number_of_tries = number_of_tries + 1
 
                 # If we failed each drop - clean the cache completely
                 if not dropped and number_of_tries >= 10:
-                    print('Cache._assert_expire_max_size(): WARNING! Cache has tried to drop keys for 10 times, yet each try failed. Will clean the cache completely now.')
-                    self.results_map = {}
-                    self.arguments_map = {}
-                    self.last_computed_map = {}
-                    self.last_accessed_map = {}
-                    self.access_counter_map = {}
+                    self._failed_drops_reset_warning.warning('Cache._assert_expire_max_size(): Cache has tried to drop keys for 10 times, yet each try failed. Will clean the cache completely now.')
+                    self._reset_maps()
 
                 # If drop was successful
                 else:
-                    if self.debug:
-                        print('Cache._assert_expire_max_size(): Dropped ' + str(key))
+                    if self._debug_enabled():
+                        logger.debug('Cache._assert_expire_max_size(): Dropped %s', key)
 
     def _assert_expire_by_computed_duration(self):
         # If expire by computed is enabled
@@ -223,19 +1034,15 @@ class Cache:
 
                 # Calculate how long ago was this key computed
                 last_computed_timestamp_ns = self.last_computed_map[key]
-                now_timestamp_ns = time.time_ns()
+                now_timestamp_ns = self.clock.time_ns()
                 delta_ns = now_timestamp_ns - last_computed_timestamp_ns
 
-                # If longer than our expire duration - drop this key
-                if delta_ns > self.expire_by_computed_duration_ns:
+                # If longer than our expire duration (with jitter) - drop this key
+                if delta_ns > self._jittered_duration_ns(key, self.expire_by_computed_duration_ns):
                     with self.results_map_lock and self.arguments_map_lock and self.last_accessed_map_lock and self.access_counter_map_lock:
-                        self.results_map.pop(key)
-                        self.arguments_map.pop(key)
-                        self.last_computed_map.pop(key)
-                        self.last_accessed_map.pop(key)
-                        self.access_counter_map.pop(key)
-                        if self.debug:
-                            print('Cache._assert_expire_by_computed_duration(): Dropped ' + str(key))
+                        self._remove_from_maps(key, EvictCause.EXPIRED_BY_COMPUTED)
+                        if self._debug_enabled():
+                            logger.debug('Cache._assert_expire_by_computed_duration(): Dropped %s', key)
 
     def _assert_expire_by_access_duration(self):
         # If expire by access is enabled
@@ -246,19 +1053,15 @@ class Cache:
 
                 # Calculate how long ago was this key accessed
                 last_accessed_timestamp_ns = self.last_accessed_map[key]
-                now_timestamp_ns = time.time_ns()
+                now_timestamp_ns = self.clock.time_ns()
                 delta_ns = now_timestamp_ns - last_accessed_timestamp_ns
 
                 # If longer than our expire duration - drop this key
                 if delta_ns > self.expire_by_access_duration_ns:
                     with self.results_map_lock and self.arguments_map_lock and self.last_computed_map_lock and self.access_counter_map_lock:
-                        self.results_map.pop(key)
-                        self.arguments_map.pop(key)
-                        self.last_computed_map.pop(key)
-                        self.last_accessed_map.pop(key)
-                        self.access_counter_map.pop(key)
-                        if self.debug:
-                            print('Cache._assert_expire_by_access_duration(): Dropped ' + str(key))
+                        self._remove_from_maps(key, EvictCause.EXPIRED_BY_ACCESS)
+                        if self._debug_enabled():
+                            logger.debug('Cache._assert_expire_by_access_duration(): Dropped %s', key)
     #-------------------------------------------------------------------------------------------------------------------
 
 
@@ -266,24 +1069,47 @@ class Cache:
     # Methods that find keys for expire policies
     #-------------------------------------------------------------------------------------------------------------------
     def _find_key_to_remove_for_expire_max_size(self, last_accessed_key: str) -> str:
-        if self.size_expire_mode == ExpireMode.ACCESSED_TIME_BASED:
-            return self._find_key_first_accessed()
-        elif self.size_expire_mode == ExpireMode.COMPUTED_TIME_BASED:
-            return self._find_key_first_computed()
-        elif self.size_expire_mode == ExpireMode.ACCESS_COUNT_BASED:
-            return self._find_key_least_accessed(last_accessed_key)
-        else:
-            raise RuntimeError('Size expire mode ' + str(self.size_expire_mode) + ' is not implemented yet')
+        if self.size_expire_samples > 0:
+            key = self._find_key_sampled(last_accessed_key)
+            if key is not _MISSING:
+                return key
+        scores_map = self._size_expire_policy.scores_map(self)
+        return _find_key_with_lowest_score(scores_map, last_accessed_key if self._size_expire_policy.spare_last_accessed else None)
 
     def _find_key_first_accessed(self):
-        return min(self.last_accessed_map.items(), key=operator.itemgetter(1))[0]
+        return _find_key_with_lowest_score(self.last_accessed_map)
 
     def _find_key_first_computed(self):
-        return min(self.last_computed_map.items(), key=operator.itemgetter(1))[0]
-
-    def _find_key_least_accessed(self, last_accessed_key: str):
-        key_value_pairs = [p for p in self.access_counter_map.items() if p[0] != last_accessed_key]
-        return min(key_value_pairs, key=operator.itemgetter(1))[0]
+        return _find_key_with_lowest_score(self.last_computed_map)
+
+    # Sampling list keeps dropped keys until it gets too large, it is rebuilt on insert, so it stays bounded even if nothing is evicted
+    def _add_sampling_key(self, key: str):
+        self._sampling_keys.append(key)
+        if len(self._sampling_keys) > 2 * len(self.results_map) + 16:
+            self._sampling_keys = list(self.results_map)
+
+    # Approximate version of the above (Redis style), compares a few random keys instead of all of them
+    # Best candidates seen so far are kept in a small eviction pool between rounds, their scores are re-checked each round
+    def _find_key_sampled(self, last_accessed_key: str):
+        scores_map = self._size_expire_policy.scores_map(self)
+
+        sampling_keys = self._sampling_keys
+
+        candidate_keys = [key for score, key in self._eviction_pool]
+        if sampling_keys:
+            candidate_keys.extend(sampling_keys[self._random.randrange(len(sampling_keys))] for i in range(0, self.size_expire_samples))
+
+        candidates = {}
+        for key in candidate_keys:
+            score = scores_map.get(key)
+            if score is not None and key != last_accessed_key and key in self.results_map:
+                candidates[key] = score
+        if not candidates:
+            return _MISSING
+
+        pool = sorted(((score, key) for key, score in candidates.items()), key=operator.itemgetter(0))
+        self._eviction_pool = pool[1:EVICTION_POOL_SIZE + 1]
+        return pool[0][1]
     #-------------------------------------------------------------------------------------------------------------------
 
 
@@ -301,60 +1127,139 @@ class Cache:
                 for key in self.results_map:
                     keys.append(key)
 
-            # Iterate over keys
+            # Find keys computed longer ago than our refresh duration
+            keys_to_update = []
             for key in keys:
-                # Calculate how long ago was this key computed
-                last_computed_timestamp_ns = self.last_computed_map[key]
-                now_timestamp_ns = time.time_ns()
-                delta_ns = now_timestamp_ns - last_computed_timestamp_ns
-
-                # If longer than our refresh duration - update this key
-                if delta_ns > self.refresh_duration_ns:
+                # Key might have been dropped in the meantime
+                last_computed_timestamp_ns = self.last_computed_map.get(key)
+                if last_computed_timestamp_ns is None:
+                    continue
+                if self._is_due(key, last_computed_timestamp_ns, self.refresh_duration_ns, self.clock.time_ns()):
+                    keys_to_update.append(key)
+
+            # With an executor - submit all computations at once, so they can run in parallel
+            # Each submitted future is collected on its own (even if submitting the others failed), so results moved through shared memory
+            # are always released, a key whose refresh failed keeps its old result
+            if self.executor is not None:
+                futures = []
+                try:
+                    for key in keys_to_update:
+                        arguments = self._load_arguments(key)
+                        if arguments is None:
+                            self._drop_unrefreshable_key(key)
+                            continue
+                        positional_arguments, keyword_arguments = arguments
+                        futures.append((key, time.perf_counter_ns(), self._submit_computation(self.executor, positional_arguments, keyword_arguments)))
+                finally:
+                    for key, submitted_ns, future in futures:
+                        try:
+                            self._collect_refreshed_result(key, submitted_ns, future)
+                        except Exception:
+                            self._failed_refresh_warning.warning('Cache._refresh(): Failed to refresh key %s, its old result is kept', key, exc_info=True)
+
+            # Otherwise update keys one by one
+            else:
+                for key in keys_to_update:
                     t3 = time.time()
-                    positional_arguments, keyword_arguments = self.arguments_map[key]
+                    arguments = self._load_arguments(key)
+                    if arguments is None:
+                        self._drop_unrefreshable_key(key)
+                        continue
+                    positional_arguments, keyword_arguments = arguments
                     computed_result = self._compute_result(positional_arguments, keyword_arguments)
-                    self._update_in_result_map(key, computed_result)
+                    self._update_in_result_map(key, self._result_preparer(self, computed_result))
                     self._update_in_last_computed_map(key)
                     t4 = time.time()
-                    if self.debug:
-                        print('Cache._refresh(): Update of result for positional_arguments=' + str(positional_arguments) + ', keyword_arguments=' + str(keyword_arguments) + ' took ' + str(round(t4 - t3, 2)) + ' seconds')
+                    if self.early_refresh_enabled:
+                        self.compute_duration_map[key] = int((t4 - t3) * 1000000000)
+                    if self.observers:
+                        self._notify_refresh(key, int((t4 - t3) * 1000000000))
+                    if self._debug_enabled():
+                        logger.debug('Cache._refresh(): Update of result for positional_arguments=%s, keyword_arguments=%s took %.2f seconds', positional_arguments, keyword_arguments, t4 - t3)
 
         # If not - raise error
         else:
             raise RuntimeError('Refresh was called, but refresh is not enabled!')
 
         t2 = time.time()
-        if self.debug:
-            print('Cache._refresh(): Complete refresh took ' + str(round(t2 - t1, 2)) + ' seconds')
+        if self._debug_enabled():
+            logger.debug('Cache._refresh(): Complete refresh took %.2f seconds', t2 - t1)
+
+    def _collect_refreshed_result(self, key: str, submitted_ns: int, future: Future):
+        computed_result = load_result(future.result())
+        self._update_in_result_map(key, self._result_preparer(self, computed_result))
+        self._update_in_last_computed_map(key)
+        if self.early_refresh_enabled:
+            self.compute_duration_map[key] = time.perf_counter_ns() - submitted_ns
+        if self.observers:
+            self._notify_refresh(key, time.perf_counter_ns() - submitted_ns)
+        if self._debug_enabled():
+            logger.debug('Cache._refresh(): Updated result for key %s', key)
+
+    # Key is due if it was computed longer ago than its duration (shortened by jitter)
+    # With early refresh, a random extra age is added: compute duration * beta * -ln(uniform random), which is almost always small,
+    # but occasionally large enough to make a key due before the others (XFetch)
+    def _is_due(self, key: str, last_computed_timestamp_ns: int, duration_ns: int, now_timestamp_ns: int) -> bool:
+        delta_ns = now_timestamp_ns - last_computed_timestamp_ns
+        if self.early_refresh_enabled:
+            compute_duration_ns = self.compute_duration_map.get(key, 0)
+            delta_ns = delta_ns + compute_duration_ns * self.early_refresh_beta * -math.log(1.0 - self._random.random())
+        return delta_ns > self._jittered_duration_ns(key, duration_ns)
+
+    def _is_due_for_early_expire(self, key: str) -> bool:
+        last_computed_timestamp_ns = self.last_computed_map.get(key)
+        if last_computed_timestamp_ns is None:
+            return False
+        return self._is_due(key, last_computed_timestamp_ns, self.expire_by_computed_duration_ns, self.clock.time_ns())
+
+    def _jittered_duration_ns(self, key: str, duration_ns: int) -> int:
+        if self.ttl_jitter_ratio <= 0:
+            return duration_ns
+        if isinstance(key, bytes) and len(key) >= 8:
+            key_hash = int.from_bytes(key[:8], 'little')
+        else:
+            key_hash = hash_key(key)
+        return duration_ns - int(duration_ns * self.ttl_jitter_ratio * key_hash / 2 ** 64)
+
+    # Key was dropped in the meantime, or its arguments are gone, so it can't be refreshed any more
+    def _drop_unrefreshable_key(self, key: str):
+        if self._invalidate_keys([key], EvictCause.ARGUMENTS_GONE) > 0 and self._debug_enabled():
+            logger.debug('Cache._refresh(): Dropped key %s, its arguments are no longer available', key)
 
     def _refresh_coupled(self):
-        if self.debug:
-            print('Cache._refresh_coupled(): Started')
+        if self.terminated:
+            return
 
-        if self.refresh_enabled:
-            if self.refresh_mode == RefreshMode.COUPLED:
-                threading.Thread(target=self._refresh, args=[]).start()
-            else:
-                raise RuntimeError('Refresh coupled was called, but refresh mode is ' + str(self.refresh_mode))
+        if self._debug_enabled():
+            logger.debug('Cache._refresh_coupled(): Started')
+
+        if self._refresh_coupled_enabled:
+            thread = self.clock.call_soon(self._refresh)
+            with self._refresh_threads_lock:
+                self._refresh_threads = {t for t in self._refresh_threads if t.is_alive()}
+                if thread.is_alive():
+                    self._refresh_threads.add(thread)
         else:
-            raise RuntimeError('Refresh coupled was called, but refresh is not enabled!')
+            raise RuntimeError('Refresh coupled was called, but refresh is not enabled in mode COUPLED')
 
-        if self.debug:
-            print('Cache._refresh_coupled(): Ended')
+        if self._debug_enabled():
+            logger.debug('Cache._refresh_coupled(): Ended')
 
     def _refresh_independent(self):
         if self.terminated:
-            print('Cache._refresh_independent(): Won\'t run because cache refreshes were terminated')
+            logger.info('Cache._refresh_independent(): Won\'t run because cache refreshes were terminated')
             return
 
-        if self.debug:
-            print('Cache._refresh_independent(): Started')
+        if self._debug_enabled():
+            logger.debug('Cache._refresh_independent(): Started')
 
         if self.refresh_enabled:
             if self.refresh_mode == RefreshMode.INDEPENDENT:
                 if self.refresh_period_s >= 1:
                     self._refresh()
-                    threading.Timer(self.refresh_period_s, self._refresh_independent).start()
+                    # Timer only keeps a weak reference, so the cache (and its owner) can still be garbage collected
+                    if not self.terminated:
+                        self._refresh_timer = self.clock.call_later(self.refresh_period_s, _refresh_independent_by_reference, weakref.ref(self))
                 else:
                     raise RuntimeError('Refresh independent was called, but refresh period is ' + str(self.refresh_period_s))
             else:
@@ -362,6 +1267,32 @@ class Cache:
         else:
             raise RuntimeError('Refresh independent was called, but refresh is not enabled!')
 
-        if self.debug:
-            print('Cache._refresh_independent(): Ended')
+        if self._debug_enabled():
+            logger.debug('Cache._refresh_independent(): Ended')
     #-------------------------------------------------------------------------------------------------------------------
+
+
+def _unpickle_cache():
+    return None
+
+
+# Lifecycle helpers
+#-----------------------------------------------------------------------------------------------------------------------
+_live_caches = weakref.WeakSet()
+
+
+def get_live_caches() -> List[Cache]:
+    return list(_live_caches)
+
+
+def _refresh_independent_by_reference(cache_reference: weakref.ref):
+    cache = cache_reference()
+    if cache is not None:
+        cache._refresh_independent()
+
+
+@atexit.register
+def _close_live_caches():
+    for cache in get_live_caches():
+        cache.close(timeout_s=1.0)
+#-----------------------------------------------------------------------------------------------------------------------
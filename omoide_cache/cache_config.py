@@ -0,0 +1,92 @@
+from concurrent.futures import Executor
+from typing import List, Dict, Tuple, Callable, Iterable
+from omoide_cache.cache import ExpireMode, RefreshMode, validate_cache_settings
+from omoide_cache.clock import Clock
+from omoide_cache.compact_storage import ResultStorage
+from omoide_cache.freeze import ResultProtection
+from omoide_cache.arguments_retention import ArgumentsRetention
+from omoide_cache.observers import CacheObserver
+from omoide_cache.fingerprint import Fingerprinter
+from omoide_cache.trace import TraceRecorder
+
+
+# All settings of a Cache except the cached call, checked once when the config is created (see validate_cache_settings)
+# The decorator builds one when it is applied, so wrong settings fail at import of the decorated code, not on the first call or inside a refresh thread
+# Caches are then built from it with Cache.from_config(call_to_execute, config), e.g. one per object for decorated methods
+class CacheConfig:
+    def __init__(self,
+                 max_allowed_size: int = 100, size_expire_mode: str = ExpireMode.ACCESS_COUNT_BASED, size_expire_samples: int = -1,
+                 expire_by_computed_duration_s: int = -1, expire_by_access_duration_s: int = -1,
+                 refresh_duration_s: int = -1, refresh_mode: str = RefreshMode.COUPLED, refresh_period_s: int = -1,
+                 early_refresh_beta: float = -1, ttl_jitter_ratio: float = 0,
+                 adaptive_min_size: int = -1, adaptive_max_size: int = -1, adaptive_memory_budget_bytes: int = -1,
+                 result_storage: str = ResultStorage.OBJECT, compact_bytes_width: int = 32,
+                 result_protection: str = ResultProtection.NONE,
+                 arguments_retention: str = ArgumentsRetention.AUTO,
+                 arguments_dumper: Callable[[List, Dict], object] = None, arguments_loader: Callable[[object], Tuple[List, Dict]] = None,
+                 batch_call_to_execute: Callable[[List[Tuple[List, Dict]]], List] = None, batch_window_ms: float = 5, batch_max_size: int = 100,
+                 stream_max_items: int = -1, stream_spill_after_items: int = -1,
+                 tag_fn: Callable[[List, Dict], Iterable] = None,
+                 observers: List[CacheObserver] = None,
+                 invalidation_bus=None, invalidation_channel: str = None,
+                 disk_cache=None,
+                 fingerprinter: Fingerprinter = None, ignored_positional_arguments: int = 0,
+                 executor: Executor = None,
+                 clock: Clock = None,
+                 trace_recorder: TraceRecorder = None,
+                 debug: bool = False
+                 ):
+        validate_cache_settings(max_allowed_size=max_allowed_size, size_expire_mode=size_expire_mode,
+                                refresh_duration_s=refresh_duration_s, refresh_mode=refresh_mode, refresh_period_s=refresh_period_s,
+                                ttl_jitter_ratio=ttl_jitter_ratio, adaptive_min_size=adaptive_min_size, adaptive_max_size=adaptive_max_size,
+                                result_storage=result_storage, result_protection=result_protection,
+                                arguments_retention=arguments_retention, arguments_dumper=arguments_dumper, arguments_loader=arguments_loader,
+                                batch_call_to_execute=batch_call_to_execute, batch_max_size=batch_max_size)
+
+        # Same names and meaning as the arguments of Cache
+        self.max_allowed_size = max_allowed_size
+        self.size_expire_mode = size_expire_mode
+        self.size_expire_samples = size_expire_samples
+        self.expire_by_computed_duration_s = expire_by_computed_duration_s
+        self.expire_by_access_duration_s = expire_by_access_duration_s
+        self.refresh_duration_s = refresh_duration_s
+        self.refresh_mode = refresh_mode
+        self.refresh_period_s = refresh_period_s
+        self.early_refresh_beta = early_refresh_beta
+        self.ttl_jitter_ratio = ttl_jitter_ratio
+        self.adaptive_min_size = adaptive_min_size
+        self.adaptive_max_size = adaptive_max_size
+        self.adaptive_memory_budget_bytes = adaptive_memory_budget_bytes
+        self.result_storage = result_storage
+        self.compact_bytes_width = compact_bytes_width
+        self.result_protection = result_protection
+        self.arguments_retention = arguments_retention
+        self.arguments_dumper = arguments_dumper
+        self.arguments_loader = arguments_loader
+        self.batch_call_to_execute = batch_call_to_execute
+        self.batch_window_ms = batch_window_ms
+        self.batch_max_size = batch_max_size
+        self.stream_max_items = stream_max_items
+        self.stream_spill_after_items = stream_spill_after_items
+        self.tag_fn = tag_fn
+        self.observers = observers
+        self.invalidation_bus = invalidation_bus
+        self.invalidation_channel = invalidation_channel
+        self.disk_cache = disk_cache
+        self.fingerprinter = fingerprinter
+        self.ignored_positional_arguments = ignored_positional_arguments
+        self.executor = executor
+        self.clock = clock
+        self.trace_recorder = trace_recorder
+        self.debug = debug
+
+    @property
+    def refresh_enabled(self) -> bool:
+        return self.refresh_duration_s > 0
+
+    # Keyword arguments of the Cache constructor
+    def cache_arguments(self) -> Dict:
+        return dict(vars(self))
+
+    def __repr__(self):
+        return 'CacheConfig{' + ', '.join(name + '=' + repr(value) for name, value in vars(self).items()) + '}'
@@ -1,47 +1,187 @@
-import inspect
+import functools
+import threading
+from concurrent.futures import Executor
+from typing import Dict
 from omoide_cache.cache import ExpireMode, RefreshMode, Cache
+from omoide_cache.cache_config import CacheConfig
+from omoide_cache.tiered_cache import TieredCache, TierMode, validate_tier_settings
+from omoide_cache.clock import Clock
+from omoide_cache.compact_storage import ResultStorage
+from omoide_cache.freeze import ResultProtection
+from omoide_cache.arguments_retention import ArgumentsRetention
+from omoide_cache.trace import TraceRecorder
 
 
 # This is a very simple decorator version of the cache. It attached itself to the method, and proxies all requests to the method throught the cache
 # Performance is yet under question, as we rely heavily on reflections to make this all work
 # Basically for each annotated method we create a new cache, and bind it to the method's object instance as a new field
 # Then each call to a method is forwarded into the cache
+# Plain functions (module level or nested in other functions) get a single cache, kept by the decorated function
 
 # All cache creation parameters are kept as decorator arguments, so you can tweak the settings easily
+# They are checked once, when the decorator is applied (see CacheConfig), so wrong settings fail at import instead of on the first call
 
-# THIS WILL CRASH ON FUNCTIONS THAT ARE NOT CLASS METHODS!!!!
+# The cache of a given object can be reached through the decorated method, e.g. "service.method.cache.clear()"
+# Single keys can be dropped with the same arguments as the method call, e.g. "service.method.invalidate(10)"
+# Methods that change the data can keep these caches up to date with @omoide_cache_put and @omoide_cache_evict (see cache_write_decorator.py)
+
+# Batch call gets the arguments of each miss with the object as the first positional argument, e.g. [((service, 1), {}), ((service, 2), {})]
+
+# Set l1_max_allowed_size to put a small L1 tier in front of the cache, the cache of an object is then a TieredCache with the same API
+
+# Each object has its own cache, so the object is left out of its keys, and they are the same in each process (e.g. with an invalidation bus)
+
+# Pass a ProcessPoolExecutor as executor to run CPU-bound methods outside of the GIL, the object that owns the method must be picklable
+
+# Set persist_dir to also keep results on disk between runs (see DiskCache), for pure functions only
+# The object of a method is part of the persisted key, so it needs a fingerprint handler, or its results are not persisted (see DiskCache)
+# Set persist_ignore_self to leave the object out of the persisted key instead, then results on disk are shared by all objects of the class
 
 # TODO, for some weird reason this works only with "@cache_decorator(...)" call, while with no arguments "@cache_decorator" fails
 #  Needs more time and investigation why that happens. If you want to use it without arguments just add "@cache_decorator()", keep empty parantheses
-def omoide_cache(max_allowed_size: int = 100, size_expire_mode: str = ExpireMode.ACCESS_COUNT_BASED,
+def omoide_cache(max_allowed_size: int = 100, size_expire_mode: str = ExpireMode.ACCESS_COUNT_BASED, size_expire_samples: int = -1,
                  expire_by_computed_duration_s: int = -1, expire_by_access_duration_s: int = -1,
                  refresh_duration_s: int = -1, refresh_mode: str = RefreshMode.COUPLED, refresh_period_s: int = -1,
+                 early_refresh_beta: float = -1, ttl_jitter_ratio: float = 0,
+                 adaptive_min_size: int = -1, adaptive_max_size: int = -1, adaptive_memory_budget_bytes: int = -1,
+                 result_storage: str = ResultStorage.OBJECT, compact_bytes_width: int = 32, result_protection: str = ResultProtection.NONE,
+                 arguments_retention: str = ArgumentsRetention.AUTO, arguments_dumper=None, arguments_loader=None,
+                 batch_call_to_execute=None, batch_window_ms: float = 5, batch_max_size: int = 100,
+                 l1_max_allowed_size: int = -1, l1_per_thread: bool = False, tier_mode: str = TierMode.INCLUSIVE, promote_after_accesses: int = 1,
+                 stream_max_items: int = -1, stream_spill_after_items: int = -1,
+                 tag_fn=None,
+                 observers=None,
+                 invalidation_bus=None, invalidation_channel: str = None,
+                 persist_dir: str = None, persist_max_bytes: int = -1, persist_ignore_self: bool = False,
+                 fingerprinter=None,
+                 executor: Executor = None,
+                 clock: Clock = None,
+                 trace_recorder: TraceRecorder = None,
                  debug: bool = False):
     def cache_decorator_inner(function):
-        def wrapper_function(*args, **kwargs):
-            # Find name of current method & object to which it is bound
-            call_arguments = inspect.getcallargs(function, *args, **kwargs)
-            function_name = function.__name__
-            function_object = call_arguments['self']
-
-            # Determine name of the cache
-            cache_field_name = '_cache_of_' + function_name
-
-            # Create new cache if needed
-            if not hasattr(function_object, cache_field_name):
-                cache = Cache(
-                    function,
-                    max_allowed_size=max_allowed_size, size_expire_mode=size_expire_mode,
-                    expire_by_computed_duration_s=expire_by_computed_duration_s, expire_by_access_duration_s=expire_by_access_duration_s,
-                    refresh_duration_s=refresh_duration_s, refresh_mode=refresh_mode, refresh_period_s=refresh_period_s,
-                    debug=debug
-                )
-
-                setattr(function_object, cache_field_name, cache)
-
-            # Get cache, and run it, then return the result
-            cache = getattr(function_object, cache_field_name)
-            result = cache.get(args, kwargs)
-            return result
-        return wrapper_function
+        is_method = _is_method(function)
+        disk_cache = None
+        if persist_dir is not None:
+            # Imported here, so programs that don't persist results don't pay for importing it
+            from omoide_cache.disk_cache import DiskCache
+            disk_cache = DiskCache(persist_dir, function, max_bytes=persist_max_bytes, fingerprinter=fingerprinter, ignored_positional_arguments=1 if is_method and persist_ignore_self else 0)
+        config = CacheConfig(
+            max_allowed_size=max_allowed_size, size_expire_mode=size_expire_mode, size_expire_samples=size_expire_samples,
+            expire_by_computed_duration_s=expire_by_computed_duration_s, expire_by_access_duration_s=expire_by_access_duration_s,
+            refresh_duration_s=refresh_duration_s, refresh_mode=refresh_mode, refresh_period_s=refresh_period_s,
+            early_refresh_beta=early_refresh_beta, ttl_jitter_ratio=ttl_jitter_ratio,
+            adaptive_min_size=adaptive_min_size, adaptive_max_size=adaptive_max_size, adaptive_memory_budget_bytes=adaptive_memory_budget_bytes,
+            result_storage=result_storage, compact_bytes_width=compact_bytes_width, result_protection=result_protection,
+            arguments_retention=arguments_retention, arguments_dumper=arguments_dumper, arguments_loader=arguments_loader,
+            batch_call_to_execute=batch_call_to_execute, batch_window_ms=batch_window_ms, batch_max_size=batch_max_size,
+            stream_max_items=stream_max_items, stream_spill_after_items=stream_spill_after_items,
+            tag_fn=tag_fn,
+            observers=observers,
+            invalidation_bus=invalidation_bus, invalidation_channel=invalidation_channel,
+            disk_cache=disk_cache,
+            fingerprinter=fingerprinter, ignored_positional_arguments=1 if is_method else 0,
+            executor=executor,
+            clock=clock,
+            trace_recorder=trace_recorder,
+            debug=debug
+        )
+        tier_arguments = None
+        if l1_max_allowed_size > 0:
+            validate_tier_settings(l1_max_allowed_size=l1_max_allowed_size, tier_mode=tier_mode, refresh_enabled=config.refresh_enabled)
+            tier_arguments = dict(l1_max_allowed_size=l1_max_allowed_size, l1_per_thread=l1_per_thread, tier_mode=tier_mode, promote_after_accesses=promote_after_accesses)
+        if not is_method:
+            return CachedFunction(function, config, tier_arguments)
+        return CachedMethod(function, config, tier_arguments)
     return cache_decorator_inner
+
+
+# Functions defined in a class body have the class name before their own in qualified name, e.g. "ExampleService.method"
+def _is_method(function) -> bool:
+    qualified_name = getattr(function, '__qualname__', '').split('.')
+    return len(qualified_name) > 1 and qualified_name[-2] != '<locals>'
+
+
+def _create_cache(function, config: CacheConfig, tier_arguments: Dict):
+    cache = Cache.from_config(function, config)
+    if tier_arguments is not None:
+        cache = TieredCache(cache, **tier_arguments)
+    return cache
+
+
+# Replaces a decorated plain function, e.g. "load_dataset.cache.clear()" or "load_dataset.invalidate('train')"
+class CachedFunction:
+    def __init__(self, function, config: CacheConfig, tier_arguments: Dict = None):
+        self.function = function
+        self.config = config
+        self.tier_arguments = tier_arguments
+        self._cache = None
+        self._cache_lock = threading.Lock()
+        functools.update_wrapper(self, function)
+
+    def __call__(self, *args, **kwargs):
+        return self.cache.get(args, kwargs)
+
+    @property
+    def cache(self) -> Cache:
+        if self._cache is None:
+            with self._cache_lock:
+                if self._cache is None:
+                    self._cache = _create_cache(self.function, self.config, self.tier_arguments)
+        return self._cache
+
+    def invalidate(self, *args, **kwargs) -> int:
+        return self.cache.invalidate(args, kwargs)
+
+    def put(self, result, *args, **kwargs):
+        self.cache.put(args, kwargs, result)
+
+
+# Descriptor that replaces the decorated method in the class, every attribute access on an object returns a bound version of it
+class CachedMethod:
+    def __init__(self, function, config: CacheConfig, tier_arguments: Dict = None):
+        self.function = function
+        self.config = config
+        self.tier_arguments = tier_arguments
+        self.cache_field_name = '_cache_of_' + function.__name__
+        functools.update_wrapper(self, function)
+
+    def __get__(self, function_object, owner=None):
+        if function_object is None:
+            return self
+        return BoundCachedMethod(self, function_object)
+
+    # Called when the method is accessed through the class, e.g. "ExampleService.method(service, 10)"
+    def __call__(self, function_object, *args, **kwargs):
+        return BoundCachedMethod(self, function_object)(*args, **kwargs)
+
+    def get_cache(self, function_object) -> Cache:
+        # Create new cache if needed
+        cache = getattr(function_object, self.cache_field_name, None)
+        if cache is None:
+            cache = _create_cache(self.function, self.config, self.tier_arguments)
+            setattr(function_object, self.cache_field_name, cache)
+        return cache
+
+
+class BoundCachedMethod:
+    __slots__ = ('cached_method', 'function_object')
+
+    def __init__(self, cached_method: CachedMethod, function_object):
+        self.cached_method = cached_method
+        self.function_object = function_object
+
+    def __call__(self, *args, **kwargs):
+        # Get cache, and run it, then return the result
+        cache = self.cached_method.get_cache(self.function_object)
+        return cache.get((self.function_object,) + args, kwargs)
+
+    @property
+    def cache(self) -> Cache:
+        return self.cached_method.get_cache(self.function_object)
+
+    def invalidate(self, *args, **kwargs) -> int:
+        return self.cache.invalidate((self.function_object,) + args, kwargs)
+
+    # Stores the result as if the method was called with these arguments, e.g. "service.method.put(100, 10)"
+    def put(self, result, *args, **kwargs):
+        self.cache.put((self.function_object,) + args, kwargs, result)
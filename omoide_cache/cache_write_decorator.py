@@ -0,0 +1,66 @@
+import functools
+from typing import Callable
+from omoide_cache.cache_decorator import _is_method
+
+
+# Decorators for methods that change data, so the read cache of that data stays up to date instead of serving stale results until they expire
+# Target is the read method, given by its name for methods of the same class (e.g. 'get_user'), or the decorated function itself
+# Arguments of the read method are built by arguments(*args, **kwargs), called with the arguments of the decorated method (without the object),
+# by default the read method is assumed to take the same arguments
+# Caches are only updated once the decorated method returns, nothing changes if it raises
+
+# Example:
+#     @omoide_cache()
+#     def get_user(self, user_id: int) -> User: ...
+#
+#     @omoide_cache_put('get_user', arguments=lambda user: [user.user_id])
+#     def save_user(self, user: User) -> User: ...
+#
+#     @omoide_cache_evict('get_user')
+#     def delete_user(self, user_id: int): ...
+
+
+def _resolve_target(target, is_method: bool, args: tuple):
+    if isinstance(target, str):
+        if not is_method:
+            raise RuntimeError('Target ' + target + ' is given by name, this only works for methods of the same class')
+        return getattr(args[0], target), args[1:]
+    return target, args[1:] if is_method else args
+
+
+# Stores the return value of the decorated method as the result of the read method
+def omoide_cache_put(target, arguments: Callable = None):
+    def cache_put_decorator_inner(function):
+        is_method = _is_method(function)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            result = function(*args, **kwargs)
+            read_method, own_args = _resolve_target(target, is_method, args)
+            if arguments is None:
+                read_method.put(result, *own_args, **kwargs)
+            else:
+                read_method.put(result, *arguments(*own_args, **kwargs))
+            return result
+        return wrapper
+    return cache_put_decorator_inner
+
+
+# Drops the matching result of the read method, or all of its results if all_entries is set
+def omoide_cache_evict(target, arguments: Callable = None, all_entries: bool = False):
+    def cache_evict_decorator_inner(function):
+        is_method = _is_method(function)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            result = function(*args, **kwargs)
+            read_method, own_args = _resolve_target(target, is_method, args)
+            if all_entries:
+                read_method.cache.clear()
+            elif arguments is None:
+                read_method.invalidate(*own_args, **kwargs)
+            else:
+                read_method.invalidate(*arguments(*own_args, **kwargs))
+            return result
+        return wrapper
+    return cache_evict_decorator_inner
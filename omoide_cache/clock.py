@@ -0,0 +1,107 @@
+import time
+import heapq
+import itertools
+import threading
+
+
+# Source of time and scheduler for the background work of a cache
+# Cache uses it for all expiry and refresh math, for the periodic independent refresh and for coupled refresh threads
+class Clock:
+    def time_ns(self) -> int:
+        raise NotImplementedError()
+
+    # Runs callback(*args) once after delay_s seconds, returns a handle with cancel(), join() and is_alive()
+    def call_later(self, delay_s: float, callback, *args):
+        raise NotImplementedError()
+
+    # Runs callback(*args) in the background as soon as possible, returns a handle with join() and is_alive()
+    def call_soon(self, callback, *args):
+        raise NotImplementedError()
+
+
+# Default clock, monotonic time is not affected by NTP adjustments of the system time
+# Background work is done in daemon threads, so it never holds up interpreter exit
+class MonotonicClock(Clock):
+    def time_ns(self) -> int:
+        return time.monotonic_ns()
+
+    def call_later(self, delay_s: float, callback, *args):
+        timer = threading.Timer(delay_s, callback, args=args)
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    def call_soon(self, callback, *args):
+        thread = threading.Thread(target=callback, args=args, daemon=True)
+        thread.start()
+        return thread
+
+
+# Deterministic clock for tests and benchmarks, time moves only when advance() is called
+# Background work runs synchronously: call_soon() callbacks run right away, call_later() callbacks run inside advance()
+class ManualClock(Clock):
+    def __init__(self, start_ns: int = 0):
+        self._now_ns = start_ns
+        self._scheduled = []                            # Heap of (due timestamp in nano-seconds, sequence number, ManualScheduledCall)
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    def time_ns(self) -> int:
+        return self._now_ns
+
+    def call_later(self, delay_s: float, callback, *args):
+        scheduled_call = ManualScheduledCall(callback, args)
+        with self._lock:
+            heapq.heappush(self._scheduled, (self._now_ns + int(delay_s * 1000000000), next(self._sequence), scheduled_call))
+        return scheduled_call
+
+    def call_soon(self, callback, *args):
+        scheduled_call = ManualScheduledCall(callback, args)
+        scheduled_call.run()
+        return scheduled_call
+
+    # Moves time forward, running every callback that becomes due on the way (in order of their due time)
+    def advance(self, seconds: float):
+        target_ns = self._now_ns + int(seconds * 1000000000)
+        while True:
+            with self._lock:
+                if not self._scheduled or self._scheduled[0][0] > target_ns:
+                    self._now_ns = target_ns
+                    return
+                due_ns, sequence, scheduled_call = heapq.heappop(self._scheduled)
+                self._now_ns = max(self._now_ns, due_ns)
+            scheduled_call.run()
+
+    def number_of_scheduled_calls(self) -> int:
+        with self._lock:
+            return len([entry for entry in self._scheduled if entry[2].is_alive()])
+
+
+class ManualScheduledCall:
+    daemon = True
+
+    def __init__(self, callback, args):
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+        self.finished = False
+
+    def run(self):
+        if not self.cancelled and not self.finished:
+            try:
+                self.callback(*self.args)
+            finally:
+                self.finished = True
+
+    def cancel(self):
+        self.cancelled = True
+
+    def join(self, timeout: float = None):
+        pass
+
+    def is_alive(self) -> bool:
+        return not self.cancelled and not self.finished
+
+
+# Shared default instance
+MONOTONIC_CLOCK = MonotonicClock()
@@ -0,0 +1,286 @@
+import threading
+import itertools
+from array import array
+from collections.abc import MutableMapping
+from omoide_cache.fingerprint import DIGEST_SIZE
+
+
+# Compact storage of fixed type results and their metadata
+# Instead of a boxed result object plus an entry in each metadata dict, every key gets a slot number,
+# and result, computed / accessed timestamps and access counter are kept in typed array columns at that slot
+# Slots of dropped keys go to a free list and are reused by next inserts
+# Keys are fixed size digests, they are packed in a buffer at their slot too, and found through an open addressed index
+# of slot numbers (linear probing), so an entry costs a few tens of bytes instead of a dict entry plus a bytes object per map
+
+
+class ResultStorage:
+    OBJECT = 'OBJECT'                                   # Results are kept as is, in a dict (default)
+    FLOAT = 'FLOAT'                                     # Results are floats, kept as 64 bit doubles
+    INT = 'INT'                                         # Results are ints that fit in signed 64 bits
+    BYTES = 'BYTES'                                     # Results are short bytes, kept in a fixed width buffer (longer ones are kept aside)
+
+
+# Typecodes of the result columns, BYTES results are kept in a fixed width buffer
+RESULT_TYPECODES = {
+    ResultStorage.FLOAT: 'd',
+    ResultStorage.INT: 'q',
+}
+
+# Index positions hold slot + 1, or one of these
+_EMPTY = 0
+_DELETED = -1
+_MIN_INDEX_SIZE = 8
+
+
+# Digests are uniformly distributed, so their first bytes are as good as any hash
+def _hash(key) -> int:
+    return int.from_bytes(key[:8], 'little')
+
+
+class CompactResultMap(MutableMapping):
+    def __init__(self, result_storage: str, bytes_width: int = 32, key_width: int = DIGEST_SIZE):
+        self.result_storage = result_storage
+        self.key_width = key_width
+        self.keys_buffer = bytearray()                  # key_width bytes per slot
+        self.live = bytearray()                         # 1 per slot holding a key, 0 per free one
+        self.inserted = array('q')                      # Insert sequence number per slot
+        self.insert_counter = 0
+        self.index = array('i', bytes(4 * _MIN_INDEX_SIZE))
+        self.index_used = 0                             # Positions that aren't empty, including deleted ones
+        self.size = 0
+        self.free_slots = array('i')
+        self.capacity = 0
+        self.lock = threading.Lock()
+
+        # Result column
+        if result_storage == ResultStorage.BYTES:
+            self.bytes_width = bytes_width
+            self.bytes_buffer = bytearray()
+            self.bytes_lengths = array('i')
+            self.bytes_overflow = {}                    # {slot -> value} for values longer than bytes_width
+        elif result_storage in RESULT_TYPECODES:
+            self.results = array(RESULT_TYPECODES[result_storage])
+        else:
+            raise RuntimeError('Result storage ' + str(result_storage) + ' is not implemented yet')
+
+        # Metadata columns, indexed by the same slots
+        self.columns = {
+            'last_computed': array('q'),
+            'last_accessed': array('q'),
+            'access_counter': array('q'),
+        }
+
+    # Position of the key in the given index, or -1 (index is passed in, as it is replaced when it grows)
+    def _locate(self, index: array, key) -> int:
+        if len(key) != self.key_width:
+            return -1
+        mask = len(index) - 1
+        width = self.key_width
+        keys_buffer = self.keys_buffer
+        position = _hash(key) & mask
+        while True:
+            entry = index[position]
+            if entry == _EMPTY:
+                return -1
+            if entry > 0 and keys_buffer.startswith(key, (entry - 1) * width):
+                return position
+            position = (position + 1) & mask
+
+    def _find(self, key) -> int:
+        index = self.index
+        position = self._locate(index, key)
+        if position < 0:
+            return -1
+        return index[position] - 1
+
+    def _insert_into_index(self, key, slot: int):
+        if (self.index_used + 1) * 3 > len(self.index) * 2:
+            self._rebuild_index()
+        index = self.index
+        mask = len(index) - 1
+        position = _hash(key) & mask
+        while index[position] > 0:
+            position = (position + 1) & mask
+        if index[position] == _EMPTY:
+            self.index_used = self.index_used + 1
+        index[position] = slot + 1
+
+    # New index is filled before it replaces the old one, so readers without the lock see one or the other
+    def _rebuild_index(self):
+        index_size = _MIN_INDEX_SIZE
+        while (self.size + 1) * 3 > index_size:
+            index_size = index_size * 2
+        index = array('i', bytes(4 * index_size))
+        mask = index_size - 1
+        for slot, key in self._slot_keys():
+            position = _hash(key) & mask
+            while index[position] != _EMPTY:
+                position = (position + 1) & mask
+            index[position] = slot + 1
+        self.index_used = self.size
+        self.index = index
+
+    # Keys are listed in insertion order, as dicts do
+    def _slot_keys(self) -> list:
+        slots = sorted(itertools.compress(range(self.capacity), self.live), key=self.inserted.__getitem__)
+        return [(slot, self._key_at(slot)) for slot in slots]
+
+    def _key_at(self, slot: int) -> bytes:
+        start = slot * self.key_width
+        return bytes(self.keys_buffer[start:start + self.key_width])
+
+    def _allocate(self, key) -> int:
+        if not isinstance(key, (bytes, bytearray)) or len(key) != self.key_width:
+            raise TypeError('Compact storage keys are digests of ' + str(self.key_width) + ' bytes, got ' + repr(key))
+        if self.free_slots:
+            slot = self.free_slots.pop()
+        else:
+            slot = self.capacity
+            self.capacity = self.capacity + 1
+            for column in self.columns.values():
+                column.append(0)
+            self.keys_buffer.extend(bytes(self.key_width))
+            self.live.append(0)
+            self.inserted.append(0)
+            if self.result_storage == ResultStorage.BYTES:
+                self.bytes_buffer.extend(bytes(self.bytes_width))
+                self.bytes_lengths.append(0)
+            else:
+                self.results.append(0)
+        for column in self.columns.values():
+            column[slot] = 0
+        start = slot * self.key_width
+        self.keys_buffer[start:start + self.key_width] = key
+        self.live[slot] = 1
+        self.inserted[slot] = self.insert_counter
+        self.insert_counter = self.insert_counter + 1
+        self._insert_into_index(key, slot)
+        self.size = self.size + 1
+        return slot
+
+    def _read(self, slot: int):
+        if self.result_storage == ResultStorage.BYTES:
+            length = self.bytes_lengths[slot]
+            if length < 0:
+                return self.bytes_overflow[slot]
+            start = slot * self.bytes_width
+            return bytes(self.bytes_buffer[start:start + length])
+        return self.results[slot]
+
+    def _write(self, slot: int, value):
+        if self.result_storage == ResultStorage.BYTES:
+            if not isinstance(value, (bytes, bytearray)):
+                raise TypeError('Result storage BYTES can only keep bytes, got ' + str(type(value)))
+            self.bytes_overflow.pop(slot, None)
+            if len(value) > self.bytes_width:
+                self.bytes_lengths[slot] = -1
+                self.bytes_overflow[slot] = bytes(value)
+            else:
+                start = slot * self.bytes_width
+                self.bytes_buffer[start:start + len(value)] = value
+                self.bytes_lengths[slot] = len(value)
+        else:
+            self.results[slot] = value
+
+    def __getitem__(self, key):
+        slot = self._find(key)
+        if slot < 0:
+            raise KeyError(key)
+        return self._read(slot)
+
+    # Misses are the common case of get(), so they don't go through a KeyError
+    def get(self, key, default=None):
+        slot = self._find(key)
+        if slot < 0:
+            return default
+        return self._read(slot)
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            slot = self._find(key)
+            if slot < 0:
+                slot = self._allocate(key)
+            try:
+                self._write(slot, value)
+            except (TypeError, OverflowError):
+                self._release(key)
+                raise
+
+    def __delitem__(self, key):
+        with self.lock:
+            self._release(key)
+
+    def _release(self, key):
+        index = self.index
+        position = self._locate(index, key)
+        if position < 0:
+            raise KeyError(key)
+        slot = index[position] - 1
+        index[position] = _DELETED
+        self.live[slot] = 0
+        self.size = self.size - 1
+        if self.result_storage == ResultStorage.BYTES:
+            self.bytes_overflow.pop(slot, None)
+        self.free_slots.append(slot)
+
+    def __contains__(self, key):
+        return self._find(key) >= 0
+
+    def __iter__(self):
+        return iter([key for slot, key in self._slot_keys()])
+
+    def __len__(self):
+        return self.size
+
+
+# View of one metadata column, an entry exists exactly as long as the result of its key does
+# Setting a key that has no result is ignored, and popping doesn't drop anything (the entry goes away with its result)
+class CompactMetadataMap(MutableMapping):
+    def __init__(self, result_map: CompactResultMap, column_name: str):
+        self.result_map = result_map
+        self.column = result_map.columns[column_name]
+
+    def __getitem__(self, key):
+        slot = self.result_map._find(key)
+        if slot < 0:
+            raise KeyError(key)
+        return self.column[slot]
+
+    def get(self, key, default=None):
+        slot = self.result_map._find(key)
+        if slot < 0:
+            return default
+        return self.column[slot]
+
+    def __setitem__(self, key, value):
+        slot = self.result_map._find(key)
+        if slot >= 0:
+            self.column[slot] = value
+
+    def __delitem__(self, key):
+        if key not in self.result_map:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.result_map
+
+    def __iter__(self):
+        return iter(self.result_map)
+
+    def __len__(self):
+        return len(self.result_map)
+
+    # Same key as min() over items() of a dict (ties go to the key inserted first), found in one pass over the columns without sorting
+    def find_key_with_lowest_value(self, excluded_key=None):
+        result_map = self.result_map
+        live = result_map.live
+        excluded_slot = result_map._find(excluded_key) if excluded_key is not None else -1
+        if excluded_slot >= 0:
+            live = bytearray(live)
+            live[excluded_slot] = 0
+        value, inserted, slot = min(itertools.compress(zip(self.column, result_map.inserted, range(result_map.capacity)), live))
+        return result_map._key_at(slot)
+
+    def items(self):
+        column = self.column
+        return [(key, column[slot]) for slot, key in self.result_map._slot_keys()]
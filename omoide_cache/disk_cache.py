@@ -0,0 +1,207 @@
+import os
+import re
+import pickle
+import inspect
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import List, Dict
+from omoide_cache.fingerprint import Fingerprinter, DEFAULT_FINGERPRINTER
+from omoide_cache.log import logger, RateLimitedWarning
+
+
+# Persistent tier of a cache, meant for pure functions in offline pipelines (results stay valid between runs of the program)
+# Each result is a file in a directory of its function, named by a hash of the function's code plus the fingerprint of the arguments,
+# so editing the function makes old results unreachable (they are the first ones to go on eviction)
+# NumPy arrays are stored as .npy files and loaded memory-mapped (read-only), so reloading even a large array costs almost nothing,
+# everything else is pickled. Results that can't be pickled are just not persisted
+# Files are evicted by last use once their total size goes over max bytes, last use is kept in file modification times between runs
+# Only misses of get() (and put()) read and write this tier, every invalidation of the cache also drops results from it (clear() drops all of them)
+# Arguments fingerprinted by identity (objects without a repr of their own) would give a different key in each run, so their results are not persisted,
+# register a fingerprint handler for such types to persist them (see Fingerprinter.register)
+
+
+_PICKLE_SUFFIX = '.pkl'
+_NUMPY_SUFFIX = '.npy'
+
+
+def function_name(function) -> str:
+    name = str(getattr(function, '__module__', None)) + '.' + getattr(function, '__qualname__', getattr(function, '__name__', repr(function)))
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', name)
+
+
+def _update_code(hasher, code):
+    hasher.update(code.co_code)
+    hasher.update(repr(code.co_names).encode('utf-8'))
+    for constant in code.co_consts:
+        if inspect.iscode(constant):
+            _update_code(hasher, constant)
+        else:
+            hasher.update(repr(constant).encode('utf-8'))
+
+
+# Source of the function if it is available, byte code otherwise
+def code_hash(function) -> str:
+    hasher = hashlib.blake2b(digest_size=8)
+    hasher.update(function_name(function).encode('utf-8'))
+    try:
+        hasher.update(inspect.getsource(function).encode('utf-8'))
+    except (OSError, TypeError):
+        code = getattr(function, '__code__', None)
+        if code is not None:
+            _update_code(hasher, code)
+    return hasher.hexdigest()
+
+
+def _is_numpy_array(result) -> bool:
+    result_type = type(result)
+    return result_type.__module__ == 'numpy' and result_type.__name__ == 'ndarray' and not result.dtype.hasobject
+
+
+class DiskCache:
+    def __init__(self, directory: str, function, max_bytes: int = -1, fingerprinter: Fingerprinter = None, ignored_positional_arguments: int = 0):
+        self.directory = os.path.join(directory, function_name(function))
+        self.code_hash = code_hash(function)
+        self.max_bytes = max_bytes                      # Leave at -1 to never evict
+        self.fingerprinter = fingerprinter if fingerprinter is not None else DEFAULT_FINGERPRINTER
+
+        # Number of leading positional arguments left out of the key (e.g. 1 for "self" of methods, which is different in each run)
+        self.ignored_positional_arguments = ignored_positional_arguments
+
+        # Directory is scanned on first use, not when the function is decorated
+        self._index = None                              # Ordered by last use {file name -> size in bytes}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._store_failed_warning = RateLimitedWarning()
+        self._identity_warned = False
+
+    # Returns None if the key would be different in each run, such a key is never loaded, stored or discarded
+    def build_key(self, positional_arguments: List, keyword_arguments: Dict) -> str:
+        positional_arguments = positional_arguments[self.ignored_positional_arguments:]
+        if self.fingerprinter.identity_values(positional_arguments, keyword_arguments):
+            if not self._identity_warned:
+                self._identity_warned = True
+                logger.warning('DiskCache.build_key(): Results of %s are not persisted for arguments that are fingerprinted by identity, '
+                               'register a fingerprint handler for their type to persist them', self.directory)
+            return None
+        return self.code_hash + '-' + self.fingerprinter.fingerprint(positional_arguments, keyword_arguments).hex()
+
+    def load(self, key: str, default=None):
+        if key is None:
+            return default
+        self._ensure_index()
+        for suffix in (_NUMPY_SUFFIX, _PICKLE_SUFFIX):
+            path = os.path.join(self.directory, key + suffix)
+            try:
+                if suffix == _NUMPY_SUFFIX:
+                    if not os.path.exists(path):
+                        continue
+                    import numpy
+                    result = numpy.load(path, mmap_mode='r', allow_pickle=False)
+                else:
+                    with open(path, 'rb') as file:
+                        result = pickle.load(file)
+            except FileNotFoundError:
+                continue
+            except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+                # Partially written or corrupted file, computed again
+                self._remove_file(key + suffix)
+                continue
+            self._touch(key + suffix)
+            return result
+        return default
+
+    def store(self, key: str, result):
+        if key is None:
+            return
+        self._ensure_index()
+        suffix = _NUMPY_SUFFIX if _is_numpy_array(result) else _PICKLE_SUFFIX
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(file_descriptor, 'wb') as file:
+                if suffix == _NUMPY_SUFFIX:
+                    import numpy
+                    numpy.save(file, result, allow_pickle=False)
+                else:
+                    pickle.dump(result, file, protocol=pickle.HIGHEST_PROTOCOL)
+            size = os.path.getsize(temporary_path)
+            os.replace(temporary_path, os.path.join(self.directory, key + suffix))
+        except Exception:
+            os.unlink(temporary_path)
+            self._store_failed_warning.warning('DiskCache.store(): Failed to persist a result of %s', self.directory, exc_info=True)
+            return
+        with self._lock:
+            self._total_bytes = self._total_bytes + size - self._index.pop(key + suffix, 0)
+            self._index[key + suffix] = size
+        self._evict()
+
+    def discard(self, key: str):
+        if key is None:
+            return
+        self._ensure_index()
+        for suffix in (_NUMPY_SUFFIX, _PICKLE_SUFFIX):
+            self._remove_file(key + suffix)
+
+    def clear(self):
+        self._ensure_index()
+        with self._lock:
+            file_names = list(self._index)
+        for file_name in file_names:
+            self._remove_file(file_name)
+
+    def total_bytes(self) -> int:
+        self._ensure_index()
+        return self._total_bytes
+
+    def number_of_entries(self) -> int:
+        self._ensure_index()
+        return len(self._index)
+
+    def _ensure_index(self):
+        if self._index is not None:
+            return
+        with self._lock:
+            if self._index is not None:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(_PICKLE_SUFFIX) or entry.name.endswith(_NUMPY_SUFFIX):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime_ns, entry.name, stat.st_size))
+            entries.sort()
+            self._index = OrderedDict((name, size) for mtime_ns, name, size in entries)
+            self._total_bytes = sum(self._index.values())
+        self._evict()
+
+    def _touch(self, file_name: str):
+        try:
+            os.utime(os.path.join(self.directory, file_name))
+        except OSError:
+            pass
+        with self._lock:
+            if file_name in self._index:
+                self._index.move_to_end(file_name)
+
+    def _remove_file(self, file_name: str):
+        try:
+            os.unlink(os.path.join(self.directory, file_name))
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            self._total_bytes = self._total_bytes - self._index.pop(file_name, 0)
+
+    # Results of older versions of the function go first, then the least recently used ones
+    def _evict(self):
+        if self.max_bytes < 0:
+            return
+        with self._lock:
+            if self._total_bytes <= self.max_bytes:
+                return
+            prefix = self.code_hash + '-'
+            candidates = [name for name in self._index if not name.startswith(prefix)] + [name for name in self._index if name.startswith(prefix)]
+        for file_name in candidates:
+            if self._total_bytes <= self.max_bytes:
+                return
+            self._remove_file(file_name)
@@ -0,0 +1,274 @@
+import struct
+import hashlib
+import weakref
+import itertools
+import functools
+from array import array
+from typing import List, Dict, Callable
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+
+# Cache keys are fixed size digests of the arguments, no matter how large the arguments are
+# Each value is fed into the digest as a type tag followed by its canonical content, so values of different types never collide
+# (e.g. 1, 1.0, True and '1' all give different keys), and containers can't be confused with their flattened content
+# Arrays and other buffers are hashed in place (no copy), dicts and sets are hashed independently of their order
+# Types without a handler fall back to repr(), which is what keys were built from before
+# Handlers of other types can be registered: handler(fingerprinter, value, update), where update(bytes-like) feeds the digest
+
+DIGEST_SIZE = 16
+_LENGTH = struct.Struct('<q')
+_FLOAT = struct.Struct('<d')
+
+
+def _new_hasher():
+    if xxhash is not None:
+        return xxhash.xxh3_128()
+    return hashlib.blake2b(digest_size=DIGEST_SIZE)
+
+
+def _update_length(update, length: int):
+    update(_LENGTH.pack(length))
+
+
+def _fingerprint_none(fingerprinter, value, update):
+    update(b'N')
+
+
+def _fingerprint_bool(fingerprinter, value, update):
+    update(b'T' if value else b'F')
+
+
+def _fingerprint_int(fingerprinter, value, update):
+    data = str(value).encode('ascii')
+    update(b'i')
+    _update_length(update, len(data))
+    update(data)
+
+
+def _fingerprint_float(fingerprinter, value, update):
+    update(b'f')
+    update(_FLOAT.pack(value))
+
+
+def _fingerprint_str(fingerprinter, value, update):
+    data = value.encode('utf-8', 'surrogatepass')
+    update(b's')
+    _update_length(update, len(data))
+    update(data)
+
+
+def _fingerprint_buffer(fingerprinter, value, update):
+    view = memoryview(value)
+    if not view.c_contiguous:
+        view = memoryview(view.tobytes())
+    update(b'b')
+    update(view.format.encode('ascii'))
+    _update_length(update, view.nbytes)
+    update(view.cast('B') if view.ndim != 1 or view.format != 'B' else view)
+
+
+def _fingerprint_sequence(fingerprinter, value, update):
+    update(b'l' if isinstance(value, list) else b't')
+    _update_length(update, len(value))
+    for item in value:
+        fingerprinter.update(item, update)
+
+
+def _fingerprint_dict(fingerprinter, value, update):
+    pairs = sorted((fingerprinter.digest(key), fingerprinter.digest(item)) for key, item in value.items())
+    update(b'd')
+    _update_length(update, len(pairs))
+    for key_digest, item_digest in pairs:
+        update(key_digest)
+        update(item_digest)
+
+
+def _fingerprint_set(fingerprinter, value, update):
+    digests = sorted(fingerprinter.digest(item) for item in value)
+    update(b'S' if isinstance(value, set) else b'Z')
+    _update_length(update, len(digests))
+    for digest in digests:
+        update(digest)
+
+
+def _fingerprint_numpy_array(fingerprinter, value, update):
+    # Object arrays hold pointers, so their elements are hashed one by one instead
+    if value.dtype.hasobject:
+        update(b'O')
+        fingerprinter.update(value.shape, update)
+        fingerprinter.update(value.tolist(), update)
+        return
+    if not value.flags.c_contiguous:
+        import numpy
+        value = numpy.ascontiguousarray(value)
+    update(b'a')
+    fingerprinter.update(value.dtype.str, update)
+    fingerprinter.update(value.shape, update)
+    _update_length(update, value.nbytes)
+    update(memoryview(value.reshape(-1).view('u1')))
+
+
+def _fingerprint_dataclass(fingerprinter, value, update):
+    # Already imported by the module that defined the dataclass
+    import dataclasses
+    update(b'D')
+    for field in dataclasses.fields(value):
+        fingerprinter.update(field.name, update)
+        fingerprinter.update(getattr(value, field.name), update)
+
+
+# Objects with the default repr() (e.g. "self" of decorated methods) are told apart by identity: each one gets a serial number
+# that is never reused, so a new object that gets the address of a collected one doesn't get its key
+# Objects that can't be weakly referenced are told apart by address (the cache keeps them alive while their key is cached)
+def _fingerprint_identity(fingerprinter, value, update):
+    serial = fingerprinter._identity_serial(value)
+    if serial is None:
+        update(b'@')
+        update(_LENGTH.pack(id(value)))
+    else:
+        update(b'#')
+        update(_LENGTH.pack(serial))
+
+
+def _fingerprint_repr(fingerprinter, value, update):
+    update(b'r')
+    fingerprinter.update(repr(value), update)
+
+
+class Fingerprinter:
+    def __init__(self):
+        self.handlers = {
+            type(None): _fingerprint_none,
+            bool: _fingerprint_bool,
+            int: _fingerprint_int,
+            float: _fingerprint_float,
+            str: _fingerprint_str,
+            bytes: _fingerprint_buffer,
+            bytearray: _fingerprint_buffer,
+            memoryview: _fingerprint_buffer,
+            array: _fingerprint_buffer,
+            list: _fingerprint_sequence,
+            tuple: _fingerprint_sequence,
+            dict: _fingerprint_dict,
+            set: _fingerprint_set,
+            frozenset: _fingerprint_set,
+        }
+        self._resolved_handlers = {}                    # {type -> (handler, type prefix)} for types that have no handler of their own
+        self._identity_serials = {}                     # {address -> (weak reference, serial)} of live objects fingerprinted by identity
+        self._serial_counter = itertools.count(1)
+
+    # Handler is used for the type and all its subclasses that don't have a handler of their own
+    def register(self, value_type: type, handler: Callable):
+        self.handlers[value_type] = handler
+        self._resolved_handlers = {}
+
+    def _resolve_handler(self, value_type: type) -> Callable:
+        if value_type.__module__ == 'numpy' and value_type.__name__ == 'ndarray':
+            return _fingerprint_numpy_array
+        # Same check as dataclasses.is_dataclass(), without importing dataclasses (and inspect with it) for programs that don't use them
+        if hasattr(value_type, '__dataclass_fields__'):
+            return _fingerprint_dataclass
+        for base_type in value_type.__mro__[1:]:
+            handler = self.handlers.get(base_type)
+            if handler is not None:
+                return handler
+        if value_type.__repr__ is object.__repr__:
+            return _fingerprint_identity
+        return _fingerprint_repr
+
+    def _resolve(self, value_type: type) -> tuple:
+        resolved = self._resolved_handlers.get(value_type)
+        if resolved is None:
+            # Type name goes first, so subclasses (e.g. an IntEnum) never collide with their base type
+            type_name = (value_type.__module__ + '.' + value_type.__qualname__).encode('utf-8')
+            resolved = (self._resolve_handler(value_type), b'<' + _LENGTH.pack(len(type_name)) + type_name)
+            self._resolved_handlers[value_type] = resolved
+        return resolved
+
+    def _identity_serial(self, value):
+        address = id(value)
+        entry = self._identity_serials.get(address)
+        if entry is not None and entry[0]() is value:
+            return entry[1]
+        try:
+            reference = weakref.ref(value, functools.partial(_forget_identity, self._identity_serials, address))
+        except TypeError:
+            return None
+        entry = (reference, next(self._serial_counter))
+        self._identity_serials[address] = entry
+        return entry[1]
+
+    def update(self, value, update):
+        value_type = type(value)
+        handler = self.handlers.get(value_type)
+        if handler is None:
+            handler, type_prefix = self._resolve(value_type)
+            update(type_prefix)
+        handler(self, value, update)
+
+    def digest(self, value) -> bytes:
+        hasher = _new_hasher()
+        self.update(value, hasher.update)
+        return hasher.digest()
+
+    # Positional arguments give the same key whether they are passed as a list or as a tuple
+    # Keyword arguments give the same key in any order
+    def fingerprint(self, positional_arguments: List, keyword_arguments: Dict) -> bytes:
+        hasher = _new_hasher()
+        update = hasher.update
+        _update_length(update, len(positional_arguments))
+        for value in positional_arguments:
+            self.update(value, update)
+        if keyword_arguments:
+            update(b'k')
+            for name in sorted(keyword_arguments):
+                _fingerprint_str(self, name, update)
+                self.update(keyword_arguments[name], update)
+        return hasher.digest()
+
+    # Arguments (or values nested in them) that are fingerprinted by identity, their keys only match while they are alive
+    def identity_values(self, positional_arguments: List, keyword_arguments: Dict) -> List:
+        collector = _IdentityCollector(self)
+        for value in positional_arguments:
+            collector.update(value, _skip_update)
+        for value in keyword_arguments.values():
+            collector.update(value, _skip_update)
+        return collector.values
+
+
+# Called by the garbage collector, the address is only forgotten if it wasn't given to a new object already
+def _forget_identity(identity_serials: Dict, address: int, reference: weakref.ref):
+    entry = identity_serials.get(address)
+    if entry is not None and entry[0] is reference:
+        identity_serials.pop(address, None)
+
+
+def _skip_update(data):
+    pass
+
+
+# Walks values the same way the fingerprinter does (handlers call it back for nested values), without hashing anything
+class _IdentityCollector:
+    def __init__(self, fingerprinter: Fingerprinter):
+        self.fingerprinter = fingerprinter
+        self.values = []
+
+    def update(self, value, update):
+        handler = self.fingerprinter.handlers.get(type(value))
+        if handler is None:
+            handler = self.fingerprinter._resolve(type(value))[0]
+        if handler is _fingerprint_identity:
+            self.values.append(value)
+        else:
+            handler(self, value, update)
+
+    def digest(self, value) -> bytes:
+        self.update(value, _skip_update)
+        return b''
+
+
+DEFAULT_FINGERPRINTER = Fingerprinter()
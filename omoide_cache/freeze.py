@@ -0,0 +1,64 @@
+from array import array
+from types import MappingProxyType
+from typing import Callable
+
+
+# Cached results are shared by every caller, so a caller that changes one (e.g. appends to a returned list) changes it for everyone
+# With FREEZE protection results are converted once, when they are stored, into immutable or read-only forms, and hits return them without copies:
+# lists and tuples become tuples, dicts become read-only mapping proxies, sets become frozensets, bytearrays become bytes,
+# NumPy arrays and memoryviews become read-only views, arrays become read-only memoryviews (containers are frozen recursively)
+# Other objects are stored as they are, converters of other types can be registered with register_freezer(type, freezer)
+class ResultProtection:
+    NONE = 'NONE'
+    FREEZE = 'FREEZE'
+
+
+def _freeze_sequence(value):
+    return tuple(freeze(item) for item in value)
+
+
+def _freeze_dict(value):
+    return MappingProxyType({key: freeze(item) for key, item in value.items()})
+
+
+def _freeze_set(value):
+    return frozenset(value)
+
+
+def _freeze_bytearray(value):
+    return bytes(value)
+
+
+def _freeze_buffer(value):
+    return memoryview(value).toreadonly()
+
+
+def _freeze_numpy_array(value):
+    view = value.view()
+    view.flags.writeable = False
+    return view
+
+
+_FREEZERS = {
+    list: _freeze_sequence,
+    tuple: _freeze_sequence,
+    dict: _freeze_dict,
+    set: _freeze_set,
+    bytearray: _freeze_bytearray,
+    memoryview: _freeze_buffer,
+    array: _freeze_buffer,
+}
+
+
+def register_freezer(value_type: type, freezer: Callable):
+    _FREEZERS[value_type] = freezer
+
+
+def freeze(value):
+    value_type = type(value)
+    freezer = _FREEZERS.get(value_type)
+    if freezer is not None:
+        return freezer(value)
+    if value_type.__module__ == 'numpy' and value_type.__name__ == 'ndarray':
+        return _freeze_numpy_array(value)
+    return value
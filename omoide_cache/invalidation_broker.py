@@ -0,0 +1,107 @@
+import os
+import sys
+import socket
+import selectors
+import threading
+from omoide_cache.log import logger
+
+
+# Forwards every message it gets from one connected InvalidationBus to all other ones, see invalidation_bus.py
+# Not imported by the package, so it can be run with "python -m" without being imported twice
+
+
+# Run it with "python -m omoide_cache.invalidation_broker /path/to/socket" or in a thread of any process with start()
+class InvalidationBroker:
+    def __init__(self, socket_path: str):
+        self.socket_path = socket_path
+        self.number_of_forwarded_messages = 0
+        self._server = None
+        self._selector = None
+        self._buffers = {}                              # {connection -> bytes received after the last complete message}
+        self._closed = False
+        self._thread = None
+
+    def _listen(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(self.socket_path)
+        self._server.listen()
+        self._server.setblocking(False)
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._server, selectors.EVENT_READ)
+
+    def start(self):
+        self._listen()
+        self._thread = threading.Thread(target=self.serve_forever, name='omoide_cache-invalidation-broker', daemon=True)
+        self._thread.start()
+
+    def serve_forever(self):
+        if self._server is None:
+            self._listen()
+        while not self._closed:
+            for selector_key, events in self._selector.select(timeout=0.1):
+                if selector_key.fileobj is self._server:
+                    self._accept()
+                else:
+                    self._receive(selector_key.fileobj)
+        self._close_all()
+
+    def stop(self, timeout_s: float = 5.0):
+        self._closed = True
+        if self._thread is not None:
+            self._thread.join(timeout_s)
+
+    def _accept(self):
+        try:
+            connection, address = self._server.accept()
+        except BlockingIOError:
+            return
+        connection.settimeout(1.0)
+        self._buffers[connection] = b''
+        self._selector.register(connection, selectors.EVENT_READ)
+
+    def _receive(self, connection: socket.socket):
+        try:
+            data = connection.recv(65536)
+        except OSError:
+            data = b''
+        if not data:
+            self._drop(connection)
+            return
+        lines = (self._buffers[connection] + data).split(b'\n')
+        self._buffers[connection] = lines.pop()
+        for line in lines:
+            if line:
+                self._forward(connection, line + b'\n')
+
+    def _forward(self, source: socket.socket, message: bytes):
+        self.number_of_forwarded_messages = self.number_of_forwarded_messages + 1
+        for connection in list(self._buffers):
+            if connection is not source:
+                try:
+                    connection.sendall(message)
+                except OSError:
+                    logger.warning('InvalidationBroker._forward(): Dropped a connection that could not receive')
+                    self._drop(connection)
+
+    def _drop(self, connection: socket.socket):
+        if connection in self._buffers:
+            self._selector.unregister(connection)
+            del self._buffers[connection]
+            connection.close()
+
+    def _close_all(self):
+        for connection in list(self._buffers):
+            self._drop(connection)
+        self._selector.close()
+        self._server.close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print('Usage: python -m omoide_cache.invalidation_broker /path/to/socket')
+        sys.exit(1)
+    InvalidationBroker(sys.argv[1]).serve_forever()
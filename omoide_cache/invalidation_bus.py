@@ -0,0 +1,233 @@
+import json
+import uuid
+import socket
+import weakref
+import threading
+from typing import List, Dict
+from omoide_cache.clock import Clock, MONOTONIC_CLOCK
+from omoide_cache.log import RateLimitedWarning
+
+
+# Broadcasts invalidations between processes that each keep their own caches (e.g. workers of a web server)
+# A tiny broker (see invalidation_broker.py) listens on a Unix domain socket and forwards every message it gets to all other connected processes
+# Each process connects one InvalidationBus and passes it to its caches as Cache(invalidation_bus=bus), then invalidate(), invalidate_many(),
+# invalidate_by_tag(), invalidate_where() and clear() of a cache also drop the same keys from caches of the same channel in other processes
+# Invalidations are batched for a short window and coalesced (same key invalidated many times is sent once), messages are one JSON object per line
+# Each message carries a version (time it was sent, by the monotonic clock shared by all processes of the host), a key is only dropped
+# if it was computed before that, so late or repeated messages never drop results that are newer than the invalidation
+# Keys are sent as they are, so they must be the same in each process: arguments whose fingerprint depends on the process
+# (objects without a repr of their own are fingerprinted by identity) need a registered fingerprint handler
+# Decorated methods leave the object out of their keys, so invalidating a key of a method drops it from the caches of all objects of other processes
+
+
+# Client of one process, caches are attached to it by channel name (by default qualified name of the cached function)
+# Connects in the background and reconnects if the broker goes away, invalidations made while disconnected are sent after reconnect
+class InvalidationBus:
+    def __init__(self, socket_path: str, flush_window_ms: float = 2, reconnect_interval_s: float = 1.0, clock: Clock = None):
+        self.socket_path = socket_path
+        self.flush_window_s = flush_window_ms / 1000
+        self.reconnect_interval_s = reconnect_interval_s
+        self.clock = clock if clock is not None else MONOTONIC_CLOCK
+        self.source = uuid.uuid4().hex
+
+        self.number_of_sent_messages = 0
+        self.number_of_received_messages = 0
+
+        self._channels = {}                             # {channel -> WeakSet of attached caches}
+        self._channels_lock = threading.Lock()
+        self._pending = {}                              # {channel -> set of keys, or None if all keys are invalidated}
+        self._pending_condition = threading.Condition()      # Also used by the receiver to wait between reconnects, so waiters are woken with notify_all()
+        self._socket = None
+        self._socket_lock = threading.Lock()
+        self._connected = threading.Event()
+        self._closed = False
+        self._disconnected_warning = RateLimitedWarning()
+        self._bad_message_warning = RateLimitedWarning()
+
+        self._receiver = threading.Thread(target=self._receive_forever, name='omoide_cache-invalidation-receiver', daemon=True)
+        self._sender = threading.Thread(target=self._send_forever, name='omoide_cache-invalidation-sender', daemon=True)
+        self._receiver.start()
+        self._sender.start()
+
+    def attach(self, cache, channel: str):
+        with self._channels_lock:
+            self._channels.setdefault(channel, weakref.WeakSet()).add(cache)
+
+    def detach(self, cache, channel: str):
+        with self._channels_lock:
+            caches = self._channels.get(channel)
+            if caches is not None:
+                caches.discard(cache)
+
+    # Returns True once connected to the broker, or False if it didn't happen within the timeout
+    def wait_connected(self, timeout_s: float = None) -> bool:
+        return self._connected.wait(timeout_s)
+
+    # Keys are sent with the next batch, None invalidates all keys of the channel
+    def publish(self, channel: str, keys: List[bytes]):
+        with self._pending_condition:
+            self._merge_pending({channel: keys})
+            self._pending_condition.notify_all()
+
+    def close(self, timeout_s: float = 5.0):
+        with self._pending_condition:
+            self._closed = True
+            self._pending_condition.notify_all()
+        self._sender.join(timeout_s)
+        with self._socket_lock:
+            connection = self._socket
+            self._socket = None
+        if connection is not None:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            connection.close()
+        self._receiver.join(timeout_s)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    # Sending
+    #-------------------------------------------------------------------------------------------------------------------
+    def _send_forever(self):
+        while True:
+            with self._pending_condition:
+                while not self._pending and not self._closed:
+                    self._pending_condition.wait()
+                if not self._pending and self._closed:
+                    return
+
+            # Let more invalidations join the batch
+            if not self._closed:
+                self._wait(self.flush_window_s)
+
+            # Wait for the connection, keeping invalidations pending
+            while not self._connected.is_set() and not self._closed:
+                self._wait(self.reconnect_interval_s)
+            with self._pending_condition:
+                pending = self._pending
+                self._pending = {}
+            if not self._send(pending):
+                with self._pending_condition:
+                    self._merge_pending(pending)
+                if self._closed:
+                    return
+                self._wait(self.reconnect_interval_s)
+
+    def _wait(self, timeout_s: float):
+        with self._pending_condition:
+            if not self._closed:
+                self._pending_condition.wait(timeout_s)
+
+    def _merge_pending(self, pending: Dict):
+        for channel, keys in pending.items():
+            pending_keys = self._pending.get(channel, set())
+            if keys is None or pending_keys is None:
+                self._pending[channel] = None
+            else:
+                pending_keys.update(keys)
+                self._pending[channel] = pending_keys
+
+    def _send(self, pending: Dict) -> bool:
+        message = {
+            'source': self.source,
+            'version': self.clock.time_ns(),
+            'channels': {channel: (None if keys is None else [key.hex() for key in keys]) for channel, keys in pending.items()}
+        }
+        data = (json.dumps(message, separators=(',', ':')) + '\n').encode('utf-8')
+        with self._socket_lock:
+            connection = self._socket
+            if connection is None:
+                return False
+            try:
+                connection.sendall(data)
+            except OSError:
+                self._disconnected_warning.warning('InvalidationBus._send(): Lost connection to broker at %s, will resend after reconnect', self.socket_path)
+                return False
+        self.number_of_sent_messages = self.number_of_sent_messages + 1
+        return True
+    #-------------------------------------------------------------------------------------------------------------------
+
+
+
+    # Receiving
+    #-------------------------------------------------------------------------------------------------------------------
+    def _receive_forever(self):
+        while not self._closed:
+            connection = self._connect()
+            if connection is None:
+                self._wait(self.reconnect_interval_s)
+                continue
+            try:
+                for line in connection.makefile('rb'):
+                    self._apply_message(line)
+            except (OSError, ValueError):
+                pass
+            self._connected.clear()
+            with self._socket_lock:
+                if self._socket is connection:
+                    self._socket = None
+            connection.close()
+
+    def _connect(self) -> socket.socket:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            connection.connect(self.socket_path)
+        except OSError:
+            connection.close()
+            self._disconnected_warning.warning('InvalidationBus._connect(): Broker is not listening at %s, will retry', self.socket_path)
+            return None
+        with self._socket_lock:
+            if self._closed:
+                connection.close()
+                return None
+            self._socket = connection
+        self._connected.set()
+        return connection
+
+    # Messages come from other processes, a malformed one is logged and skipped, so it can't stop the receiver thread
+    def _apply_message(self, line: bytes):
+        try:
+            message = json.loads(line)
+        except ValueError:
+            self._bad_message_warning.warning('InvalidationBus._apply_message(): Skipped a message that is not valid JSON')
+            return
+        if not isinstance(message, dict):
+            self._bad_message_warning.warning('InvalidationBus._apply_message(): Skipped a message that is not a JSON object')
+            return
+        if message.get('source') == self.source:
+            return
+        version_ns = message.get('version')
+        channels = _decode_channels(message.get('channels'))
+        if type(version_ns) is not int or channels is None:
+            self._bad_message_warning.warning('InvalidationBus._apply_message(): Skipped a message without an integer version and channels of hex keys')
+            return
+        self.number_of_received_messages = self.number_of_received_messages + 1
+        for channel, keys in channels.items():
+            with self._channels_lock:
+                caches = list(self._channels.get(channel, ()))
+            for cache in caches:
+                cache._invalidate_keys_computed_before(keys, version_ns)
+    #-------------------------------------------------------------------------------------------------------------------
+
+
+# {channel -> list of hex keys, or None} of a message, decoded to {channel -> list of keys, or None}, or None if anything is malformed
+def _decode_channels(channels) -> Dict:
+    if not isinstance(channels, dict):
+        return None
+    decoded_channels = {}
+    for channel, keys in channels.items():
+        if keys is None:
+            decoded_channels[channel] = None
+            continue
+        if not isinstance(keys, list) or not all(isinstance(key, str) for key in keys):
+            return None
+        try:
+            decoded_channels[channel] = [bytes.fromhex(key) for key in keys]
+        except ValueError:
+            return None
+    return decoded_channels
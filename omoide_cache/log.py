@@ -0,0 +1,34 @@
+import time
+import logging
+import threading
+
+
+# All diagnostics of the package go to this logger, configure it like any other (e.g. logging.getLogger('omoide_cache').setLevel(logging.DEBUG))
+# Debug messages of a cache are only built when its debug flag is set and the logger is enabled for DEBUG
+logger = logging.getLogger('omoide_cache')
+
+
+# Logs the same warning at most once per interval, the number of skipped ones is reported with the next one that gets through
+# Meant for warnings that can repeat on every call under load
+class RateLimitedWarning:
+    def __init__(self, interval_s: float = 60.0):
+        self.interval_ns = int(interval_s * 1000000000)
+        self.last_logged_ns = None
+        self.number_of_suppressed = 0
+        self._lock = threading.Lock()
+
+    def warning(self, message: str, *args, exc_info: bool = False):
+        if not logger.isEnabledFor(logging.WARNING):
+            return
+        now_ns = time.monotonic_ns()
+        with self._lock:
+            if self.last_logged_ns is not None and now_ns - self.last_logged_ns < self.interval_ns:
+                self.number_of_suppressed = self.number_of_suppressed + 1
+                return
+            self.last_logged_ns = now_ns
+            number_of_suppressed = self.number_of_suppressed
+            self.number_of_suppressed = 0
+        if number_of_suppressed > 0:
+            message = message + ' (%d similar warnings suppressed)'
+            args = args + (number_of_suppressed,)
+        logger.warning(message, *args, exc_info=exc_info)
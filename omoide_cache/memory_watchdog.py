@@ -0,0 +1,151 @@
+import weakref
+import threading
+from typing import List, Tuple, Callable
+from omoide_cache.cache import Cache, get_live_caches
+from omoide_cache.clock import Clock, MONOTONIC_CLOCK
+from omoide_cache.log import logger, RateLimitedWarning
+
+
+# Optional watchdog that shrinks caches when the process (or its container) is running out of memory
+# Memory usage is read every interval: when it crosses the high watermark every cache evicts a fraction of its keys (by its own size expire mode),
+# and its max allowed size stays that low. Caches shrink again on every check while usage stays above the high watermark,
+# and get their capacity back once usage drops below the low watermark
+# Watermarks are fractions of the memory limit: cgroup limit of the container if there is one, total memory of the machine otherwise
+
+
+_CGROUP_V2_DIR = '/sys/fs/cgroup'
+_CGROUP_V1_DIR = '/sys/fs/cgroup/memory'
+_PROC_MEMINFO = '/proc/meminfo'
+_CGROUP_V1_UNLIMITED = 2 ** 60
+
+
+def _read_first_line(path: str) -> str:
+    with open(path, 'r') as file:
+        return file.readline().strip()
+
+
+def _read_cgroup_v2(directory: str) -> Tuple[int, int]:
+    limit = _read_first_line(directory + '/memory.max')
+    if limit == 'max':
+        return None
+    return int(_read_first_line(directory + '/memory.current')), int(limit)
+
+
+def _read_cgroup_v1(directory: str) -> Tuple[int, int]:
+    limit = int(_read_first_line(directory + '/memory.limit_in_bytes'))
+    if limit >= _CGROUP_V1_UNLIMITED:
+        return None
+    return int(_read_first_line(directory + '/memory.usage_in_bytes')), limit
+
+
+def _read_meminfo(path: str) -> Tuple[int, int]:
+    values = {}
+    with open(path, 'r') as file:
+        for line in file:
+            name, _, value = line.partition(':')
+            values[name] = int(value.split()[0]) * 1024
+    return values['MemTotal'] - values['MemAvailable'], values['MemTotal']
+
+
+# Returns (used bytes, limit bytes), or None if memory usage can't be read on this system
+def read_memory_usage(cgroup_v2_dir: str = _CGROUP_V2_DIR, cgroup_v1_dir: str = _CGROUP_V1_DIR, meminfo_path: str = _PROC_MEMINFO) -> Tuple[int, int]:
+    for reader, path in ((_read_cgroup_v2, cgroup_v2_dir), (_read_cgroup_v1, cgroup_v1_dir), (_read_meminfo, meminfo_path)):
+        try:
+            usage = reader(path)
+        except (OSError, ValueError, KeyError):
+            continue
+        if usage is not None:
+            return usage
+    return None
+
+
+class MemoryWatchdog:
+    def __init__(self, high_watermark: float = 0.85, low_watermark: float = 0.7, shrink_fraction: float = 0.25, interval_s: float = 1.0,
+                 clock: Clock = None, read_usage: Callable = None, caches: List[Cache] = None):
+        if not 0 < low_watermark <= high_watermark:
+            raise RuntimeError('low_watermark must be greater than 0 and not greater than high_watermark')
+        if not 0 < shrink_fraction < 1:
+            raise RuntimeError('shrink_fraction must be between 0 and 1')
+        if interval_s <= 0:
+            raise RuntimeError('interval_s must be greater than 0')
+
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.shrink_fraction = shrink_fraction
+        self.interval_s = interval_s
+        self.clock = clock if clock is not None else MONOTONIC_CLOCK
+        self.read_usage = read_usage if read_usage is not None else read_memory_usage    # Returns (used bytes, limit bytes) or None
+
+        # Watches the given caches, or every live cache of the process (see get_live_caches()) when none are given
+        self._caches = weakref.WeakSet(caches) if caches is not None else None
+        self._shrunk_caches = weakref.WeakSet()
+        self.under_pressure = False
+        self.number_of_shrinks = 0
+
+        self._timer = None
+        self._lock = threading.Lock()
+        self._shrink_warning = RateLimitedWarning()
+
+    def caches(self) -> List[Cache]:
+        return list(self._caches) if self._caches is not None else get_live_caches()
+
+    def start(self):
+        with self._lock:
+            if self._timer is None:
+                self._timer = self.clock.call_later(self.interval_s, _tick_by_reference, weakref.ref(self))
+
+    def stop(self):
+        with self._lock:
+            timer = self._timer
+            self._timer = None
+        if timer is not None:
+            timer.cancel()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    # Reads memory usage once and reacts to it, returns usage as a fraction of the limit (or None if it can't be read)
+    def check(self) -> float:
+        usage = self.read_usage()
+        if usage is None or usage[1] <= 0:
+            return None
+        used_bytes, limit_bytes = usage
+        ratio = used_bytes / limit_bytes
+
+        if ratio >= self.high_watermark:
+            self.under_pressure = True
+            self.number_of_shrinks = self.number_of_shrinks + 1
+            number_of_dropped = 0
+            for cache in self.caches():
+                number_of_dropped = number_of_dropped + cache.shrink(self.shrink_fraction)
+                self._shrunk_caches.add(cache)
+            self._shrink_warning.warning('MemoryWatchdog.check(): Memory usage is %.0f%% of %d bytes, dropped %d cached results', ratio * 100, limit_bytes, number_of_dropped)
+
+        elif ratio <= self.low_watermark and self.under_pressure:
+            self.under_pressure = False
+            for cache in list(self._shrunk_caches):
+                cache.restore_capacity()
+            self._shrunk_caches = weakref.WeakSet()
+            logger.info('MemoryWatchdog.check(): Memory usage is back to %.0f%%, restored capacity of caches', ratio * 100)
+
+        return ratio
+
+    def _tick(self):
+        try:
+            self.check()
+        except Exception:
+            logger.exception('MemoryWatchdog._tick(): Failed to check memory usage')
+        with self._lock:
+            if self._timer is not None:
+                self._timer = self.clock.call_later(self.interval_s, _tick_by_reference, weakref.ref(self))
+
+
+# Timers only hold a weak reference, so a watchdog that is no longer used stops on its own
+def _tick_by_reference(watchdog_reference: weakref.ref):
+    watchdog = watchdog_reference()
+    if watchdog is not None:
+        watchdog._tick()
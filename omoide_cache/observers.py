@@ -0,0 +1,150 @@
+import threading
+from omoide_cache.trace import hash_key
+
+
+# Hooks into what a cache does on each call, e.g. for tracing or metrics
+# Subclass CacheObserver, override the events you need, and pass instances as Cache(observers=[...])
+# Events are called synchronously on the thread that caused them (refreshes on the refresh thread), so they must be cheap
+# Caches without observers skip all of this with a single check
+
+
+class EvictCause:
+    SIZE = 'SIZE'                                       # Dropped because cache was larger than max allowed size
+    MEMORY_PRESSURE = 'MEMORY_PRESSURE'                 # Dropped by shrink(), because the process was running out of memory
+    EXPIRED_BY_COMPUTED = 'EXPIRED_BY_COMPUTED'         # Dropped because it was computed too long ago
+    EXPIRED_BY_ACCESS = 'EXPIRED_BY_ACCESS'             # Dropped because it was accessed too long ago
+    INVALIDATED = 'INVALIDATED'                         # Dropped by one of the invalidate methods
+    CLEARED = 'CLEARED'                                 # Dropped with all other keys, by clear() or after repeated failures to evict
+    ARGUMENTS_GONE = 'ARGUMENTS_GONE'                   # Dropped on refresh, because its arguments are no longer available
+    REPLACED = 'REPLACED'                               # Stored result was replaced by put()
+    PROMOTED = 'PROMOTED'                               # Moved to the L1 tier of an exclusive tiered cache
+
+
+class CacheObserver:
+    def on_hit(self, cache, key: str):
+        pass
+
+    def on_miss(self, cache, key: str):
+        pass
+
+    # Called around the computation of a missed key, exception is None if it succeeded
+    def on_load_start(self, cache, key: str):
+        pass
+
+    def on_load_end(self, cache, key: str, duration_ns: int, exception: BaseException):
+        pass
+
+    def on_evict(self, cache, key: str, cause: str):
+        pass
+
+    # Called after a key was re-computed by refresh
+    def on_refresh(self, cache, key: str, duration_ns: int):
+        pass
+
+
+# Keeps every event in memory as a tuple (event name, key, details), meant for tests
+class RecordingObserver(CacheObserver):
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+
+    def _record(self, event: str, key: str, details=None):
+        with self._lock:
+            self.events.append((event, key, details))
+
+    def on_hit(self, cache, key: str):
+        self._record('hit', key)
+
+    def on_miss(self, cache, key: str):
+        self._record('miss', key)
+
+    def on_load_start(self, cache, key: str):
+        self._record('load_start', key)
+
+    def on_load_end(self, cache, key: str, duration_ns: int, exception: BaseException):
+        self._record('load_end', key, exception)
+
+    def on_evict(self, cache, key: str, cause: str):
+        self._record('evict', key, cause)
+
+    def on_refresh(self, cache, key: str, duration_ns: int):
+        self._record('refresh', key)
+
+    def names(self):
+        with self._lock:
+            return [event for event, key, details in self.events]
+
+    def clear(self):
+        with self._lock:
+            self.events = []
+
+
+def cache_name(cache) -> str:
+    call_to_execute = cache.call_to_execute
+    return getattr(call_to_execute, '__qualname__', None) or getattr(call_to_execute, '__name__', None) or str(call_to_execute)
+
+
+# Reports cache events to OpenTelemetry, needs opentelemetry-api to be installed (it is not a dependency of this package)
+# Hits, misses and evictions become events of the current span, loads become child spans (so calls made by the computation are nested in them),
+# and refreshes become spans of their own. Keys are reported as hashes, as they may contain sensitive arguments
+# Tracer and trace API (anything with get_current_span, use_span, Status and StatusCode of opentelemetry.trace) can be injected,
+# opentelemetry-api is only imported for the ones that are not given
+class OpenTelemetryObserver(CacheObserver):
+    def __init__(self, tracer=None, trace_api=None):
+        if trace_api is None or tracer is None:
+            try:
+                from opentelemetry import trace
+            except ImportError:
+                raise RuntimeError('OpenTelemetryObserver needs opentelemetry-api, install it with "pip install opentelemetry-api"')
+            trace_api = trace_api if trace_api is not None else trace
+            tracer = tracer if tracer is not None else trace.get_tracer('omoide_cache')
+        self._trace = trace_api
+        self.tracer = tracer
+        self._local = threading.local()
+
+    def _attributes(self, cache, key: str):
+        return {'omoide_cache.name': cache_name(cache), 'omoide_cache.key_hash': str(hash_key(key))}
+
+    def _add_event(self, name: str, cache, key: str, attributes=None):
+        span = self._trace.get_current_span()
+        if span.is_recording():
+            event_attributes = self._attributes(cache, key)
+            if attributes:
+                event_attributes.update(attributes)
+            span.add_event(name, event_attributes)
+
+    def on_hit(self, cache, key: str):
+        self._add_event('omoide_cache.hit', cache, key)
+
+    def on_miss(self, cache, key: str):
+        self._add_event('omoide_cache.miss', cache, key)
+
+    def on_load_start(self, cache, key: str):
+        span = self.tracer.start_span('omoide_cache.load', attributes=self._attributes(cache, key))
+        scope = self._trace.use_span(span, end_on_exit=False)
+        scope.__enter__()
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append((span, scope))
+
+    def on_load_end(self, cache, key: str, duration_ns: int, exception: BaseException):
+        stack = getattr(self._local, 'stack', None)
+        if not stack:
+            return
+        span, scope = stack.pop()
+        span.set_attribute('omoide_cache.load_duration_ns', duration_ns)
+        if exception is not None:
+            span.record_exception(exception)
+            span.set_status(self._trace.Status(self._trace.StatusCode.ERROR, str(exception)))
+        scope.__exit__(None, None, None)
+        span.end()
+
+    def on_evict(self, cache, key: str, cause: str):
+        self._add_event('omoide_cache.evict', cache, key, {'omoide_cache.evict_cause': cause})
+
+    def on_refresh(self, cache, key: str, duration_ns: int):
+        attributes = self._attributes(cache, key)
+        attributes['omoide_cache.refresh_duration_ns'] = duration_ns
+        span = self.tracer.start_span('omoide_cache.refresh', attributes=attributes)
+        span.end()
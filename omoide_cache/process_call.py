@@ -0,0 +1,122 @@
+import importlib
+
+
+# Helpers to run call_to_execute on a ProcessPoolExecutor
+# Functions decorated with omoide_cache are replaced in their class by a descriptor, so they can't be pickled by reference as is
+# Instead we send module name and qualified name of the function, and resolve (and unwrap) it again inside the worker process
+
+# NumPy and bytes results larger than this are moved back to the main process through shared memory instead of being pickled
+# Each handle must be passed through load_result() exactly once, which copies the result out and releases the shared memory
+SHARED_MEMORY_MIN_BYTES = 1024 * 1024
+
+
+class CallReference:
+    def __init__(self, module_name: str, qualified_name: str):
+        self.module_name = module_name
+        self.qualified_name = qualified_name
+
+    def __repr__(self):
+        return 'CallReference{' + self.module_name + '.' + self.qualified_name + '}'
+
+
+# Handle of an array that was placed into shared memory by the worker process
+class SharedMemoryArray:
+    def __init__(self, name: str, shape: tuple, dtype: str):
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+
+
+# Handle of a bytes result that was placed into shared memory by the worker process
+class SharedMemoryBytes:
+    def __init__(self, name: str, size: int):
+        self.name = name
+        self.size = size
+
+
+# Cache of resolved functions, kept separately in each worker process
+_resolved_calls = {}
+
+
+def build_call_reference(call) -> CallReference:
+    module_name = getattr(call, '__module__', None)
+    qualified_name = getattr(call, '__qualname__', None)
+    if module_name is None or qualified_name is None or '<locals>' in qualified_name or '<lambda>' in qualified_name:
+        raise RuntimeError('Call ' + str(call) + ' cannot be executed in a process pool, only module level functions and class methods are supported')
+    call_reference = CallReference(module_name, qualified_name)
+    if resolve_call_reference(call_reference) is not call:
+        raise RuntimeError('Call ' + str(call) + ' cannot be executed in a process pool, it is not reachable as ' + str(call_reference))
+    return call_reference
+
+
+def resolve_call_reference(call_reference: CallReference):
+    call = _resolved_calls.get((call_reference.module_name, call_reference.qualified_name))
+    if call is None:
+        call = importlib.import_module(call_reference.module_name)
+        for name in call_reference.qualified_name.split('.'):
+            call = getattr(call, name)
+        # Unwrap decorated methods
+        call = getattr(call, '__wrapped__', call)
+        _resolved_calls[(call_reference.module_name, call_reference.qualified_name)] = call
+    return call
+
+
+# Runs inside the worker process
+def execute_call(call_reference: CallReference, positional_arguments, keyword_arguments, shared_memory_min_bytes: int = SHARED_MEMORY_MIN_BYTES):
+    call = resolve_call_reference(call_reference)
+    result = call(*positional_arguments, **keyword_arguments)
+
+    # Move large arrays and bytes through shared memory
+    if shared_memory_min_bytes < 0:
+        return result
+    if type(result).__module__ == 'numpy' and type(result).__name__ == 'ndarray' and result.nbytes >= shared_memory_min_bytes:
+        import numpy
+        memory = _create_shared_memory(result.nbytes)
+        try:
+            numpy.ndarray(result.shape, dtype=result.dtype, buffer=memory.buf)[...] = result
+        except BaseException:
+            _release_shared_memory(memory)
+            raise
+        memory.close()
+        return SharedMemoryArray(memory.name, result.shape, result.dtype.str)
+    if type(result) is bytes and len(result) >= shared_memory_min_bytes:
+        memory = _create_shared_memory(len(result))
+        try:
+            memory.buf[:len(result)] = result
+        except BaseException:
+            _release_shared_memory(memory)
+            raise
+        memory.close()
+        return SharedMemoryBytes(memory.name, len(result))
+
+    return result
+
+
+def _create_shared_memory(size: int):
+    from multiprocessing import shared_memory
+    return shared_memory.SharedMemory(create=True, size=max(size, 1))
+
+
+def _release_shared_memory(memory):
+    memory.close()
+    memory.unlink()
+
+
+# Runs in the main process, converts shared memory handles back to regular arrays and releases the shared memory
+def load_result(result):
+    if isinstance(result, SharedMemoryArray):
+        import numpy
+        from multiprocessing import shared_memory
+        memory = shared_memory.SharedMemory(name=result.name)
+        try:
+            return numpy.ndarray(result.shape, dtype=numpy.dtype(result.dtype), buffer=memory.buf).copy()
+        finally:
+            _release_shared_memory(memory)
+    if isinstance(result, SharedMemoryBytes):
+        from multiprocessing import shared_memory
+        memory = shared_memory.SharedMemory(name=result.name)
+        try:
+            return bytes(memory.buf[:result.size])
+        finally:
+            _release_shared_memory(memory)
+    return result
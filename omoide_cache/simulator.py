@@ -0,0 +1,169 @@
+import heapq
+import argparse
+from array import array
+from collections import OrderedDict
+from typing import Iterable, List, Dict
+from omoide_cache.cache import ExpireMode
+from omoide_cache.trace import read_trace
+
+
+# Offline hit rate simulator, replays a recorded trace of key hashes against each size expire mode of the Cache
+# Each simulation mirrors what Cache does when max_allowed_size is exceeded, in O(log n) or better per access
+# Time based expiry and refresh are not simulated, only eviction by size
+
+
+# ExpireMode.ACCESSED_TIME_BASED - drop the key that was accessed the longest time ago
+class LruSimulation:
+    def __init__(self, max_allowed_size: int):
+        self.max_allowed_size = max_allowed_size
+        self.keys = OrderedDict()
+
+    def access(self, key) -> bool:
+        if key in self.keys:
+            self.keys.move_to_end(key)
+            return True
+        self.keys[key] = None
+        if len(self.keys) > self.max_allowed_size:
+            self.keys.popitem(last=False)
+        return False
+
+    def resize(self, max_allowed_size: int):
+        self.max_allowed_size = max_allowed_size
+        while len(self.keys) > self.max_allowed_size:
+            self.keys.popitem(last=False)
+
+
+# ExpireMode.COMPUTED_TIME_BASED - drop the key that was computed the longest time ago
+class FifoSimulation:
+    def __init__(self, max_allowed_size: int):
+        self.max_allowed_size = max_allowed_size
+        self.keys = OrderedDict()
+
+    def access(self, key) -> bool:
+        if key in self.keys:
+            return True
+        self.keys[key] = None
+        if len(self.keys) > self.max_allowed_size:
+            self.keys.popitem(last=False)
+        return False
+
+    def resize(self, max_allowed_size: int):
+        self.max_allowed_size = max_allowed_size
+        while len(self.keys) > self.max_allowed_size:
+            self.keys.popitem(last=False)
+
+
+# ExpireMode.ACCESS_COUNT_BASED - drop the least accessed key (other than the one just accessed), ties go to the key inserted first
+# Heap entries are never updated in place, stale ones are skipped on pop
+class LfuSimulation:
+    def __init__(self, max_allowed_size: int):
+        self.max_allowed_size = max_allowed_size
+        self.counts = {}                                # {key -> (access count, insertion sequence)}
+        self.heap = []
+        self.sequence = 0
+
+    def access(self, key) -> bool:
+        entry = self.counts.get(key)
+        hit = entry is not None
+        if hit:
+            entry = (entry[0] + 1, entry[1])
+        else:
+            self.sequence = self.sequence + 1
+            entry = (1, self.sequence)
+        self.counts[key] = entry
+        heapq.heappush(self.heap, (entry[0], entry[1], key))
+
+        if len(self.counts) > self.max_allowed_size:
+            self._evict(key)
+
+        # Drop stale entries from time to time
+        if len(self.heap) > 4 * self.max_allowed_size + 64:
+            self.heap = [(count, sequence, k) for k, (count, sequence) in self.counts.items()]
+            heapq.heapify(self.heap)
+        return hit
+
+    def resize(self, max_allowed_size: int):
+        self.max_allowed_size = max_allowed_size
+        while len(self.counts) > self.max_allowed_size:
+            self._evict(None)
+
+    def _evict(self, last_accessed_key):
+        skipped = []
+        while True:
+            count, sequence, candidate = heapq.heappop(self.heap)
+            if self.counts.get(candidate) != (count, sequence):
+                continue
+            if candidate == last_accessed_key:
+                skipped.append((count, sequence, candidate))
+                continue
+            self.counts.pop(candidate)
+            break
+        for item in skipped:
+            heapq.heappush(self.heap, item)
+
+
+POLICIES = {
+    ExpireMode.ACCESSED_TIME_BASED: LruSimulation,
+    ExpireMode.COMPUTED_TIME_BASED: FifoSimulation,
+    ExpireMode.ACCESS_COUNT_BASED: LfuSimulation,
+}
+
+
+def load_key_hashes(path: str) -> array:
+    return array('Q', (key_hash for key_hash, timestamp_ns, hit in read_trace(path)))
+
+
+def simulate_hit_rate(key_hashes: Iterable[int], policy: str, max_allowed_size: int) -> float:
+    simulation = POLICIES[policy](max_allowed_size)
+    number_of_accesses = 0
+    number_of_hits = 0
+    for key_hash in key_hashes:
+        number_of_accesses = number_of_accesses + 1
+        if simulation.access(key_hash):
+            number_of_hits = number_of_hits + 1
+    return number_of_hits / float(number_of_accesses) if number_of_accesses > 0 else 0.0
+
+
+# Returns {policy -> {size -> hit rate}}, miss ratio curve is 1 - hit rate
+def simulate(key_hashes, sizes: List[int], policies: List[str] = None) -> Dict[str, Dict[int, float]]:
+    curves = {}
+    for policy in (policies if policies is not None else list(POLICIES)):
+        curves[policy] = {size: simulate_hit_rate(key_hashes, policy, size) for size in sizes}
+    return curves
+
+
+def geometric_sizes(min_size: int, max_size: int, steps: int) -> List[int]:
+    if steps < 2 or max_size <= min_size:
+        return [max_size]
+    ratio = (max_size / float(min_size)) ** (1.0 / (steps - 1))
+    return sorted(set(max(1, int(round(min_size * ratio ** i))) for i in range(0, steps)))
+
+
+def format_curves(curves: Dict[str, Dict[int, float]], width: int = 40) -> str:
+    lines = []
+    for policy, curve in curves.items():
+        lines.append(policy)
+        for size, hit_rate in curve.items():
+            lines.append('  size %8d  hit rate %6.3f  miss ratio %6.3f  %s' % (size, hit_rate, 1.0 - hit_rate, '#' * int(round(hit_rate * width))))
+    return '\n'.join(lines)
+
+
+# Usage: python -m omoide_cache.simulator trace.bin --min-size 10 --max-size 10000 --steps 10
+def main():
+    parser = argparse.ArgumentParser(prog='python -m omoide_cache.simulator', description='Replay a recorded cache trace against every size expire mode')
+    parser.add_argument('trace', help='Trace file written by TraceRecorder')
+    parser.add_argument('--sizes', nargs='+', type=int, help='Explicit list of cache sizes to simulate')
+    parser.add_argument('--min-size', type=int, default=10)
+    parser.add_argument('--max-size', type=int, default=10000)
+    parser.add_argument('--steps', type=int, default=10)
+    parser.add_argument('--policies', nargs='+', choices=list(POLICIES), help='Size expire modes to simulate, all by default')
+    arguments = parser.parse_args()
+
+    key_hashes = load_key_hashes(arguments.trace)
+    sizes = arguments.sizes if arguments.sizes else geometric_sizes(arguments.min_size, arguments.max_size, arguments.steps)
+    print('Replaying ' + str(len(key_hashes)) + ' accesses (' + str(len(set(key_hashes))) + ' distinct keys)')
+    print(format_curves(simulate(key_hashes, sizes, arguments.policies)))
+
+
+if __name__ == '__main__':
+    main()
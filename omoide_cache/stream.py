@@ -0,0 +1,167 @@
+import pickle
+import weakref
+import threading
+from typing import Iterator
+from omoide_cache.freeze import freeze
+
+
+# Generators and other iterators can only be consumed once, so caching them as they are would give exhausted iterators after the first call
+# Instead the cache keeps a RecordedStream, and each call gets its own StreamReader over it
+# Items are pulled from the source lazily, only as far as the furthest reader got, and each pulled item is recorded for the other readers
+# Readers that catch up with the recording wait for the next item (only one of them pulls it from the source), so a partially consumed stream
+# can be read by many callers at once, and the source is never consumed twice
+# Items past spill after items are pickled to a temporary file instead of being kept in memory (items that can't be pickled stay in memory)
+# Streams longer than max items, or whose source raised, are abandoned: they are not replayed to new callers (the cache computes them again),
+# readers that are already reading them still get every item, recorded items are dropped once all readers passed them
+# Streams dropped from the cache are released: they are abandoned too, and their spill file is closed once no reader needs spilled items anymore
+
+
+class _SpilledItem:
+    __slots__ = ('position', 'length')
+
+    def __init__(self, position: int, length: int):
+        self.position = position
+        self.length = length
+
+
+class StreamReader:
+    __slots__ = ('stream', 'position', '__weakref__')
+
+    def __init__(self, stream: 'RecordedStream'):
+        self.stream = stream
+        self.position = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = self.stream._item_at(self.position)
+        self.position = self.position + 1
+        return item
+
+
+class RecordedStream:
+    def __init__(self, source: Iterator, max_items: int = -1, spill_after_items: int = -1, freeze_items: bool = False):
+        self._source = source
+        self.max_items = max_items                      # Leave at -1 to record streams of any length
+        self.spill_after_items = spill_after_items      # Leave at -1 to keep all items in memory
+        self.freeze_items = freeze_items                # Items are shared by all readers, so they can be frozen as results are (see freeze.py)
+
+        self.number_of_items = 0                        # Number of items pulled from the source so far
+        self.number_of_spilled_items = 0
+        self.done = False
+        self.exception = None
+        self.abandoned = False                          # True once the stream can't be replayed from the start to new readers
+
+        self._items = []                                # Recorded items (or _SpilledItem markers), first one has index offset
+        self._offset = 0
+        self._spill_file = None
+        self._spill_size = 0
+        self._last_spilled_index = -1                   # Spill file is needed until the item with this index is dropped
+        self._pulling = False
+        self._readers = weakref.WeakSet()
+        self._condition = threading.Condition()
+
+    # Returns None if the stream was abandoned, checked under the same lock that abandons it, so the caller can compute it again
+    def replay(self) -> StreamReader:
+        with self._condition:
+            if self.abandoned:
+                return None
+            reader = StreamReader(self)
+            self._readers.add(reader)
+            return reader
+
+    # Called by the cache once the stream is dropped from it, readers that are already reading it still get every item
+    def release(self):
+        with self._condition:
+            self.abandoned = True
+            self._drop_passed_items()
+
+    def _item_at(self, index: int):
+        with self._condition:
+            if self.abandoned:
+                self._drop_passed_items()
+            while True:
+                if index < self.number_of_items:
+                    return self._recorded_item(index)
+                if self.done:
+                    if self.exception is not None:
+                        raise self.exception
+                    raise StopIteration
+                if not self._pulling:
+                    self._pulling = True
+                    break
+                self._condition.wait()
+
+        # Next item is pulled outside of the lock, so other readers can read recorded items meanwhile
+        try:
+            item = next(self._source)
+        except StopIteration:
+            self._finish(None)
+            raise
+        except BaseException as exception:
+            self._finish(exception)
+            raise
+        if self.freeze_items:
+            item = freeze(item)
+        self._record(item)
+        return item
+
+    def _recorded_item(self, index: int):
+        item = self._items[index - self._offset]
+        if type(item) is _SpilledItem:
+            self._spill_file.seek(item.position)
+            return pickle.loads(self._spill_file.read(item.length))
+        return item
+
+    def _record(self, item):
+        with self._condition:
+            if self.max_items >= 0 and self.number_of_items >= self.max_items:
+                self.abandoned = True
+            if not self.abandoned and 0 <= self.spill_after_items <= self.number_of_items:
+                item = self._spill(item)
+            self._items.append(item)
+            self.number_of_items = self.number_of_items + 1
+            if self.abandoned:
+                self._drop_passed_items()
+            self._pulling = False
+            self._condition.notify_all()
+
+    def _spill(self, item):
+        try:
+            data = pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            return item
+        if self._spill_file is None:
+            import tempfile
+            self._spill_file = tempfile.TemporaryFile(prefix='omoide_cache-stream-')
+            # Streams that are never released (e.g. still stored when their cache is garbage collected) close the file when they are collected
+            weakref.finalize(self, self._spill_file.close)
+        self._spill_file.seek(self._spill_size)
+        self._spill_file.write(data)
+        spilled_item = _SpilledItem(self._spill_size, len(data))
+        self._spill_size = self._spill_size + len(data)
+        self._last_spilled_index = self.number_of_items
+        self.number_of_spilled_items = self.number_of_spilled_items + 1
+        return spilled_item
+
+    # Only readers that are already reading an abandoned stream can get its items, so the ones all of them passed are not needed anymore
+    def _drop_passed_items(self):
+        first_needed_index = min((reader.position for reader in self._readers), default=self.number_of_items)
+        if first_needed_index > self._offset:
+            del self._items[:first_needed_index - self._offset]
+            self._offset = first_needed_index
+        # Abandoned streams don't spill anymore, so the file is not needed once all spilled items were dropped
+        if self._spill_file is not None and self._offset > self._last_spilled_index:
+            self._spill_file.close()
+            self._spill_file = None
+
+    def _finish(self, exception: BaseException):
+        with self._condition:
+            self.done = True
+            self.exception = exception
+            if exception is not None:
+                self.abandoned = True
+            self._source = None
+            self._pulling = False
+            self._condition.notify_all()
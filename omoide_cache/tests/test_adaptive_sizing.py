@@ -0,0 +1,45 @@
+from omoide_cache.cache import Cache, ExpireMode
+from omoide_cache.benchmarks.workloads import Workload, build_workload
+
+
+def call(x: float) -> float:
+    return x * x
+
+
+def test_grows_when_working_set_does_not_fit():
+    # Uniform access over 500 keys, starting at 10 - more space always helps
+    cache = Cache(call, max_allowed_size=10, size_expire_mode=ExpireMode.ACCESSED_TIME_BASED, adaptive_min_size=10, adaptive_max_size=600)
+    for operation, key in build_workload(Workload.UNIFORM, 500, 30000, seed=1):
+        cache.get([key])
+    assert cache.max_allowed_size > 300
+    assert len(cache.results_map) <= cache.max_allowed_size
+
+
+def test_shrinks_when_space_is_wasted():
+    # Only 20 hot keys, starting at 400 - extra space gives nothing
+    cache = Cache(call, max_allowed_size=400, size_expire_mode=ExpireMode.ACCESS_COUNT_BASED, adaptive_min_size=5, adaptive_max_size=400)
+    for operation, key in build_workload(Workload.UNIFORM, 20, 20000, seed=2):
+        cache.get([key])
+    assert 20 <= cache.max_allowed_size < 100
+
+
+def test_memory_budget_limits_size():
+    cache = Cache(call, max_allowed_size=10, size_expire_mode=ExpireMode.ACCESSED_TIME_BASED, adaptive_min_size=10, adaptive_max_size=1000, adaptive_memory_budget_bytes=50000)
+    for operation, key in build_workload(Workload.UNIFORM, 1000, 30000, seed=3):
+        cache.get([key])
+    assert cache.max_allowed_size * cache.adaptive_sizer.bytes_per_entry <= 50000 * 1.25
+    assert cache.max_allowed_size >= 10
+
+
+def test_bounds_are_validated():
+    try:
+        Cache(call, adaptive_min_size=50, adaptive_max_size=10)
+        assert False
+    except RuntimeError:
+        pass
+
+
+test_grows_when_working_set_does_not_fit()
+test_shrinks_when_space_is_wasted()
+test_memory_budget_limits_size()
+test_bounds_are_validated()
@@ -0,0 +1,160 @@
+import gc
+import weakref
+from omoide_cache.cache import Cache, RefreshMode
+from omoide_cache.clock import ManualClock
+from omoide_cache.arguments_retention import ArgumentsRetention
+from omoide_cache.cache_decorator import omoide_cache
+
+
+class Document:
+    def __init__(self, document_id: int, text: str):
+        self.document_id = document_id
+        self.text = text
+
+
+class SlottedDocument:
+    __slots__ = ('document_id', 'text')
+
+    def __init__(self, document_id: int, text: str):
+        self.document_id = document_id
+        self.text = text
+
+
+def count_words(document: Document) -> int:
+    return len(document.text.split())
+
+
+documents = {}
+
+
+def load_document(dumped_arguments):
+    document = documents.get(dumped_arguments)
+    return ((document,), {}) if document is not None else None
+
+
+class ExampleService:
+    @omoide_cache()
+    def costly_method(self, number: int) -> int:
+        return number * number
+
+
+def test_no_retention_without_refresh():
+    cache = Cache(count_words)
+    document = Document(1, 'a b c')
+    assert cache.get([document]) == 3
+    assert cache.arguments_map == {}
+    assert cache.arguments_retention == ArgumentsRetention.NONE
+
+    # Nothing else keeps the document alive
+    document_reference = weakref.ref(document)
+    del document
+    gc.collect()
+    assert document_reference() is None
+
+    # Invalidation by arguments needs retention
+    failed = False
+    try:
+        cache.invalidate_where(lambda positional_arguments, keyword_arguments: True)
+    except RuntimeError:
+        failed = True
+    assert failed
+
+    # Weak retention is opted into for it, and doesn't keep the document alive either
+    cache = Cache(count_words, arguments_retention=ArgumentsRetention.WEAK)
+    document = Document(1, 'a b c')
+    assert cache.get([document]) == 3
+    assert cache.invalidate_where(lambda positional_arguments, keyword_arguments: positional_arguments[0].document_id == 1) == 1
+
+    # Expire by size still works
+    cache = Cache(count_words, max_allowed_size=2)
+    for i in range(0, 5):
+        cache.get([Document(i, 'a ' * i)])
+    assert len(cache.results_map) == 2
+
+    # Refresh needs the arguments
+    failed = False
+    try:
+        Cache(count_words, refresh_duration_s=1, arguments_retention=ArgumentsRetention.NONE)
+    except RuntimeError:
+        failed = True
+    assert failed
+
+
+# Documents have the default repr, so they are fingerprinted by address, which a new document can get once the old one is gone
+def test_temporary_arguments_get_their_own_results():
+    cache = Cache(count_words)
+    assert [cache.get([Document(i, 'a ' * i)]) for i in range(0, 5)] == [0, 1, 2, 3, 4]
+
+    # Also when nested in other arguments, and the key of a collected document never matches a new one
+    cache = Cache(lambda documents: sum(count_words(document) for document in documents), arguments_retention=ArgumentsRetention.NONE)
+    assert [cache.get([[Document(i, 'a ' * i)]]) for i in range(0, 5)] == [0, 1, 2, 3, 4]
+    document = Document(7, 'a b')
+    assert cache.get([[document]]) == 2
+    del document
+    gc.collect()
+    assert not any(cache.is_cached([[Document(8, 'a')]]) for _ in range(0, 10))
+
+    # Objects that can't be weakly referenced are kept alive while their key is cached
+    cache = Cache(count_words, max_allowed_size=2)
+    assert [cache.get([SlottedDocument(i, 'a ' * i)]) for i in range(0, 5)] == [0, 1, 2, 3, 4]
+    assert len(cache.address_arguments_map) == 2
+
+
+def test_decorator_releases_self():
+    service = ExampleService()
+    assert service.costly_method(3) == 9
+    service_reference = weakref.ref(service)
+    del service
+    gc.collect()
+    assert service_reference() is None
+
+
+def test_weak_retention_drops_dead_keys_on_refresh():
+    clock = ManualClock()
+    cache = Cache(count_words, refresh_duration_s=1, refresh_mode=RefreshMode.COUPLED, arguments_retention=ArgumentsRetention.WEAK, clock=clock)
+    alive_document = Document(1, 'a b')
+    dead_document = Document(2, 'a b c')
+    assert cache.get([alive_document]) == 2
+    assert cache.get([dead_document]) == 3
+    assert cache.invalidate_where(lambda positional_arguments, keyword_arguments: positional_arguments[0].document_id == 5) == 0
+
+    del dead_document
+    gc.collect()
+    alive_document.text = 'a b c d'
+    clock.advance(2)
+    cache._refresh()
+    assert len(cache.results_map) == 1
+    assert cache.get([alive_document]) == 4
+
+
+def test_compact_retention():
+    clock = ManualClock()
+    cache = Cache(count_words, refresh_duration_s=1, refresh_mode=RefreshMode.COUPLED, arguments_retention=ArgumentsRetention.COMPACT,
+                  arguments_dumper=lambda positional_arguments, keyword_arguments: positional_arguments[0].document_id,
+                  arguments_loader=load_document, clock=clock)
+    documents[1] = Document(1, 'a b')
+    documents[2] = Document(2, 'a b c')
+    assert cache.get([documents[1]]) == 2
+    assert cache.get([documents[2]]) == 3
+    assert cache.arguments_map[cache._build_key([documents[1]], {})] == 1
+
+    documents[1].text = 'a'
+    documents.pop(2)
+    clock.advance(2)
+    cache._refresh()
+    assert len(cache.results_map) == 1
+    assert cache.get([documents[1]]) == 1
+
+    failed = False
+    try:
+        Cache(count_words, arguments_retention=ArgumentsRetention.COMPACT)
+    except RuntimeError:
+        failed = True
+    assert failed
+
+
+test_no_retention_without_refresh()
+test_temporary_arguments_get_their_own_results()
+test_decorator_releases_self()
+test_weak_retention_drops_dead_keys_on_refresh()
+test_compact_retention()
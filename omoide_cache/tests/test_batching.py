@@ -0,0 +1,100 @@
+import threading
+from omoide_cache.cache import Cache
+from omoide_cache.cache_decorator import omoide_cache
+
+
+batch_sizes = []
+
+
+def square(x: int) -> int:
+    return x * x
+
+
+def square_batch(arguments_list):
+    batch_sizes.append(len(arguments_list))
+    return [positional_arguments[0] * positional_arguments[0] for positional_arguments, keyword_arguments in arguments_list]
+
+
+def failing_batch(arguments_list):
+    raise ValueError('Backend is down')
+
+
+def run_concurrently(get, keys):
+    results = {}
+    barrier = threading.Barrier(len(keys))
+
+    def run(index: int, key):
+        barrier.wait()
+        results[index] = get(key)
+
+    threads = [threading.Thread(target=run, args=[index, key]) for index, key in enumerate(keys)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [results[index] for index in range(0, len(keys))]
+
+
+def test_misses_are_batched():
+    batch_sizes.clear()
+    cache = Cache(square, batch_call_to_execute=square_batch, batch_window_ms=200, batch_max_size=100)
+    keys = list(range(0, 20))
+    assert run_concurrently(lambda x: cache.get([x]), keys) == [x * x for x in keys]
+    assert sum(batch_sizes) == 20
+    assert len(batch_sizes) < 5
+    assert len(cache.results_map) == 20
+
+    # Hits never reach the batch
+    assert cache.get([3]) == 9
+    assert sum(batch_sizes) == 20
+
+
+def test_same_key_coalesced_and_max_size():
+    batch_sizes.clear()
+    cache = Cache(square, batch_call_to_execute=square_batch, batch_window_ms=200, batch_max_size=5)
+    keys = [x % 10 for x in range(0, 30)]
+    assert run_concurrently(lambda x: cache.get([x]), keys) == [x * x for x in keys]
+    assert sum(batch_sizes) <= 30
+    assert max(batch_sizes) <= 5
+    assert len(cache.results_map) == 10
+
+
+def test_batch_failure_reaches_every_caller():
+    cache = Cache(square, batch_call_to_execute=failing_batch, batch_window_ms=50)
+    errors = []
+
+    def get(x):
+        try:
+            return cache.get([x])
+        except ValueError as error:
+            errors.append(error)
+
+    run_concurrently(get, [1, 2, 3])
+    assert len(errors) == 3
+    assert len(cache.results_map) == 0
+
+
+# Object is the first positional argument of each call
+def square_method_batch(arguments_list):
+    return square_batch([(positional_arguments[1:], keyword_arguments) for positional_arguments, keyword_arguments in arguments_list])
+
+
+class BatchService:
+    @omoide_cache(batch_call_to_execute=square_method_batch, batch_window_ms=1)
+    def square(self, x: int) -> int:
+        return x * x
+
+
+def test_batching_through_decorator():
+    batch_sizes.clear()
+    service = BatchService()
+    assert service.square(4) == 16
+    assert service.square(4) == 16
+    assert batch_sizes == [1]
+    assert service.square.cache.miss_batcher.number_of_batches == 1
+
+
+test_misses_are_batched()
+test_same_key_coalesced_and_max_size()
+test_batch_failure_reaches_every_caller()
+test_batching_through_decorator()
@@ -0,0 +1,74 @@
+import threading
+from omoide_cache.cache import ExpireMode, RefreshMode
+from omoide_cache.benchmarks.benchmark import BenchmarkClock, BenchmarkConfig, Target, build_configs, run_benchmark, run_suite, compare_results
+from omoide_cache.benchmarks.workloads import Workload, READ, WRITE, build_workload
+
+
+def test_workloads_are_reproducible():
+    for workload in Workload.ALL:
+        operations = build_workload(workload, 100, 500, seed=1)
+        assert len(operations) == 500
+        assert operations == build_workload(workload, 100, 500, seed=1)
+        assert all(0 <= key < 100 for operation, key in operations)
+
+    # Zipfian is skewed towards the first keys, mixed contains writes
+    zipfian_keys = [key for operation, key in build_workload(Workload.ZIPFIAN, 100, 1000)]
+    assert zipfian_keys.count(0) > zipfian_keys.count(50) * 5
+    assert all(operation == READ for operation, key in build_workload(Workload.UNIFORM, 100, 100))
+    assert any(operation == WRITE for operation, key in build_workload(Workload.MIXED, 100, 100))
+
+
+def test_run_benchmark():
+    for target in [Target.CACHE, Target.DECORATOR]:
+        config = BenchmarkConfig(workload=Workload.ZIPFIAN, number_of_threads=2, max_allowed_size=20, size_expire_mode=ExpireMode.ACCESSED_TIME_BASED,
+                                 refresh_mode=RefreshMode.INDEPENDENT, number_of_keys=100, number_of_operations=300, target=target)
+        result = run_benchmark(config)
+        assert result['name'] == config.name()
+        assert result['ops_per_s'] > 0
+        assert result['p99_latency_us'] >= result['p50_latency_us'] > 0
+        assert 0.0 < result['hit_rate'] < 1.0
+        assert result['bytes_per_entry'] > 0
+
+
+def test_benchmark_clock():
+    # No tick is lost when threads tick at once
+    clock = BenchmarkClock(0.001)
+    threads = [threading.Thread(target=lambda: [clock.tick() for i in range(0, 1000)]) for i in range(0, 4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert clock.time_ns() == 4000 * 1000000
+
+    # Background work doesn't block the caller, scheduled work starts once its time has come
+    started = threading.Event()
+    release = threading.Event()
+    clock.call_soon(lambda: (started.set(), release.wait(5)))
+    assert started.wait(5)
+    scheduled = threading.Event()
+    clock.call_later(0.0015, scheduled.set)
+    clock.tick()
+    assert not scheduled.is_set()
+    clock.tick()
+    assert scheduled.wait(5)
+    release.set()
+    clock.join()
+
+
+def test_compare_results():
+    configs = build_configs(workloads=[Workload.UNIFORM], thread_counts=[1], sizes=[10], number_of_keys=50, number_of_operations=100, targets=[Target.CACHE])
+    assert len(configs) == 9
+    baseline = run_suite(configs[:2])
+
+    # Same run matches itself, slower run is reported
+    rows = compare_results(baseline, baseline)
+    assert len(rows) == 2
+    assert not any(row['regressed'] for row in rows)
+    slower = {'results': [dict(result, ops_per_s=result['ops_per_s'] / 2) for result in baseline['results']]}
+    assert all(row['regressed'] for row in compare_results(baseline, slower))
+
+
+test_workloads_are_reproducible()
+test_run_benchmark()
+test_benchmark_clock()
+test_compare_results()
@@ -0,0 +1,99 @@
+import os
+import sys
+import subprocess
+import omoide_cache.cache as cache_module
+from omoide_cache.cache import Cache, ExpireMode, RefreshMode
+from omoide_cache.cache_config import CacheConfig
+from omoide_cache.cache_decorator import omoide_cache
+from omoide_cache.tiered_cache import TierMode
+from omoide_cache.clock import ManualClock
+from omoide_cache.observers import RecordingObserver
+
+
+def raises_on_decoration(**decorator_arguments) -> bool:
+    try:
+        @omoide_cache(**decorator_arguments)
+        def square(x: int) -> int:
+            return x * x
+    except RuntimeError:
+        return True
+    return False
+
+
+def test_wrong_settings_fail_when_decorator_is_applied():
+    assert raises_on_decoration(refresh_duration_s=1, refresh_mode=RefreshMode.INDEPENDENT)
+    assert raises_on_decoration(refresh_duration_s=1, refresh_mode=RefreshMode.INDEPENDENT, refresh_period_s=0)
+    assert raises_on_decoration(refresh_duration_s=1, refresh_mode=RefreshMode.NONE)
+    assert raises_on_decoration(size_expire_mode=ExpireMode.NONE)
+    assert raises_on_decoration(max_allowed_size=0)
+    assert raises_on_decoration(adaptive_min_size=50, adaptive_max_size=10)
+    assert raises_on_decoration(batch_call_to_execute=lambda calls: [], batch_max_size=0)
+    assert raises_on_decoration(l1_max_allowed_size=10, tier_mode=TierMode.EXCLUSIVE, refresh_duration_s=1)
+    assert not raises_on_decoration(refresh_duration_s=1, refresh_mode=RefreshMode.INDEPENDENT, refresh_period_s=1)
+
+
+def test_caches_built_from_one_config():
+    clock = ManualClock()
+    config = CacheConfig(max_allowed_size=2, size_expire_mode=ExpireMode.ACCESSED_TIME_BASED, clock=clock)
+    first = Cache.from_config(lambda x: x * 2, config)
+    second = Cache.from_config(lambda x: x * 3, config)
+    assert first.get([1]) == 2
+    assert second.get([1]) == 3
+
+    # Least recently accessed key goes first
+    clock.advance(1)
+    first.get([2])
+    clock.advance(1)
+    first.get([1])
+    clock.advance(1)
+    first.get([3])
+    assert first.is_cached([1]) and first.is_cached([3]) and not first.is_cached([2])
+
+    # Settings of a config are only checked once, when it is created
+    validated_settings = []
+    original_validate_cache_settings = cache_module.validate_cache_settings
+    cache_module.validate_cache_settings = lambda **settings: validated_settings.append(settings)
+    try:
+        Cache.from_config(lambda x: x, config)
+        Cache(lambda x: x)
+    finally:
+        cache_module.validate_cache_settings = original_validate_cache_settings
+    assert len(validated_settings) == 1
+
+    failed = False
+    try:
+        CacheConfig(ttl_jitter_ratio=1)
+    except RuntimeError:
+        failed = True
+    assert failed
+
+
+def test_get_is_picked_for_enabled_features():
+    assert Cache(lambda x: x)._plain_get_enabled
+    assert Cache(lambda x: x, refresh_duration_s=1, refresh_mode=RefreshMode.INDEPENDENT, refresh_period_s=1, clock=ManualClock())._plain_get_enabled
+    assert not Cache(lambda x: x, expire_by_access_duration_s=10)._plain_get_enabled
+    assert not Cache(lambda x: x, refresh_duration_s=1, clock=ManualClock())._plain_get_enabled
+    assert type(Cache(lambda x: x)) is Cache
+
+    # Both paths keep the size and notify observers, including ones added later
+    observer = RecordingObserver()
+    cache = Cache(lambda x: x * 2, max_allowed_size=2)
+    cache.observers.append(observer)
+    assert [cache.get([x]) for x in [1, 1, 2, 3]] == [2, 2, 4, 6]
+    assert len(cache.results_map) == 2
+    assert cache.is_cached([1])
+    assert [event[0] for event in observer.events].count('hit') == 1
+    assert [event[0] for event in observer.events].count('evict') == 1
+
+
+def test_import_skips_optional_modules():
+    code = 'import sys, omoide_cache; print(" ".join(name for name in ("multiprocessing", "socket", "inspect") if name in sys.modules))'
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(sys.modules['omoide_cache'].__file__)))
+    output = subprocess.run([sys.executable, '-c', code], cwd=package_root, capture_output=True, text=True, check=True).stdout
+    assert output.strip() == ''
+
+
+test_wrong_settings_fail_when_decorator_is_applied()
+test_caches_built_from_one_config()
+test_get_is_picked_for_enabled_features()
+test_import_skips_optional_modules()
@@ -0,0 +1,108 @@
+import tracemalloc
+from omoide_cache.cache import Cache, ExpireMode
+from omoide_cache.clock import ManualClock
+from omoide_cache.compact_storage import ResultStorage
+from omoide_cache.arguments_retention import ArgumentsRetention
+from omoide_cache.cache_decorator import omoide_cache
+
+
+def square(x: float) -> float:
+    return x * x
+
+
+def to_bytes(x: int) -> bytes:
+    return b'v' * x
+
+
+def test_compact_same_hits_as_object():
+    for size_expire_mode in [ExpireMode.ACCESSED_TIME_BASED, ExpireMode.COMPUTED_TIME_BASED, ExpireMode.ACCESS_COUNT_BASED]:
+        hits = []
+        for result_storage in [ResultStorage.OBJECT, ResultStorage.FLOAT]:
+            clock = ManualClock()
+            cache = Cache(square, max_allowed_size=20, size_expire_mode=size_expire_mode, result_storage=result_storage, clock=clock)
+            number_of_hits = 0
+            for i in range(0, 2000):
+                clock.advance(0.001)
+                x = (i * 7919) % 31 + (i % 3) * (i % 17)
+                if cache.is_cached([x]):
+                    number_of_hits = number_of_hits + 1
+                assert cache.get([x]) == float(x * x)
+                assert len(cache.results_map) <= 20
+            hits.append(number_of_hits)
+        assert hits[0] == hits[1]
+
+
+def test_compact_slots_reused():
+    cache = Cache(square, max_allowed_size=10, size_expire_mode=ExpireMode.ACCESSED_TIME_BASED, result_storage=ResultStorage.INT, arguments_retention=ArgumentsRetention.STRONG)
+    for x in range(0, 1000):
+        assert cache.get([x]) == x * x
+    assert cache.results_map.capacity <= 11
+    assert len(cache.results_map) == 10
+    assert cache.get([999]) == 999 * 999
+
+    assert cache.invalidate([999]) == 1
+    assert not cache.is_cached([999])
+    assert cache.invalidate_where(lambda positional_arguments, keyword_arguments: positional_arguments[0] > 995) == 3
+    assert len(cache.last_accessed_map) == 6
+    assert cache.clear() == 6
+    assert cache.get([3]) == 9
+    assert cache.access_counter_map[cache._build_key([3], {})] == 1
+
+
+def test_compact_bytes():
+    cache = Cache(to_bytes, max_allowed_size=100, result_storage=ResultStorage.BYTES, compact_bytes_width=8)
+    for x in range(0, 20):
+        assert cache.get([x]) == b'v' * x
+    for x in range(0, 20):
+        assert cache.get([x]) == b'v' * x
+    assert len(cache.results_map.bytes_overflow) == 11
+
+    # Wrong type of result
+    failed = False
+    try:
+        Cache(square, result_storage=ResultStorage.BYTES).get([2])
+    except TypeError:
+        failed = True
+    assert failed
+
+
+def test_compact_memory_per_entry():
+    cache = Cache(square, max_allowed_size=100000, result_storage=ResultStorage.FLOAT, arguments_retention=ArgumentsRetention.NONE)
+    cache.get([0])
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        for x in range(1, 20001):
+            cache.get([x])
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    assert (after - before) / 20000 < 100
+
+    # Index keeps finding keys after many drops and inserts
+    for x in range(1, 20001, 2):
+        cache.invalidate([x])
+    for x in range(20001, 30001):
+        cache.get([x])
+    assert len(cache.results_map) == 20001
+    assert all(cache.is_cached([x]) == (x % 2 == 0 or x > 20000) for x in range(0, 30001))
+
+
+class CompactService:
+    @omoide_cache(result_storage=ResultStorage.FLOAT)
+    def similarity(self, a: str, b: str) -> float:
+        return len(set(a) & set(b)) / float(len(set(a) | set(b)))
+
+
+def test_compact_decorator():
+    service = CompactService()
+    assert service.similarity('abc', 'abd') == 0.5
+    assert service.similarity('abc', 'abd') == 0.5
+    assert isinstance(service.similarity.cache.results_map[service.similarity.cache._build_key((service, 'abc', 'abd'), {})], float)
+
+
+test_compact_same_hits_as_object()
+test_compact_slots_reused()
+test_compact_bytes()
+test_compact_memory_per_entry()
+test_compact_decorator()
@@ -0,0 +1,202 @@
+import os
+import tempfile
+import importlib.util
+import pytest
+from omoide_cache.cache import Cache
+from omoide_cache.cache_decorator import omoide_cache
+from omoide_cache.disk_cache import DiskCache
+from omoide_cache.fingerprint import Fingerprinter
+from omoide_cache.arguments_retention import ArgumentsRetention
+
+
+number_of_calls = []
+
+
+def triple(x: int) -> int:
+    number_of_calls.append(x)
+    return x * 3
+
+
+def test_results_survive_restart():
+    number_of_calls.clear()
+    with tempfile.TemporaryDirectory() as directory:
+        # Decorated functions created again stand for the next run of the program
+        @omoide_cache(persist_dir=directory)
+        def square(x: int) -> int:
+            number_of_calls.append(x)
+            return [x * x]
+
+        assert square(3) == [9]
+        assert square(3) == [9]
+        assert square.cache.disk_cache.number_of_entries() == 1
+        assert number_of_calls == [3]
+
+        @omoide_cache(persist_dir=directory)
+        def square(x: int) -> int:
+            number_of_calls.append(x)
+            return [x * x]
+
+        assert square(3) == [9]
+        assert number_of_calls == [3]
+
+        # Edited function doesn't see results of the old one
+        @omoide_cache(persist_dir=directory)
+        def square(x: int) -> int:
+            number_of_calls.append(x)
+            return [x ** 2]
+
+        assert square(3) == [9]
+        assert number_of_calls == [3, 3]
+        assert square.cache.disk_cache.number_of_entries() == 2
+
+        # Invalidation drops the persisted result too
+        square.invalidate(3)
+        assert square(3) == [9]
+        assert number_of_calls == [3, 3, 3]
+
+
+def test_methods_share_results_on_disk_only_if_asked():
+    number_of_calls.clear()
+    with tempfile.TemporaryDirectory() as directory:
+        class Service:
+            def __init__(self, factor: int):
+                self.factor = factor
+
+            @omoide_cache(persist_dir=directory)
+            def multiply(self, x: int) -> int:
+                number_of_calls.append(x)
+                return x * self.factor
+
+            @omoide_cache(persist_dir=directory, persist_ignore_self=True)
+            def triple(self, x: int) -> int:
+                number_of_calls.append(x)
+                return x * 3
+
+        # Object is fingerprinted by identity, so its results are not persisted
+        assert Service(2).multiply(2) == 4
+        assert Service(3).multiply(2) == 6
+        assert number_of_calls == [2, 2]
+
+        assert Service(2).triple(2) == 6
+        assert Service(3).triple(2) == 6
+        assert number_of_calls == [2, 2, 2]
+
+
+class Dataset:
+    def __init__(self, name: str):
+        self.name = name
+
+
+def test_identity_arguments_are_not_persisted():
+    number_of_calls.clear()
+    with tempfile.TemporaryDirectory() as directory:
+        @omoide_cache(persist_dir=directory)
+        def count(dataset: Dataset) -> int:
+            number_of_calls.append(dataset.name)
+            return len(dataset.name)
+
+        dataset = Dataset('train')
+        assert count(dataset) == 5
+        assert count.cache.disk_cache.build_key((dataset,), {}) is None
+        assert count.cache.disk_cache.number_of_entries() == 0
+        count.invalidate(dataset)
+        assert count(dataset) == 5
+
+        # With a handler the dataset gets the same key in each run
+        fingerprinter = Fingerprinter()
+        fingerprinter.register(Dataset, lambda fingerprinter, dataset, update: fingerprinter.update(dataset.name, update))
+
+        @omoide_cache(persist_dir=directory, fingerprinter=fingerprinter)
+        def count(dataset: Dataset) -> int:
+            number_of_calls.append(dataset.name)
+            return len(dataset.name)
+
+        assert count(Dataset('test')) == 4
+        assert count.cache.disk_cache.number_of_entries() == 1
+        assert number_of_calls == ['train', 'train', 'test']
+
+
+def test_every_invalidation_reaches_disk():
+    values = {}
+    with tempfile.TemporaryDirectory() as directory:
+        cache = Cache(lambda x: values.get(x, 0), tag_fn=lambda positional_arguments, keyword_arguments: ['t'],
+                      arguments_retention=ArgumentsRetention.STRONG, disk_cache=DiskCache(directory, triple))
+        for x in range(0, 3):
+            assert cache.get([x]) == 0
+        values.update({0: 1, 1: 1, 2: 1})
+
+        assert cache.invalidate_by_tag('t') == 3
+        assert cache.get([0]) == 1
+        values[0] = 2
+        assert cache.invalidate_where(lambda positional_arguments, keyword_arguments: positional_arguments[0] == 0) == 1
+        assert cache.get([0]) == 2
+
+        # Invalidation from another process
+        values[0] = 3
+        assert cache._invalidate_keys_computed_before([cache._build_key([0], {})], cache.clock.time_ns() + 1) == 1
+        assert cache.get([0]) == 3
+
+        # Results that were not invalidated stay persisted
+        assert cache.get([1]) == 1
+        assert Cache(lambda x: values.get(x, 0) + 100, disk_cache=DiskCache(directory, triple), max_allowed_size=1).get([1]) == 1
+
+
+def test_eviction_by_total_bytes():
+    with tempfile.TemporaryDirectory() as directory:
+        disk_cache = DiskCache(directory, triple, max_bytes=3500)
+        keys = {name: disk_cache.build_key([name], {}) for name in ['a', 'b', 'c', 'd', 'e']}
+        for name in ['a', 'b', 'c']:
+            disk_cache.store(keys[name], name * 1000)
+        assert disk_cache.load(keys['a']) == 'a' * 1000
+        disk_cache.store(keys['d'], 'd' * 1000)
+        assert disk_cache.total_bytes() <= 3500
+        assert disk_cache.load(keys['b']) is None
+        assert disk_cache.load(keys['a']) == 'a' * 1000
+
+        # Last use is kept between runs, and results of older code go first
+        old_version = DiskCache(directory, triple, max_bytes=3500)
+        old_version.code_hash = 'old'
+        old_version.store(old_version.build_key([1], {}), 'x')
+        reopened = DiskCache(directory, triple, max_bytes=3500)
+        reopened.store(keys['e'], 'e' * 1000)
+        assert reopened.load(old_version.build_key([1], {})) is None
+        assert reopened.load(keys['c']) is None
+        assert reopened.load(keys['a']) == 'a' * 1000
+        assert reopened.load(keys['e']) == 'e' * 1000
+
+
+def test_broken_and_unpicklable_results():
+    number_of_calls.clear()
+    with tempfile.TemporaryDirectory() as directory:
+        disk_cache = DiskCache(directory, triple)
+        cache = Cache(triple, disk_cache=disk_cache)
+        assert cache.get([1]) == 3
+        key = disk_cache.build_key([1], {})
+        with open(os.path.join(disk_cache.directory, key + '.pkl'), 'wb') as file:
+            file.write(b'broken')
+        assert Cache(triple, disk_cache=DiskCache(directory, triple)).get([1]) == 3
+        assert number_of_calls == [1, 1]
+
+        disk_cache.store('lambda', lambda: 1)
+        assert disk_cache.load('lambda') is None
+
+
+def test_numpy_arrays_are_memory_mapped():
+    numpy = pytest.importorskip('numpy')
+    with tempfile.TemporaryDirectory() as directory:
+        disk_cache = DiskCache(directory, triple)
+        disk_cache.store('array', numpy.arange(1000.0))
+        loaded = disk_cache.load('array')
+        assert isinstance(loaded, numpy.memmap)
+        assert not loaded.flags.writeable
+        assert loaded[999] == 999.0
+
+
+test_results_survive_restart()
+test_methods_share_results_on_disk_only_if_asked()
+test_identity_arguments_are_not_persisted()
+test_every_invalidation_reaches_disk()
+test_eviction_by_total_bytes()
+test_broken_and_unpicklable_results()
+if importlib.util.find_spec('numpy') is not None:
+    test_numpy_arrays_are_memory_mapped()
@@ -0,0 +1,87 @@
+from omoide_cache.cache import Cache, RefreshMode
+from omoide_cache.clock import ManualClock
+from omoide_cache.observers import RecordingObserver
+
+
+number_of_calls = []
+
+
+def call(x: int) -> int:
+    number_of_calls.append(x)
+    return x * x
+
+
+# Returns number of refreshed keys for each second, for 100 keys warmed at once and refreshed every 10 seconds
+def refreshes_per_second(early_refresh_beta: float, ttl_jitter_ratio: float, simulated_compute_duration_s: float):
+    observer = RecordingObserver()
+    clock = ManualClock()
+    cache = Cache(call, max_allowed_size=1000, refresh_duration_s=10, refresh_mode=RefreshMode.INDEPENDENT, refresh_period_s=1,
+                  early_refresh_beta=early_refresh_beta, ttl_jitter_ratio=ttl_jitter_ratio, observers=[observer], clock=clock)
+    cache._random.seed(1)
+    cache.warm([x] for x in range(0, 100))
+    for key in cache.results_map:
+        cache.compute_duration_map[key] = int(simulated_compute_duration_s * 1000000000)
+
+    counts = []
+    for second in range(0, 12):
+        observer.clear()
+        clock.advance(1)
+        counts.append(observer.names().count('refresh'))
+    cache.close()
+    return counts
+
+
+def test_synchronized_without_spreading():
+    counts = refreshes_per_second(-1, 0, 0)
+    assert max(counts) == 100
+    assert sum(counts) == 100
+
+
+def test_ttl_jitter_spreads_refreshes():
+    counts = refreshes_per_second(-1, 0.5, 0)
+    assert sum(counts[:10]) == 100
+    assert max(counts) < 30
+    assert sum(counts[:4]) == 0
+
+    # Jitter of a key doesn't change between calls
+    cache = Cache(call, ttl_jitter_ratio=0.5)
+    key = cache._build_key([1], {})
+    assert cache._jittered_duration_ns(key, 1000000) == cache._jittered_duration_ns(key, 1000000)
+    assert 500000 <= cache._jittered_duration_ns(key, 1000000) <= 1000000
+
+
+def test_early_refresh_spreads_refreshes():
+    counts = refreshes_per_second(1, 0, 2)
+    assert sum(counts[:10]) > 10
+    assert max(counts) < 90
+
+    # Nothing changes for keys that compute instantly
+    assert refreshes_per_second(1, 0, 0)[10] == 100
+
+
+def test_early_expire_in_get():
+    number_of_calls.clear()
+    clock = ManualClock()
+    cache = Cache(call, max_allowed_size=1000, expire_by_computed_duration_s=10, early_refresh_beta=1, clock=clock)
+    cache._random.seed(2)
+    for x in range(0, 100):
+        cache.get([x])
+    for key in cache.results_map:
+        cache.compute_duration_map[key] = 3000000000
+
+    # Some keys are re-computed before they expire, and their compute time is measured again
+    clock.advance(8)
+    for x in range(0, 100):
+        assert cache.get([x]) == x * x
+    recomputed = len(number_of_calls) - 100
+    assert 0 < recomputed < 100
+    assert len([duration for duration in cache.compute_duration_map.values() if duration < 3000000000]) == recomputed
+
+    cache.invalidate([0])
+    assert cache._build_key([0], {}) not in cache.compute_duration_map
+
+
+test_synchronized_without_spreading()
+test_ttl_jitter_spreads_refreshes()
+test_early_refresh_spreads_refreshes()
+test_early_expire_in_get()
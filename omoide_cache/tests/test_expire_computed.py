@@ -1,5 +1,5 @@
-import time
 from omoide_cache.cache import Cache
+from omoide_cache.clock import ManualClock
 
 
 def call(x: float) -> float:
@@ -8,9 +8,10 @@ def call(x: float) -> float:
 
 def test_1():
     expire_period_s = 1
+    clock = ManualClock()
 
     # Create cache
-    cache = Cache(call, expire_by_computed_duration_s=expire_period_s, debug=True)
+    cache = Cache(call, expire_by_computed_duration_s=expire_period_s, clock=clock, debug=True)
 
     # Fill cache with 4 values
     cache.get([1])
@@ -26,7 +27,7 @@ def test_1():
     assert cache._build_key([4], {}) in cache.results_map
 
     # Wait long enought for expiry to kick in
-    time.sleep(2 * expire_period_s)
+    clock.advance(2 * expire_period_s)
 
     # Make sure current len is 4 and all keys are present
     assert len(cache.results_map) == 4
@@ -44,4 +45,4 @@ def test_1():
     assert cache._build_key([3], {}) in cache.results_map
     assert cache._build_key([4], {}) in cache.results_map
 
-test_1()
\ No newline at end of file
+test_1()
@@ -0,0 +1,59 @@
+from omoide_cache.cache import Cache, ExpireMode
+from omoide_cache.clock import ManualClock
+from omoide_cache.benchmarks.workloads import Workload, build_workload
+
+
+def call(x: float) -> float:
+    return x * x
+
+
+def hit_rate(cache: Cache, clock: ManualClock, operations) -> float:
+    hits = 0
+    for operation, key in operations:
+        clock.advance(0.001)
+        if cache.is_cached([key]):
+            hits = hits + 1
+        cache.get([key])
+        assert len(cache.results_map) <= cache.max_allowed_size
+        assert cache.is_cached([key])
+    return hits / float(len(operations))
+
+
+def test_sampled_close_to_exact():
+    operations = build_workload(Workload.ZIPFIAN, 2000, 8000, seed=5)
+    for size_expire_mode in [ExpireMode.ACCESSED_TIME_BASED, ExpireMode.COMPUTED_TIME_BASED, ExpireMode.ACCESS_COUNT_BASED]:
+        clock = ManualClock()
+        exact = hit_rate(Cache(call, max_allowed_size=200, size_expire_mode=size_expire_mode, clock=clock), clock, operations)
+        clock = ManualClock()
+        sampled_cache = Cache(call, max_allowed_size=200, size_expire_mode=size_expire_mode, size_expire_samples=10, clock=clock)
+        sampled = hit_rate(sampled_cache, clock, operations)
+        assert abs(exact - sampled) < 0.03
+        assert len(sampled_cache._eviction_pool) > 0
+
+
+def test_sampled_after_invalidation():
+    cache = Cache(call, max_allowed_size=10, size_expire_mode=ExpireMode.ACCESSED_TIME_BASED, size_expire_samples=3)
+    for x in range(0, 10):
+        cache.get([x])
+    cache.invalidate_many([[x] for x in range(0, 9)])
+
+    # Sampling list still holds dropped keys, they are skipped and eventually compacted
+    for x in range(100, 200):
+        cache.get([x])
+        assert len(cache.results_map) <= 10
+    assert len(cache._sampling_keys) <= 2 * len(cache.results_map) + 17
+
+    # Same without any eviction
+    cache = Cache(call, max_allowed_size=10, size_expire_mode=ExpireMode.ACCESSED_TIME_BASED, size_expire_samples=3)
+    for x in range(0, 1000):
+        cache.get([x])
+        cache.invalidate([x])
+    assert len(cache._sampling_keys) <= 17
+
+    cache.clear()
+    assert cache._sampling_keys == []
+    assert cache._eviction_pool == []
+
+
+test_sampled_close_to_exact()
+test_sampled_after_invalidation()
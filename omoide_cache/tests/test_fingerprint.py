@@ -0,0 +1,105 @@
+import enum
+import dataclasses
+import importlib.util
+import pytest
+from array import array
+from omoide_cache.cache import Cache
+from omoide_cache.fingerprint import Fingerprinter, DEFAULT_FINGERPRINTER, DIGEST_SIZE
+
+
+@dataclasses.dataclass
+class Point:
+    x: int
+    y: int
+
+
+class Color(enum.IntEnum):
+    RED = 1
+
+
+class UserId:
+    def __init__(self, value: int):
+        self.value = value
+
+
+def key(*args, **kwargs) -> bytes:
+    return DEFAULT_FINGERPRINTER.fingerprint(args, kwargs)
+
+
+def test_distinct_values_distinct_keys():
+    values = [None, 0, 1, -1, 1.0, True, False, '1', b'1', [1], (1,), [[1]], [1, 2], [12], {1: 2}, {1}, frozenset([1]), Point(1, 2), Point(2, 1), Color.RED, '', b'', []]
+    keys = [key(value) for value in values]
+    assert len(set(keys)) == len(values)
+    assert all(len(k) == DIGEST_SIZE for k in keys)
+
+    # Large buffers that would look the same when printed
+    first = array('d', [0.0] * 10000)
+    second = array('d', [0.0] * 10000)
+    second[5000] = 1.0
+    assert key(first) != key(second)
+    assert key(first) == key(array('d', [0.0] * 10000))
+    assert key(first) != key(array('f', [0.0] * 10000))
+    assert key('x' * 1000000) != key('x' * 999999 + 'y')
+    assert key(memoryview(b'abcdef')[::2]) == key(memoryview(b'ace'))
+
+
+def test_canonical_forms():
+    assert key({'a': 1, 'b': 2}) == key({'b': 2, 'a': 1})
+    assert key({3, 1, 2}) == key({1, 2, 3})
+    assert key(Point(1, 2)) == key(Point(1, 2))
+    assert key(1, b=2, a=1) == key(1, a=1, b=2)
+    assert key(1, a=1) != key(1, 1)
+    assert DEFAULT_FINGERPRINTER.fingerprint([1, 2], {}) == DEFAULT_FINGERPRINTER.fingerprint((1, 2), {})
+
+
+def test_registered_handler():
+    fingerprinter = Fingerprinter()
+    # Objects without a repr of their own are told apart by identity
+    user_id_1, user_id_2 = UserId(1), UserId(1)
+    assert fingerprinter.fingerprint([user_id_1], {}) != fingerprinter.fingerprint([user_id_2], {})
+    fingerprinter.register(UserId, lambda fingerprinter, value, update: fingerprinter.update(value.value, update))
+    assert fingerprinter.fingerprint([UserId(1)], {}) == fingerprinter.fingerprint([UserId(1)], {})
+    assert fingerprinter.fingerprint([UserId(1)], {}) != fingerprinter.fingerprint([UserId(2)], {})
+
+    cache = Cache(lambda user_id: user_id.value * 10, fingerprinter=fingerprinter)
+    assert cache.get([UserId(3)]) == 30
+    assert cache.is_cached([UserId(3)])
+
+
+def test_numpy_arrays():
+    numpy = pytest.importorskip('numpy')
+    first = numpy.zeros(10000)
+    second = numpy.zeros(10000)
+    second[5000] = 1.0
+    assert str(first) == str(second)
+    assert key(first) != key(second)
+    assert key(first) != key(first.reshape(100, 100))
+    assert key(first.astype('float32')) != key(first)
+    matrix = numpy.arange(100).reshape(10, 10)
+    assert key(matrix.T) == key(numpy.ascontiguousarray(matrix.T))
+    assert key(numpy.array(['a', 1], dtype=object)) == key(numpy.array(['a', 1], dtype=object))
+
+
+def test_cache_keys_are_digests():
+    cache = Cache(len)
+    assert cache.get(['x' * 100000]) == 100000
+    assert cache.get(['x' * 99999 + 'y']) == 100000
+    assert len(cache.results_map) == 2
+    assert all(len(k) == DIGEST_SIZE for k in cache.results_map)
+
+
+def test_identity_values():
+    # Only values keyed by their address are collected, including nested ones
+    first, second = UserId(1), UserId(2)
+    values = DEFAULT_FINGERPRINTER.identity_values([1, 'a', [first, (2, Point(1, 2))]], {'user': second, 'data': b'x'})
+    assert len(values) == 2 and values[0] is first and values[1] is second
+    assert DEFAULT_FINGERPRINTER.identity_values([1, 'a', {'b': [1.0]}, Color.RED], {}) == []
+
+
+test_distinct_values_distinct_keys()
+test_canonical_forms()
+test_registered_handler()
+if importlib.util.find_spec('numpy') is not None:
+    test_numpy_arrays()
+test_cache_keys_are_digests()
+test_identity_values()
@@ -0,0 +1,111 @@
+import importlib.util
+import pytest
+from array import array
+from omoide_cache.cache import Cache, RefreshMode
+from omoide_cache.clock import ManualClock
+from omoide_cache.freeze import ResultProtection, freeze, register_freezer
+
+
+class User:
+    def __init__(self, name: str, tags: list):
+        self.name = name
+        self.tags = tags
+
+
+class FrozenUser:
+    def __init__(self, user: User):
+        self.name = user.name
+        self.tags = tuple(user.tags)
+
+
+def get_active_users(team: str) -> list:
+    return [{'name': 'Ann', 'roles': ['admin'], 'teams': {team}}, {'name': 'Bob', 'roles': [], 'teams': {team}}]
+
+
+def fails(action) -> bool:
+    try:
+        action()
+    except (TypeError, AttributeError):
+        return True
+    return False
+
+
+def test_freeze():
+    frozen = freeze({'a': [1, [2]], 'b': {3}, 'c': bytearray(b'x'), 'd': (4, [5])})
+    assert frozen['a'] == (1, (2,))
+    assert frozen['b'] == frozenset([3])
+    assert frozen['c'] == b'x'
+    assert frozen['d'] == (4, (5,))
+    assert fails(lambda: frozen.__setitem__('e', 1))
+
+    buffer = freeze(array('d', [1.0, 2.0]))
+    assert buffer[1] == 2.0
+    assert fails(lambda: buffer.__setitem__(1, 3.0))
+    assert freeze(memoryview(bytearray(b'ab'))).readonly
+
+    # Objects without a registered freezer are kept as they are
+    service = Cache(get_active_users)
+    assert freeze(service) is service
+
+
+def test_cache_returns_shared_frozen_results():
+    cache = Cache(get_active_users, result_protection=ResultProtection.FREEZE)
+    users = cache.get(['core'])
+    assert fails(lambda: users.append({'name': 'Eve'}))
+    assert fails(lambda: users[0]['roles'].append('owner'))
+    assert fails(lambda: users[0].__setitem__('name', 'Eve'))
+    assert fails(lambda: users[0]['teams'].add('other'))
+
+    # Hits return the same object, no copies are made
+    assert cache.get(['core']) is users
+    assert [user['name'] for user in cache.get(['core'])] == ['Ann', 'Bob']
+
+    cache.put(['other'], {}, [1, 2])
+    assert cache.get(['other']) == (1, 2)
+
+    failed = False
+    try:
+        Cache(get_active_users, result_protection='COPY')
+    except RuntimeError:
+        failed = True
+    assert failed
+
+
+def test_refreshed_results_are_frozen():
+    clock = ManualClock()
+    cache = Cache(get_active_users, refresh_duration_s=1, refresh_mode=RefreshMode.COUPLED, result_protection=ResultProtection.FREEZE, clock=clock)
+    cache.get(['core'])
+    clock.advance(2)
+    cache._refresh()
+    assert type(cache.get(['core'])) is tuple
+
+
+def test_registered_freezer_and_streams():
+    register_freezer(User, FrozenUser)
+    cache = Cache(lambda name: User(name, ['a']), result_protection=ResultProtection.FREEZE)
+    assert cache.get(['Ann']).tags == ('a',)
+
+    cache = Cache(lambda count: ([index] for index in range(count)), result_protection=ResultProtection.FREEZE)
+    assert list(cache.get([2])) == [(0,), (1,)]
+
+
+def test_numpy_arrays_are_read_only():
+    numpy = pytest.importorskip('numpy')
+    cache = Cache(numpy.arange, result_protection=ResultProtection.FREEZE)
+    values = cache.get([10])
+    assert not values.flags.writeable
+    failed = False
+    try:
+        values[0] = 5
+    except ValueError:
+        failed = True
+    assert failed
+    assert cache.get([10]) is values
+
+
+test_freeze()
+test_cache_returns_shared_frozen_results()
+test_refreshed_results_are_frozen()
+test_registered_freezer_and_streams()
+if importlib.util.find_spec('numpy') is not None:
+    test_numpy_arrays_are_read_only()
@@ -0,0 +1,91 @@
+from omoide_cache.cache import Cache
+from omoide_cache.arguments_retention import ArgumentsRetention
+from omoide_cache.cache_decorator import omoide_cache
+
+
+def call(x: float) -> float:
+    return x * x
+
+
+def tag_fn(positional_arguments, keyword_arguments):
+    return ['even' if positional_arguments[0] % 2 == 0 else 'odd']
+
+
+class ExampleService:
+    @omoide_cache(tag_fn=lambda positional_arguments, keyword_arguments: ['all'])
+    def costly_method(self, number: int) -> int:
+        return number * number
+
+
+def test_invalidate_and_clear():
+    cache = Cache(call, arguments_retention=ArgumentsRetention.STRONG)
+    for x in range(1, 7):
+        cache.get([x])
+    assert len(cache.results_map) == 6
+
+    # Single key
+    assert cache.invalidate([1]) == 1
+    assert cache.invalidate([1]) == 0
+    assert cache.is_cached([1]) is False
+    assert len(cache.results_map) == 5
+    assert len(cache.access_counter_map) == 5
+
+    # Several keys, missing ones are ignored
+    assert cache.invalidate_many([[2], [3], [100]]) == 2
+    assert len(cache.results_map) == 3
+
+    # Predicate
+    assert cache.invalidate_where(lambda positional_arguments, keyword_arguments: positional_arguments[0] > 5) == 1
+    assert cache.is_cached([6]) is False
+
+    # Everything
+    assert cache.clear() == 2
+    assert len(cache.results_map) == 0
+    assert len(cache.last_computed_map) == 0
+
+    # Cache keeps working after clear
+    assert cache.get([2]) == 4
+    assert cache.is_cached([2]) is True
+
+
+def test_invalidate_by_tag():
+    cache = Cache(call, tag_fn=tag_fn)
+    for x in range(1, 7):
+        cache.get([x])
+
+    assert cache.invalidate_by_tag('even') == 3
+    assert cache.is_cached([2]) is False
+    assert cache.is_cached([4]) is False
+    assert cache.is_cached([6]) is False
+    assert cache.is_cached([1]) is True
+    assert 'even' not in cache.tags_map
+
+    # Tags are removed along with expired keys
+    cache.invalidate([1])
+    assert cache.tags_map['odd'] == {cache._build_key([3], {}), cache._build_key([5], {})}
+    assert cache.invalidate_by_tag('odd') == 2
+    assert cache.tags_map == {}
+    assert cache.key_tags_map == {}
+
+
+def test_invalidate_through_decorator():
+    s = ExampleService()
+    assert s.costly_method(2) == 4
+    assert s.costly_method(3) == 9
+    assert s.costly_method.cache.is_cached((s, 2)) is True
+
+    assert s.costly_method.invalidate(2) == 1
+    assert s.costly_method.cache.is_cached((s, 2)) is False
+    assert s.costly_method.cache.is_cached((s, 3)) is True
+
+    assert s.costly_method.cache.invalidate_by_tag('all') == 1
+    assert s.costly_method.cache.is_cached((s, 3)) is False
+
+    # Class level access still works
+    assert ExampleService.costly_method(s, 4) == 16
+    assert s.costly_method.cache.is_cached((s, 4)) is True
+
+
+test_invalidate_and_clear()
+test_invalidate_by_tag()
+test_invalidate_through_decorator()
@@ -0,0 +1,130 @@
+import os
+import time
+import tempfile
+from omoide_cache.cache import Cache
+from omoide_cache.cache_decorator import omoide_cache
+from omoide_cache.invalidation_bus import InvalidationBus
+from omoide_cache.invalidation_broker import InvalidationBroker
+
+
+versions = {}
+
+
+def load_price(product_id: int) -> int:
+    return versions.get(product_id, 0)
+
+
+def wait_for(condition, timeout_s: float = 5.0) -> bool:
+    deadline = time.time() + timeout_s
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.001)
+    return False
+
+
+def test_invalidation_reaches_other_processes():
+    versions.clear()
+    with tempfile.TemporaryDirectory() as directory:
+        socket_path = os.path.join(directory, 'bus.sock')
+        broker = InvalidationBroker(socket_path)
+        broker.start()
+
+        # Two buses stand for two worker processes, each with its own cache of the same function
+        first_bus = InvalidationBus(socket_path)
+        second_bus = InvalidationBus(socket_path)
+        assert first_bus.wait_connected(5) and second_bus.wait_connected(5)
+        first_cache = Cache(load_price, invalidation_bus=first_bus)
+        second_cache = Cache(load_price, invalidation_bus=second_bus)
+        assert first_cache.invalidation_channel == second_cache.invalidation_channel == 'load_price'
+
+        for product_id in range(0, 10):
+            assert first_cache.get([product_id]) == 0
+            assert second_cache.get([product_id]) == 0
+
+        # Write in the first process, invalidate there, and the second one drops the key too
+        versions[3] = 1
+        first_cache.invalidate([3])
+        assert wait_for(lambda: not second_cache.is_cached([3]))
+        assert second_cache.get([3]) == 1
+        assert len(second_cache.results_map) == 10
+
+        # Many invalidations within the flush window are coalesced into a single message
+        number_of_sent_messages = second_bus.number_of_sent_messages
+        for repeat in range(0, 100):
+            second_cache.invalidate_many([[4], [5], [4]])
+        assert wait_for(lambda: not first_cache.is_cached([4]) and not first_cache.is_cached([5]))
+        assert wait_for(lambda: second_bus.number_of_sent_messages > number_of_sent_messages)
+        assert second_bus.number_of_sent_messages - number_of_sent_messages < 10
+        assert first_cache.is_cached([6])
+
+        first_cache.clear()
+        assert wait_for(lambda: len(second_cache.results_map) == 0)
+
+        first_bus.close()
+        second_bus.close()
+        first_cache.close()
+        second_cache.close()
+        broker.stop()
+        assert not os.path.exists(socket_path)
+
+
+def test_late_messages_are_harmless():
+    with tempfile.TemporaryDirectory() as directory:
+        bus = InvalidationBus(os.path.join(directory, 'missing.sock'), reconnect_interval_s=0.01)
+        cache = Cache(load_price, invalidation_bus=bus)
+        sent_ns = bus.clock.time_ns()
+        cache.get([1])
+        key = cache._build_key([1], {})
+
+        # Message sent before the key was computed doesn't drop it, a newer one does
+        bus._apply_message(('{"source": "other", "version": %d, "channels": {"load_price": ["%s"]}}' % (sent_ns, key.hex())).encode('utf-8'))
+        assert cache.is_cached([1])
+        bus._apply_message(('{"source": "other", "version": %d, "channels": {"load_price": null}}' % bus.clock.time_ns()).encode('utf-8'))
+        assert not cache.is_cached([1])
+
+        # Malformed messages are skipped without dropping anything
+        cache.get([1])
+        number_of_received_messages = bus.number_of_received_messages
+        for line in [b'not json', b'[1, 2]', b'{"source": "other", "channels": {"load_price": null}}',
+                     b'{"source": "other", "version": "1", "channels": {"load_price": null}}',
+                     b'{"source": "other", "version": 99999999999999999999, "channels": ["load_price"]}',
+                     b'{"source": "other", "version": 99999999999999999999, "channels": {"load_price": "00"}}',
+                     b'{"source": "other", "version": 99999999999999999999, "channels": {"load_price": [1]}}',
+                     b'{"source": "other", "version": 99999999999999999999, "channels": {"load_price": ["zz"]}}']:
+            bus._apply_message(line)
+        assert cache.is_cached([1])
+        assert bus.number_of_received_messages == number_of_received_messages
+
+        # Invalidations stay pending while the broker is not reachable
+        cache.invalidate([2])
+        assert bus.number_of_sent_messages == 0
+        bus.close()
+
+
+def test_methods_share_keys_across_objects():
+    with tempfile.TemporaryDirectory() as directory:
+        bus = InvalidationBus(os.path.join(directory, 'missing.sock'), reconnect_interval_s=0.01)
+
+        class PriceService:
+            @omoide_cache(invalidation_bus=bus, invalidation_channel='prices')
+            def get_price(self, product_id: int) -> int:
+                return load_price(product_id)
+
+        # Objects of another process stand in for these, their keys don't depend on the object
+        first_service = PriceService()
+        second_service = PriceService()
+        first_service.get_price(1)
+        second_service.get_price(1)
+        key = first_service.get_price.cache._build_key((first_service, 1), {})
+        assert key == second_service.get_price.cache._build_key((second_service, 1), {})
+
+        bus._apply_message(('{"source": "other", "version": %d, "channels": {"prices": ["%s"]}}' % (bus.clock.time_ns(), key.hex())).encode('utf-8'))
+        assert not first_service.get_price.cache.is_cached((first_service, 1))
+        assert not second_service.get_price.cache.is_cached((second_service, 1))
+        bus.close()
+
+
+test_invalidation_reaches_other_processes()
+test_late_messages_are_harmless()
+test_methods_share_keys_across_objects()
@@ -0,0 +1,63 @@
+import gc
+import time
+import weakref
+from omoide_cache.cache import Cache, RefreshMode, get_live_caches
+from omoide_cache.cache_decorator import omoide_cache
+
+
+def call(x: float) -> float:
+    return x * x
+
+
+def slow_call(x: float) -> float:
+    time.sleep(0.2)
+    return x * x
+
+
+class ExampleService:
+    @omoide_cache(refresh_duration_s=1, refresh_mode=RefreshMode.INDEPENDENT, refresh_period_s=1)
+    def costly_method(self, number: int) -> int:
+        return number * number
+
+
+def test_close_cancels_independent_refresh():
+    cache = Cache(call, refresh_duration_s=1, refresh_mode=RefreshMode.INDEPENDENT, refresh_period_s=1)
+    assert cache._refresh_timer.is_alive() is True
+    assert cache._refresh_timer.daemon is True
+    assert cache in get_live_caches()
+
+    assert cache.close(timeout_s=1.0) is True
+    assert cache.terminated is True
+    assert cache._refresh_timer.is_alive() is False
+
+
+def test_close_joins_coupled_refresh():
+    with Cache(slow_call, refresh_duration_s=1, refresh_mode=RefreshMode.COUPLED) as cache:
+        cache.get([2])
+        threads = list(cache._refresh_threads)
+        assert all(thread.daemon for thread in threads)
+    assert cache.terminated is True
+    assert all(not thread.is_alive() for thread in threads)
+
+    # No new refreshes after close, regular access keeps working
+    assert cache.get([2]) == 4
+    assert len(cache._refresh_threads) == 0
+
+
+def test_cache_is_released_with_its_owner():
+    s = ExampleService()
+    assert s.costly_method(3) == 9
+    cache_reference = weakref.ref(s.costly_method.cache)
+    timer = cache_reference()._refresh_timer
+
+    # Dropping the owner frees the cache, and the scheduled refresh becomes a no-op
+    del s
+    gc.collect()
+    assert cache_reference() is None
+    assert timer.is_alive() is True
+    timer.cancel()
+
+
+test_close_cancels_independent_refresh()
+test_close_joins_coupled_refresh()
+test_cache_is_released_with_its_owner()
@@ -0,0 +1,80 @@
+import logging
+from omoide_cache.cache import Cache
+from omoide_cache.log import logger, RateLimitedWarning
+
+
+class CollectingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__(level=logging.DEBUG)
+        self.records = []
+
+    def emit(self, record: logging.LogRecord):
+        self.records.append(record)
+
+
+class Argument:
+    def __init__(self, value: int):
+        self.value = value
+
+    def __repr__(self):
+        return 'Argument(' + str(self.value) + ')'
+
+
+def call(argument: Argument) -> int:
+    return argument.value * 2
+
+
+def test_debug_messages_are_lazy():
+    handler = CollectingHandler()
+    logger.addHandler(handler)
+    old_level = logger.level
+    try:
+        # Debug flag set, but logger is not enabled for debug
+        logger.setLevel(logging.WARNING)
+        cache = Cache(call, max_allowed_size=2, debug=True)
+        for i in range(0, 5):
+            cache.get([Argument(i)])
+        assert handler.records == []
+
+        # Both enabled
+        logger.setLevel(logging.DEBUG)
+        cache.get([Argument(10)])
+        messages = [record.getMessage() for record in handler.records]
+        assert any(message.startswith('Cache.get() With positional_arguments=[Argument(10)]') for message in messages)
+        assert any(message.startswith('Cache._assert_expire_max_size(): Dropped') for message in messages)
+
+        # Logger enabled, debug flag not set
+        handler.records.clear()
+        cache = Cache(call, debug=False)
+        cache.get([Argument(20)])
+        assert handler.records == []
+
+        # Debug flag set later
+        cache.debug = True
+        cache.get([Argument(21)])
+        assert any(record.getMessage().startswith('Cache.get() With positional_arguments=[Argument(21)]') for record in handler.records)
+    finally:
+        logger.setLevel(old_level)
+        logger.removeHandler(handler)
+
+
+def test_rate_limited_warning():
+    handler = CollectingHandler()
+    logger.addHandler(handler)
+    try:
+        warning = RateLimitedWarning(interval_s=60)
+        for i in range(0, 100):
+            warning.warning('Failed to drop key %s', i)
+        assert len(handler.records) == 1
+        assert handler.records[0].getMessage() == 'Failed to drop key 0'
+
+        # Next one after the interval reports what was skipped
+        warning.last_logged_ns = warning.last_logged_ns - warning.interval_ns
+        warning.warning('Failed to drop key %s', 100)
+        assert handler.records[1].getMessage() == 'Failed to drop key 100 (99 similar warnings suppressed)'
+    finally:
+        logger.removeHandler(handler)
+
+
+test_debug_messages_are_lazy()
+test_rate_limited_warning()
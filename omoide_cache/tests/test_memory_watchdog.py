@@ -0,0 +1,123 @@
+import os
+import tempfile
+from omoide_cache.cache import Cache, ExpireMode
+from omoide_cache.clock import ManualClock
+from omoide_cache.observers import RecordingObserver, EvictCause
+from omoide_cache.memory_watchdog import MemoryWatchdog, read_memory_usage
+
+
+class FakeMemory:
+    def __init__(self):
+        self.used_bytes = 0
+
+    def read(self):
+        return self.used_bytes, 1000
+
+
+def call(x: int) -> int:
+    return x * x
+
+
+def write_file(path: str, content: str):
+    with open(path, 'w') as file:
+        file.write(content)
+
+
+def test_shrink_and_restore():
+    observer = RecordingObserver()
+    cache = Cache(call, max_allowed_size=100, size_expire_mode=ExpireMode.ACCESSED_TIME_BASED, observers=[observer])
+    for x in range(0, 100):
+        cache.get([x])
+    cache.get([0])
+
+    assert cache.shrink(0.25) == 25
+    assert len(cache.results_map) == 75
+    assert cache.max_allowed_size == 75
+    assert cache.is_cached([0])
+    assert not cache.is_cached([1])
+    assert [details for name, key, details in observer.events if name == 'evict'] == [EvictCause.MEMORY_PRESSURE] * 25
+
+    # Size stays capped until capacity is restored
+    for x in range(100, 200):
+        cache.get([x])
+    assert len(cache.results_map) == 75
+    cache.restore_capacity()
+    assert cache.max_allowed_size == 100
+    for x in range(200, 300):
+        cache.get([x])
+    assert len(cache.results_map) == 100
+
+
+def test_watchdog_watermarks():
+    memory = FakeMemory()
+    clock = ManualClock()
+    first_cache = Cache(call, max_allowed_size=100)
+    second_cache = Cache(call, max_allowed_size=10)
+    for x in range(0, 100):
+        first_cache.get([x])
+        second_cache.get([x])
+
+    watchdog = MemoryWatchdog(high_watermark=0.8, low_watermark=0.5, shrink_fraction=0.5, interval_s=1, clock=clock, read_usage=memory.read,
+                              caches=[first_cache, second_cache])
+    watchdog.start()
+
+    memory.used_bytes = 700
+    clock.advance(1)
+    assert len(first_cache.results_map) == 100
+
+    # Shrinks on every check while above high watermark
+    memory.used_bytes = 900
+    clock.advance(1)
+    assert (len(first_cache.results_map), len(second_cache.results_map)) == (50, 5)
+    clock.advance(1)
+    assert (len(first_cache.results_map), len(second_cache.results_map)) == (25, 2)
+    assert watchdog.under_pressure
+
+    # Capacity stays low between watermarks, and comes back below the low one
+    memory.used_bytes = 600
+    clock.advance(1)
+    assert first_cache.max_allowed_size == 25
+    memory.used_bytes = 400
+    clock.advance(1)
+    assert not watchdog.under_pressure
+    assert (first_cache.max_allowed_size, second_cache.max_allowed_size) == (100, 10)
+
+    watchdog.stop()
+    assert clock.number_of_scheduled_calls() == 0
+
+    failed = False
+    try:
+        MemoryWatchdog(high_watermark=0.5, low_watermark=0.8)
+    except RuntimeError:
+        failed = True
+    assert failed
+
+
+def test_read_memory_usage():
+    with tempfile.TemporaryDirectory() as directory:
+        cgroup_v2_dir = os.path.join(directory, 'v2')
+        cgroup_v1_dir = os.path.join(directory, 'v1')
+        meminfo_path = os.path.join(directory, 'meminfo')
+        os.mkdir(cgroup_v2_dir)
+        os.mkdir(cgroup_v1_dir)
+        write_file(meminfo_path, 'MemTotal:       1000 kB\nMemFree:         100 kB\nMemAvailable:    400 kB\n')
+        assert read_memory_usage(cgroup_v2_dir, cgroup_v1_dir, meminfo_path) == (600 * 1024, 1000 * 1024)
+
+        # Unlimited cgroups fall back to the whole machine
+        write_file(os.path.join(cgroup_v1_dir, 'memory.limit_in_bytes'), str(2 ** 63 - 4096))
+        write_file(os.path.join(cgroup_v1_dir, 'memory.usage_in_bytes'), '100')
+        write_file(os.path.join(cgroup_v2_dir, 'memory.max'), 'max\n')
+        write_file(os.path.join(cgroup_v2_dir, 'memory.current'), '100\n')
+        assert read_memory_usage(cgroup_v2_dir, cgroup_v1_dir, meminfo_path) == (600 * 1024, 1000 * 1024)
+
+        write_file(os.path.join(cgroup_v1_dir, 'memory.limit_in_bytes'), '1000')
+        assert read_memory_usage(cgroup_v2_dir, cgroup_v1_dir, meminfo_path) == (100, 1000)
+        write_file(os.path.join(cgroup_v2_dir, 'memory.max'), '2000\n')
+        assert read_memory_usage(cgroup_v2_dir, cgroup_v1_dir, meminfo_path) == (100, 2000)
+
+        assert read_memory_usage(cgroup_v2_dir + 'x', cgroup_v1_dir + 'x', meminfo_path + 'x') is None
+
+
+test_shrink_and_restore()
+test_watchdog_watermarks()
+test_read_memory_usage()
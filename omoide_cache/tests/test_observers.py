@@ -0,0 +1,219 @@
+from omoide_cache.cache import Cache, ExpireMode, RefreshMode
+from omoide_cache.clock import ManualClock
+from omoide_cache.observers import EvictCause, RecordingObserver, OpenTelemetryObserver
+from omoide_cache.cache_decorator import omoide_cache
+from omoide_cache.trace import hash_key
+
+
+def call(x: int) -> int:
+    if x < 0:
+        raise ValueError('Negative input')
+    return x * x
+
+
+def test_hit_miss_load_evict():
+    observer = RecordingObserver()
+    clock = ManualClock()
+    cache = Cache(call, max_allowed_size=2, size_expire_mode=ExpireMode.ACCESSED_TIME_BASED, expire_by_computed_duration_s=10, observers=[observer], clock=clock)
+
+    cache.get([1])
+    assert observer.names() == ['miss', 'load_start', 'load_end']
+    observer.clear()
+    clock.advance(1)
+    cache.get([1])
+    assert observer.names() == ['hit']
+
+    # Size eviction
+    observer.clear()
+    clock.advance(1)
+    cache.get([2])
+    clock.advance(1)
+    cache.get([3])
+    assert ('evict', cache._build_key([1], {}), EvictCause.SIZE) in observer.events
+
+    # Time based expiry, invalidation and clear
+    observer.clear()
+    clock.advance(20)
+    cache.get([4])
+    assert ('evict', cache._build_key([3], {}), EvictCause.EXPIRED_BY_COMPUTED) in observer.events
+    observer.clear()
+    cache.invalidate([4])
+    assert observer.events == [('evict', cache._build_key([4], {}), EvictCause.INVALIDATED)]
+    cache.get([5])
+    observer.clear()
+    cache.clear()
+    assert observer.names() == ['evict']
+    assert observer.events[0][2] == EvictCause.CLEARED
+
+    # Failed load
+    observer.clear()
+    failed = False
+    try:
+        cache.get([-1])
+    except ValueError:
+        failed = True
+    assert failed
+    assert observer.names() == ['miss', 'load_start', 'load_end']
+    assert isinstance(observer.events[-1][2], ValueError)
+
+
+def test_refresh_events():
+    observer = RecordingObserver()
+    clock = ManualClock()
+    cache = Cache(call, refresh_duration_s=1, refresh_mode=RefreshMode.INDEPENDENT, refresh_period_s=1, observers=[observer], clock=clock)
+    cache.get([5])
+    observer.clear()
+    clock.advance(2)
+    assert observer.events == [('refresh', cache._build_key([5], {}), None)]
+    cache.close()
+
+
+observer_of_service = RecordingObserver()
+
+
+class ObservedService:
+    @omoide_cache(observers=[observer_of_service])
+    def square(self, x: int) -> int:
+        return x * x
+
+
+def test_observers_through_decorator():
+    observer_of_service.clear()
+    service = ObservedService()
+    service.square(2)
+    service.square(2)
+    assert observer_of_service.names() == ['miss', 'load_start', 'load_end', 'hit']
+
+
+# OpenTelemetry is optional, without it the adapter can't be created, with it (no SDK configured) spans are no-ops
+def test_open_telemetry_adapter():
+    try:
+        import opentelemetry
+    except ImportError:
+        failed = False
+        try:
+            OpenTelemetryObserver()
+        except RuntimeError:
+            failed = True
+        assert failed
+        return
+
+    cache = Cache(call, max_allowed_size=1, observers=[OpenTelemetryObserver()])
+    cache.get([1])
+    cache.get([1])
+    cache.get([2])
+    try:
+        cache.get([-1])
+    except ValueError:
+        pass
+
+
+class FakeSpan:
+    def __init__(self, name: str, attributes, parent):
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.parent = parent
+        self.events = []
+        self.exceptions = []
+        self.status = None
+        self.ended = False
+
+    def is_recording(self) -> bool:
+        return True
+
+    def add_event(self, name: str, attributes):
+        self.events.append((name, attributes))
+
+    def set_attribute(self, name: str, value):
+        self.attributes[name] = value
+
+    def record_exception(self, exception: BaseException):
+        self.exceptions.append(exception)
+
+    def set_status(self, status):
+        self.status = status
+
+    def end(self):
+        self.ended = True
+
+
+class FakeScope:
+    def __init__(self, trace_api, span: FakeSpan):
+        self.trace_api = trace_api
+        self.span = span
+
+    def __enter__(self):
+        self.trace_api.current_spans.append(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        assert self.trace_api.current_spans.pop() is self.span
+
+
+# Stands for the opentelemetry.trace module
+class FakeTraceApi:
+    class StatusCode:
+        ERROR = 'ERROR'
+
+    def __init__(self):
+        self.current_spans = [FakeSpan('root', None, None)]
+
+    def Status(self, status_code: str, description: str):
+        return status_code, description
+
+    def get_current_span(self) -> FakeSpan:
+        return self.current_spans[-1]
+
+    def use_span(self, span: FakeSpan, end_on_exit: bool = False) -> FakeScope:
+        return FakeScope(self, span)
+
+
+class FakeTracer:
+    def __init__(self, trace_api: FakeTraceApi):
+        self.trace_api = trace_api
+        self.spans = []
+
+    def start_span(self, name: str, attributes=None) -> FakeSpan:
+        span = FakeSpan(name, attributes, self.trace_api.get_current_span())
+        self.spans.append(span)
+        return span
+
+
+def test_open_telemetry_spans():
+    trace_api = FakeTraceApi()
+    tracer = FakeTracer(trace_api)
+    observer = OpenTelemetryObserver(tracer=tracer, trace_api=trace_api)
+    root = trace_api.get_current_span()
+    inner_cache = Cache(call, observers=[observer])
+    outer_cache = Cache(lambda x: inner_cache.get([x]) + 1, observers=[observer])
+
+    # Load of the inner cache happens within the load of the outer one
+    assert outer_cache.get([3]) == 10
+    outer_load, inner_load = tracer.spans
+    assert outer_load.parent is root and inner_load.parent is outer_load
+    assert outer_load.name == 'omoide_cache.load' and outer_load.ended and inner_load.ended
+    assert inner_load.attributes['omoide_cache.key_hash'] == str(hash_key(inner_cache._build_key([3], {})))
+    assert 'omoide_cache.load_duration_ns' in inner_load.attributes
+    assert [event[0] for event in outer_load.events] == ['omoide_cache.miss']
+    assert trace_api.get_current_span() is root
+
+    # Hits are events of the current span
+    outer_cache.get([3])
+    assert root.events[-1][0] == 'omoide_cache.hit'
+
+    # Failed load ends its span with an error status
+    try:
+        inner_cache.get([-1])
+    except ValueError:
+        pass
+    failed_load = tracer.spans[-1]
+    assert failed_load.ended and failed_load.status == ('ERROR', 'Negative input')
+    assert isinstance(failed_load.exceptions[0], ValueError)
+    assert trace_api.get_current_span() is root
+
+
+test_hit_miss_load_evict()
+test_refresh_events()
+test_observers_through_decorator()
+test_open_telemetry_adapter()
+test_open_telemetry_spans()
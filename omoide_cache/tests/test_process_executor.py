@@ -0,0 +1,102 @@
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from omoide_cache.cache import Cache
+from omoide_cache.clock import ManualClock
+from omoide_cache.cache_decorator import omoide_cache
+from omoide_cache.process_call import SHARED_MEMORY_MIN_BYTES
+
+
+def call(x: float) -> tuple:
+    return x * x, os.getpid()
+
+
+# Returns the content of the file repeated size times, fails for size 0 once the file says so
+def read_repeated(path: str, size: int) -> bytes:
+    with open(path) as file:
+        content = file.read()
+    if content == 'fail' and size == 0:
+        raise ValueError('Refresh failed')
+    return content.encode('utf-8') * size
+
+
+def shared_memory_names() -> set:
+    return set(name for name in os.listdir('/dev/shm') if name.startswith('psm_')) if os.path.isdir('/dev/shm') else set()
+
+
+class ExampleService:
+    def __init__(self):
+        self.power = 3
+
+    @omoide_cache()
+    def costly_method(self, number: int) -> tuple:
+        return number ** self.power, os.getpid()
+
+
+def test_cache_with_process_pool():
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        cache = Cache(call, executor=executor)
+        result, pid = cache.get([3])
+        assert result == 9
+        assert pid != os.getpid()
+
+        # Served from the cache, not recomputed
+        assert cache.get([3]) == (9, pid)
+
+        # Warm-up goes through the same pool
+        report = cache.warm([[1], [2], [4]], concurrency=2)
+        assert report.computed == 3
+        assert cache.get([4])[1] != os.getpid()
+
+
+def test_decorator_with_process_pool():
+    # Caches of the method are created from its config for each object, so the pool can be set before the first call
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        ExampleService.costly_method.config.executor = executor
+        try:
+            # The object is pickled along with its cache, which is sent to the worker as None
+            s = ExampleService()
+            result, pid = s.costly_method(2)
+            assert result == 8
+            assert pid != os.getpid()
+            assert s.costly_method(2) == (8, pid)
+            assert s.costly_method.cache.is_cached((s, 2)) is True
+        finally:
+            ExampleService.costly_method.config.executor = None
+
+
+# Large results come back through shared memory, which is released even if refresh of another key fails
+def test_shared_memory_is_released():
+    names_before = shared_memory_names()
+    with tempfile.TemporaryDirectory() as directory, ProcessPoolExecutor(max_workers=2) as executor:
+        path = os.path.join(directory, 'content')
+        with open(path, 'w') as file:
+            file.write('a')
+        clock = ManualClock()
+        cache = Cache(read_repeated, executor=executor, refresh_duration_s=1, clock=clock)
+        assert cache.get([path, 0]) == b''
+        assert cache.get([path, SHARED_MEMORY_MIN_BYTES]) == b'a' * SHARED_MEMORY_MIN_BYTES
+
+        with open(path, 'w') as file:
+            file.write('fail')
+        clock.advance(2)
+        assert cache.get([path, 0]) == b''
+        assert cache.get([path, SHARED_MEMORY_MIN_BYTES]) == b'fail' * SHARED_MEMORY_MIN_BYTES
+    assert shared_memory_names() == names_before
+
+
+def test_lambda_is_rejected():
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        try:
+            Cache(lambda x: x, executor=executor)
+            assert False
+        except RuntimeError:
+            pass
+
+
+# Objects defined in this module can't be pickled while the module is still being imported, so no calls on import here
+if __name__ == '__main__':
+    test_cache_with_process_pool()
+    test_decorator_with_process_pool()
+    test_shared_memory_is_released()
+    test_lambda_is_rejected()
@@ -1,5 +1,5 @@
-import time
 from omoide_cache.cache import Cache, RefreshMode
+from omoide_cache.clock import ManualClock
 
 number_of_calls = {}
 def call(x: float) -> float:
@@ -13,9 +13,11 @@ def call(x: float) -> float:
 def test_1():
     refresh_duration_s = 1
     refresh_period_s = 3
+    number_of_calls.clear()
+    clock = ManualClock()
 
     # Create cache
-    cache = Cache(call, refresh_duration_s=refresh_duration_s, refresh_mode=RefreshMode.INDEPENDENT, refresh_period_s=refresh_period_s, debug=True)
+    cache = Cache(call, refresh_duration_s=refresh_duration_s, refresh_mode=RefreshMode.INDEPENDENT, refresh_period_s=refresh_period_s, clock=clock, debug=True)
 
     # Fill cache with 4 values
     cache.get([1])
@@ -31,7 +33,7 @@ def test_1():
     assert cache.results_map[(cache._build_key([4], {}))] == 1
 
     # Wait long enough for refresh to kick in
-    time.sleep(5)
+    clock.advance(5)
 
     # Make sure current len is 4 and all keys are present
     assert len(cache.results_map) == 4
@@ -40,8 +42,17 @@ def test_1():
     assert cache.results_map[(cache._build_key([3], {}))] == 2
     assert cache.results_map[(cache._build_key([4], {}))] == 2
 
-    # Close the cache
+    # Next refresh happens only after another period
+    clock.advance(0.5)
+    assert cache.results_map[(cache._build_key([1], {}))] == 2
+    clock.advance(1)
+    assert cache.results_map[(cache._build_key([1], {}))] == 3
+
+    # Close the cache, no more refreshes are scheduled
     cache.terminate()
+    assert clock.number_of_scheduled_calls() == 0
+    clock.advance(10)
+    assert cache.results_map[(cache._build_key([1], {}))] == 3
 
 
-test_1()
\ No newline at end of file
+test_1()
@@ -0,0 +1,171 @@
+import threading
+from omoide_cache.cache import Cache
+from omoide_cache.cache_decorator import omoide_cache
+from omoide_cache.tiered_cache import TieredCache
+from omoide_cache.stream import RecordedStream
+
+
+pulled_pages = []
+
+
+def load_feed(feed_id: int, number_of_pages: int):
+    for page in range(0, number_of_pages):
+        pulled_pages.append((feed_id, page))
+        yield [feed_id, page]
+
+
+def broken_feed(feed_id: int):
+    pulled_pages.append((feed_id, 0))
+    yield 0
+    raise IOError('Feed is gone')
+
+
+class FeedService:
+    @omoide_cache()
+    def load_feed(self, feed_id: int):
+        return iter(range(feed_id))
+
+
+def test_replay():
+    pulled_pages.clear()
+    cache = Cache(load_feed)
+    first = cache.get([1, 3])
+    second = cache.get([1, 3])
+    assert pulled_pages == []
+
+    # Items are pulled lazily, and only once
+    assert next(first) == [1, 0]
+    assert next(second) == [1, 0]
+    assert next(second) == [1, 1]
+    assert pulled_pages == [(1, 0), (1, 1)]
+    assert list(first) == [[1, 1], [1, 2]]
+    assert list(second) == [[1, 2]]
+    assert list(cache.get([1, 3])) == [[1, 0], [1, 1], [1, 2]]
+    assert len(pulled_pages) == 3
+
+    assert list(FeedService().load_feed(3)) == [0, 1, 2]
+
+
+def test_readers_wait_for_items():
+    release = threading.Event()
+    started = threading.Event()
+
+    def slow_feed():
+        yield 1
+        started.set()
+        release.wait(5)
+        yield 2
+
+    cache = Cache(slow_feed)
+    first = cache.get([])
+    assert next(first) == 1
+    first_items = []
+    thread = threading.Thread(target=lambda: first_items.extend(first))
+    thread.start()
+    started.wait(5)
+
+    # Second reader gets the recorded item right away, and then waits for the one being pulled
+    second = cache.get([])
+    assert next(second) == 1
+    release.set()
+    assert list(second) == [2]
+    thread.join(5)
+    assert first_items == [2]
+
+
+def test_spill_and_limits():
+    pulled_pages.clear()
+    cache = Cache(load_feed, stream_spill_after_items=2)
+    assert list(cache.get([2, 5])) == [[2, page] for page in range(0, 5)]
+    stream = cache.results_map[cache._build_key([2, 5], {})]
+    assert stream.number_of_spilled_items == 3
+    assert len(stream._items) == 5
+    assert list(cache.get([2, 5])) == [[2, page] for page in range(0, 5)]
+
+    # Too long streams are not replayed, readers that have already started still get all items
+    pulled_pages.clear()
+    cache = Cache(load_feed, stream_max_items=3)
+    first = cache.get([3, 10])
+    second = cache.get([3, 10])
+    assert list(first) == [[3, page] for page in range(0, 10)]
+    stream = cache.results_map[cache._build_key([3, 10], {})]
+    assert stream.abandoned
+    assert list(second) == [[3, page] for page in range(0, 10)]
+    assert len(stream._items) == 0
+    assert list(cache.get([3, 10])) == [[3, page] for page in range(0, 10)]
+    assert len(pulled_pages) == 20
+    assert stream.replay() is None
+
+
+def test_spill_file_is_closed():
+    # Stream dropped from the cache keeps its spill file until its last reader is done
+    cache = Cache(load_feed, stream_spill_after_items=1)
+    assert list(cache.get([7, 3])) == [[7, page] for page in range(0, 3)]
+    reader = cache.get([7, 3])
+    assert next(reader) == [7, 0]
+    stream = cache.results_map[cache._build_key([7, 3], {})]
+    spill_file = stream._spill_file
+    cache.invalidate([7, 3])
+    assert not spill_file.closed
+    assert list(reader) == [[7, 1], [7, 2]]
+    assert spill_file.closed
+
+    # Finished stream that was replaced or cleared closes it right away
+    for drop in (lambda cache: cache.put([7, 3], {}, load_feed(7, 3)), lambda cache: cache.clear()):
+        cache = Cache(load_feed, stream_spill_after_items=1)
+        assert list(cache.get([7, 3])) == [[7, page] for page in range(0, 3)]
+        spill_file = cache.results_map[cache._build_key([7, 3], {})]._spill_file
+        drop(cache)
+        assert spill_file.closed
+
+
+def test_abandoned_while_replayed():
+    # Streams get abandoned by readers while other callers look them up, each caller still gets every item
+    cache = Cache(load_feed, stream_max_items=2)
+    tiered_cache = TieredCache(Cache(load_feed, stream_max_items=2), l1_max_allowed_size=10)
+    errors = []
+
+    def run(cache):
+        try:
+            for i in range(0, 200):
+                assert list(cache.get([6, 4])) == [[6, page] for page in range(0, 4)]
+        except BaseException as exception:
+            errors.append(exception)
+
+    threads = [threading.Thread(target=run, args=(cache if i % 2 == 0 else tiered_cache,)) for i in range(0, 8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+
+def test_failed_stream_is_computed_again():
+    pulled_pages.clear()
+    cache = Cache(broken_feed)
+    failed = False
+    try:
+        list(cache.get([4]))
+    except IOError:
+        failed = True
+    assert failed
+    assert next(cache.get([4])) == 0
+    assert len(pulled_pages) == 2
+
+
+def test_tiered_cache_replays():
+    pulled_pages.clear()
+    cache = TieredCache(Cache(load_feed), l1_max_allowed_size=10)
+    assert list(cache.get([5, 2])) == [[5, 0], [5, 1]]
+    assert type(cache._get_l1().entries[cache.l2_cache._build_key([5, 2], {})][0]) is RecordedStream
+    assert list(cache.get([5, 2])) == [[5, 0], [5, 1]]
+    assert len(pulled_pages) == 2
+
+
+test_replay()
+test_readers_wait_for_items()
+test_spill_and_limits()
+test_spill_file_is_closed()
+test_abandoned_while_replayed()
+test_failed_stream_is_computed_again()
+test_tiered_cache_replays()
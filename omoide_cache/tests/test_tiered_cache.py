@@ -0,0 +1,233 @@
+import threading
+from omoide_cache.cache import Cache, ExpireMode, RefreshMode
+from omoide_cache.clock import ManualClock
+from omoide_cache.tiered_cache import TieredCache, TierMode
+from omoide_cache.cache_decorator import omoide_cache
+from omoide_cache.arguments_retention import ArgumentsRetention, WeakArguments
+
+
+number_of_calls = []
+
+
+def call(x: int) -> int:
+    number_of_calls.append(x)
+    return x * x
+
+
+def test_inclusive():
+    number_of_calls.clear()
+    l2_cache = Cache(call, max_allowed_size=10, size_expire_mode=ExpireMode.ACCESSED_TIME_BASED)
+    cache = TieredCache(l2_cache, l1_max_allowed_size=2, promote_after_accesses=2)
+
+    # Promoted on second access, then served by L1
+    assert cache.get([1]) == 1
+    assert cache._get_l1().entries == {}
+    assert cache.get([1]) == 1
+    assert cache.get([1]) == 1
+    assert list(cache._get_l1().entries) == [l2_cache._build_key([1], {})]
+    # L1 hits are counted in L2 too
+    assert l2_cache.access_counter_map[l2_cache._build_key([1], {})] == 3
+    assert number_of_calls == [1]
+
+    # L1 stays within its size, keys remain in L2
+    for x in [2, 2, 3, 3]:
+        cache.get([x])
+    assert len(cache._get_l1().entries) == 2
+    assert len(l2_cache.results_map) == 3
+
+    # Invalidation and eviction of L2 reach L1
+    assert cache.invalidate([3]) == 1
+    assert not cache.is_cached([3])
+    l2_cache.invalidate([2])
+    assert cache._get_l1().entries == {}
+    for x in range(0, 3):
+        cache.get([1])
+    for x in range(100, 120):
+        cache.get([x])
+    assert not cache.is_cached([1])
+    assert cache.clear() == 10
+
+
+def test_exclusive():
+    number_of_calls.clear()
+    # Demoted keys need their arguments in L2
+    l2_cache = Cache(call, max_allowed_size=10, arguments_retention=ArgumentsRetention.STRONG)
+    cache = TieredCache(l2_cache, l1_max_allowed_size=2, tier_mode=TierMode.EXCLUSIVE)
+
+    assert cache.get([1]) == 1
+    assert cache.is_cached([1])
+    assert len(l2_cache.results_map) == 0
+    cache.get([2])
+    cache.get([3])
+
+    # Oldest key was demoted back to L2
+    assert l2_cache.is_cached([1])
+    assert len(cache._get_l1().entries) == 2
+    assert cache.get([1]) == 1
+    assert number_of_calls == [1, 2, 3]
+
+    assert cache.invalidate([1]) == 1
+    assert not cache.is_cached([1])
+    assert cache.clear() == 2
+    assert not cache.is_cached([2])
+    assert not cache.is_cached([3])
+
+
+def test_per_thread():
+    cache = TieredCache(Cache(call), l1_max_allowed_size=5, l1_per_thread=True)
+    cache.get([7])
+
+    def run():
+        assert cache._get_l1().entries == {}
+        assert cache.get([7]) == 49
+        assert len(cache._get_l1().entries) == 1
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+    assert len(cache._get_l1().entries) == 1
+    assert cache.invalidate([7]) == 1
+    assert all(len(l1.entries) == 0 for l1 in cache._get_l1_tiers())
+
+
+def test_refresh_reaches_l1():
+    clock = ManualClock()
+    values = {'x': 1}
+    l2_cache = Cache(lambda x: values['x'], refresh_duration_s=1, refresh_mode=RefreshMode.INDEPENDENT, refresh_period_s=1, clock=clock)
+    cache = TieredCache(l2_cache, l1_max_allowed_size=5)
+    assert cache.get([0]) == 1
+    assert cache.get([0]) == 1
+    values['x'] = 2
+    clock.advance(2)
+    assert cache.get([0]) == 2
+    l2_cache.close()
+
+
+def test_l1_follows_l2_expiry():
+    number_of_calls.clear()
+    clock = ManualClock()
+    l2_cache = Cache(call, expire_by_computed_duration_s=10, clock=clock)
+    cache = TieredCache(l2_cache, l1_max_allowed_size=5)
+    assert cache.get([2]) == 4
+    clock.advance(5)
+    assert cache.get([2]) == 4
+    assert l2_cache.last_accessed_map[l2_cache._build_key([2], {})] == clock.time_ns()
+    clock.advance(6)
+    assert cache._get_l1().entries != {}
+
+    # Same as L2 alone, the expired result is dropped after it's returned once, then computed again
+    assert cache.get([2]) == 4
+    assert cache._get_l1().entries == {}
+    assert cache.get([2]) == 4
+    assert number_of_calls == [2, 2]
+
+    # Coupled refresh is started by L1 hits once the key is due
+    values = {'x': 1}
+    l2_cache = Cache(lambda x: values['x'], refresh_duration_s=1, clock=clock)
+    cache = TieredCache(l2_cache, l1_max_allowed_size=5)
+    assert cache.get([0]) == 1
+    assert cache.get([0]) == 1
+    values['x'] = 2
+    clock.advance(2)
+    cache.get([0])
+    assert cache.get([0]) == 2
+
+
+def test_invalidation_during_promotion():
+    for tier_mode in [TierMode.INCLUSIVE, TierMode.EXCLUSIVE]:
+        values = {'x': 1}
+        l2_cache = Cache(lambda x: values['x'], expire_by_computed_duration_s=100, arguments_retention=ArgumentsRetention.STRONG)
+        cache = TieredCache(l2_cache, l1_max_allowed_size=5, tier_mode=tier_mode)
+
+        # Invalidation runs after the result was read from L2, but before it is in L1
+        deadline_ns = cache._deadline_ns
+
+        def invalidate_then_deadline_ns(key: str, computed_ns: int) -> int:
+            values['x'] = 2
+            cache.invalidate([0])
+            return deadline_ns(key, computed_ns)
+
+        cache._deadline_ns = invalidate_then_deadline_ns
+        assert cache.get([0]) == 1
+        cache._deadline_ns = deadline_ns
+        assert cache._get_l1().entries == {}
+        assert cache.get([0]) == 2
+
+
+class FakeBus:
+    def __init__(self):
+        self.channels = {}
+
+    def attach(self, cache, channel: str):
+        self.channels.setdefault(channel, []).append(cache)
+
+    def detach(self, cache, channel: str):
+        if cache in self.channels[channel]:
+            self.channels[channel].remove(cache)
+
+    def publish(self, channel: str, keys):
+        pass
+
+
+def test_l1_arguments_follow_retention():
+    # Inclusive L1 never needs the arguments
+    cache = TieredCache(Cache(call, arguments_retention=ArgumentsRetention.STRONG), l1_max_allowed_size=5)
+    cache.get([1])
+    assert all(entry[2] is None for entry in cache._get_l1().entries.values())
+
+    # Exclusive L1 keeps them as L2 would, and keys without them are dropped instead of demoted
+    l2_cache = Cache(call, arguments_retention=ArgumentsRetention.NONE)
+    cache = TieredCache(l2_cache, l1_max_allowed_size=1, tier_mode=TierMode.EXCLUSIVE)
+    cache.get([1])
+    cache.get([2])
+    assert not cache.is_cached([1])
+    l2_cache = Cache(call, arguments_retention=ArgumentsRetention.WEAK)
+    cache = TieredCache(l2_cache, l1_max_allowed_size=1, tier_mode=TierMode.EXCLUSIVE)
+    cache.get([1])
+    assert isinstance(cache._get_l1().entries[l2_cache._build_key([1], {})][2], WeakArguments)
+    cache.get([2])
+    assert l2_cache.is_cached([1])
+
+
+def test_exclusive_receives_bus_invalidations():
+    bus = FakeBus()
+    clock = ManualClock()
+    l2_cache = Cache(call, invalidation_bus=bus, invalidation_channel='squares', clock=clock)
+    cache = TieredCache(l2_cache, l1_max_allowed_size=5, tier_mode=TierMode.EXCLUSIVE)
+    assert bus.channels['squares'] == [cache]
+    cache.get([1])
+    cache.get([2])
+    clock.advance(1)
+    assert cache._invalidate_keys_computed_before([l2_cache._build_key([1], {})], clock.time_ns()) == 1
+    assert not cache.is_cached([1])
+    assert cache._invalidate_keys_computed_before(None, 0) == 0
+    assert cache._invalidate_keys_computed_before(None, clock.time_ns()) == 1
+    assert not cache.is_cached([2])
+    cache.close()
+    assert bus.channels['squares'] == []
+
+
+class TieredService:
+    @omoide_cache(max_allowed_size=100, l1_max_allowed_size=10)
+    def square(self, x: int) -> int:
+        return x * x
+
+
+def test_tiered_through_decorator():
+    service = TieredService()
+    assert service.square(3) == 9
+    assert isinstance(service.square.cache, TieredCache)
+    assert service.square.cache.is_cached((service, 3))
+    assert service.square.invalidate(3) == 1
+    assert not service.square.cache.is_cached((service, 3))
+
+
+test_inclusive()
+test_exclusive()
+test_per_thread()
+test_refresh_reaches_l1()
+test_l1_follows_l2_expiry()
+test_invalidation_during_promotion()
+test_l1_arguments_follow_retention()
+test_exclusive_receives_bus_invalidations()
+test_tiered_through_decorator()
@@ -0,0 +1,86 @@
+import os
+import tempfile
+import threading
+from omoide_cache.cache import Cache
+from omoide_cache.clock import ManualClock
+from omoide_cache.trace import TraceRecorder, read_trace, hash_key
+from omoide_cache.simulator import POLICIES, load_key_hashes, simulate, simulate_hit_rate, geometric_sizes
+from omoide_cache.benchmarks.workloads import Workload, build_workload
+
+
+def call(x: float) -> float:
+    return x * x
+
+
+def record_trace(path: str, size_expire_mode: str, max_allowed_size: int) -> list:
+    clock = ManualClock()
+    hits = []
+    with TraceRecorder(path, buffer_size=64) as trace_recorder:
+        cache = Cache(call, max_allowed_size=max_allowed_size, size_expire_mode=size_expire_mode, clock=clock, trace_recorder=trace_recorder)
+        for operation, key in build_workload(Workload.ZIPFIAN, 200, 2000, seed=3):
+            clock.advance(0.001)
+            hits.append(cache.is_cached([key]))
+            cache.get([key])
+    return hits
+
+
+def test_trace_round_trip():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'trace.bin')
+        hits = record_trace(path, 'ACCESSED_TIME_BASED', 20)
+        records = list(read_trace(path))
+        assert len(records) == 2000
+        assert [hit for key_hash, timestamp_ns, hit in records] == hits
+        assert records[0][1] == 1000000
+        assert records[-1][1] == 2000 * 1000000
+
+    assert hash_key('a') == hash_key('a')
+    assert hash_key('a') != hash_key('b')
+
+
+def test_records_are_not_lost():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'trace.bin')
+        trace_recorder = TraceRecorder(path, buffer_size=7)
+        cache = Cache(call, trace_recorder=trace_recorder)
+
+        def run(offset: int):
+            for i in range(0, 1000):
+                cache.get([offset + i % 50])
+
+        threads = [threading.Thread(target=run, args=(offset,)) for offset in range(0, 400, 100)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Closing the cache closes the trace file, with every record written
+        cache.close()
+        assert trace_recorder._file.closed
+        assert trace_recorder.number_of_records == 4000
+        assert len(list(read_trace(path))) == 4000
+
+
+def test_simulator_matches_cache():
+    # Replaying a trace at the recorded size gives exactly the hit rate the cache had
+    with tempfile.TemporaryDirectory() as directory:
+        for policy in POLICIES:
+            path = os.path.join(directory, policy + '.bin')
+            hits = record_trace(path, policy, 20)
+            key_hashes = load_key_hashes(path)
+            assert simulate_hit_rate(key_hashes, policy, 20) == sum(hits) / float(len(hits))
+
+        # Larger caches never do worse on this trace
+        curves = simulate(key_hashes, [5, 20, 80, 200])
+        for policy, curve in curves.items():
+            hit_rates = list(curve.values())
+            assert hit_rates == sorted(hit_rates)
+            # Everything fits, only first accesses miss
+            assert curve[200] == 1.0 - len(set(key_hashes)) / float(len(key_hashes))
+
+    assert geometric_sizes(10, 1000, 3) == [10, 100, 1000]
+
+
+test_trace_round_trip()
+test_records_are_not_lost()
+test_simulator_matches_cache()
@@ -0,0 +1,79 @@
+import threading
+from omoide_cache.cache import Cache, ExpireMode
+
+number_of_calls = {}
+number_of_calls_lock = threading.Lock()
+def call(x: float) -> float:
+    with number_of_calls_lock:
+        number_of_calls[x] = number_of_calls.get(x, 0) + 1
+    if x < 0:
+        raise ValueError('Negative input')
+    return x * x
+
+
+def generate_arguments(n: int):
+    for x in range(0, n):
+        yield [x]
+
+
+def test_warm():
+    number_of_calls.clear()
+    progress = []
+
+    # Create cache and warm it
+    cache = Cache(call, max_allowed_size=1000, size_expire_mode=ExpireMode.ACCESS_COUNT_BASED)
+    report = cache.warm(generate_arguments(100), concurrency=4, progress_callback=lambda r: progress.append(r.computed))
+
+    # All values were computed exactly once
+    assert report.computed == 100
+    assert report.skipped == 0
+    assert report.failed == 0
+    assert report.stopped_by_size is False
+    assert report.duration_s >= 0
+    assert len(progress) == 100
+    assert progress[-1] == 100
+    assert len(cache.results_map) == 100
+    assert all(number_of_calls[x] == 1 for x in range(0, 100))
+
+    # Warmed keys are not counted as accessed
+    assert cache.access_counter_map[cache._build_key([5], {})] == 0
+
+    # Reads are served from the cache
+    assert cache.get([5]) == 25
+    assert number_of_calls[5] == 1
+    assert cache.access_counter_map[cache._build_key([5], {})] == 1
+
+    # Second warm-up skips existing keys, failures are counted
+    report = cache.warm([[1], [2], [-1], [200], [200]], concurrency=2)
+    assert report.skipped == 3
+    assert report.failed == 1
+    assert report.computed == 1
+    assert cache.is_cached([-1]) is False
+    assert cache.is_cached([200]) is True
+
+
+def test_warm_respects_size():
+    number_of_calls.clear()
+
+    cache = Cache(call, max_allowed_size=10)
+    report = cache.warm(generate_arguments(100), concurrency=3)
+    assert report.stopped_by_size is True
+    assert report.computed == 10
+    assert len(cache.results_map) == 10
+
+    # Regular eviction keeps working with warmed keys
+    cache.get([500])
+    assert len(cache.results_map) == 10
+    assert cache.is_cached([500]) is True
+
+
+def test_warm_rate_limit():
+    cache = Cache(call)
+    report = cache.warm(generate_arguments(5), max_rate_per_s=50)
+    assert report.computed == 5
+    assert report.duration_s >= 0.07
+
+
+test_warm()
+test_warm_respects_size()
+test_warm_rate_limit()
@@ -0,0 +1,188 @@
+import tempfile
+import threading
+from omoide_cache.cache_decorator import omoide_cache
+from omoide_cache.cache_write_decorator import omoide_cache_put, omoide_cache_evict
+from omoide_cache.write_behind import WriteBehindQueue
+
+
+class User:
+    def __init__(self, user_id: int, name: str):
+        self.user_id = user_id
+        self.name = name
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.users = {}
+        self.batches = []
+        self.failures_left = 0
+        self.lock = threading.Lock()
+
+    def save_users(self, batch):
+        with self.lock:
+            if self.failures_left > 0:
+                self.failures_left = self.failures_left - 1
+                raise IOError('Database is down')
+            self.batches.append(batch)
+            for user_id, user in batch:
+                self.users[user_id] = user
+
+
+class UserService:
+    def __init__(self, database: FakeDatabase):
+        self.database = database
+        self.number_of_loads = 0
+
+    @omoide_cache()
+    def get_user(self, user_id: int) -> User:
+        self.number_of_loads = self.number_of_loads + 1
+        return self.database.users.get(user_id)
+
+    @omoide_cache_put('get_user', arguments=lambda user: [user.user_id])
+    def save_user(self, user: User) -> User:
+        self.database.save_users([(user.user_id, user)])
+        return user
+
+    @omoide_cache_evict('get_user')
+    def delete_user(self, user_id: int):
+        self.database.users.pop(user_id, None)
+
+    @omoide_cache_evict('get_user', all_entries=True)
+    def delete_all_users(self):
+        self.database.users.clear()
+
+
+database = FakeDatabase()
+
+
+@omoide_cache()
+def count_users(prefix: str) -> int:
+    return len([user for user in database.users.values() if user.name.startswith(prefix)])
+
+
+@omoide_cache_evict(count_users, arguments=lambda prefix, user: [prefix])
+def add_user(prefix: str, user: User):
+    database.users[user.user_id] = user
+
+
+def test_put_and_evict_methods():
+    service = UserService(FakeDatabase())
+    service.save_user(User(1, 'Ann'))
+    assert service.get_user(1).name == 'Ann'
+    assert service.number_of_loads == 0
+
+    service.save_user(User(1, 'Bob'))
+    assert service.get_user(1).name == 'Bob'
+    assert service.number_of_loads == 0
+
+    service.delete_user(1)
+    assert service.get_user(1) is None
+    assert service.number_of_loads == 1
+
+    service.save_user(User(2, 'Cid'))
+    service.get_user(3)
+    service.delete_all_users()
+    assert len(service.get_user.cache.results_map) == 0
+
+
+def test_evict_plain_function():
+    database.users.clear()
+    count_users.cache.clear()
+    assert count_users('A') == 0
+    add_user('A', User(1, 'Ann'))
+    assert count_users('A') == 1
+
+
+class FakeBus:
+    def __init__(self):
+        self.published = []
+
+    def attach(self, cache, channel: str):
+        pass
+
+    def detach(self, cache, channel: str):
+        pass
+
+    def publish(self, channel: str, keys):
+        self.published.append((channel, keys))
+
+
+def test_put_and_evict_reach_disk_and_bus():
+    bus = FakeBus()
+    with tempfile.TemporaryDirectory() as directory:
+        # Function defined again stands for the next run of the program
+        def define_get_name():
+            @omoide_cache(persist_dir=directory, invalidation_bus=bus, invalidation_channel='names')
+            def get_name(user_id: int) -> str:
+                return 'unknown'
+            return get_name
+
+        get_name = define_get_name()
+
+        @omoide_cache_put(get_name, arguments=lambda user: [user.user_id])
+        def save_user(user: User) -> str:
+            return user.name
+
+        @omoide_cache_evict(get_name, all_entries=True)
+        def delete_all_users():
+            pass
+
+        save_user(User(1, 'Ann'))
+        assert get_name(1) == 'Ann'
+        assert get_name.cache.disk_cache.number_of_entries() == 1
+        assert bus.published == [('names', [get_name.cache._build_key((1,), {})])]
+        assert define_get_name()(1) == 'Ann'
+
+        delete_all_users()
+        assert get_name.cache.disk_cache.number_of_entries() == 0
+        assert bus.published[-1] == ('names', None)
+        assert define_get_name()(1) == 'unknown'
+
+
+def test_write_behind_coalesces_and_flushes():
+    database = FakeDatabase()
+    queue = WriteBehindQueue(database.save_users, flush_interval_ms=10000, max_batch_size=3)
+    for name in ['a', 'b', 'c']:
+        queue.submit(1, name)
+    queue.submit(2, 'x')
+    assert queue.number_of_coalesced == 2
+    assert queue.get_pending(1) == 'c'
+    assert queue.get_pending(3, 'missing') == 'missing'
+
+    # Nothing is written before the interval passes or the batch fills up
+    assert database.batches == []
+    queue.submit(3, 'y')
+    queue.submit(4, 'z')
+    queue.close()
+    assert database.users == {1: 'c', 2: 'x', 3: 'y', 4: 'z'}
+    assert [len(batch) for batch in database.batches] == [3, 1]
+
+    failed = False
+    try:
+        queue.submit(5, 'w')
+    except RuntimeError:
+        failed = True
+    assert failed
+
+
+def test_write_behind_retries_failed_batches():
+    database = FakeDatabase()
+    database.failures_left = 1
+    queue = WriteBehindQueue(database.save_users, flush_interval_ms=10000)
+    queue.submit(1, 'a')
+    assert not queue.flush()
+    assert queue.get_pending(1) == 'a'
+
+    # Newer value wins over the one that failed
+    queue.submit(1, 'b')
+    assert queue.flush()
+    assert database.users == {1: 'b'}
+    assert queue.number_of_failed_batches == 1
+    queue.close()
+
+
+test_put_and_evict_methods()
+test_evict_plain_function()
+test_put_and_evict_reach_disk_and_bus()
+test_write_behind_coalesces_and_flushes()
+test_write_behind_retries_failed_batches()
@@ -0,0 +1,275 @@
+import threading
+import weakref
+from typing import List, Dict, Callable
+from omoide_cache.cache import Cache, _MISSING
+from omoide_cache.observers import CacheObserver, EvictCause
+from omoide_cache.stream import RecordedStream
+
+
+# Two level cache: a small L1 tier in front of a larger L2 Cache, with the same get API
+# L1 is a plain dict (shared by all threads, or one per thread), hits are served from it without taking the L1 lock
+# L1 drops its oldest entries first (FIFO), so a hit never has to write to L1
+# Misses go to L2 (which computes the result if needed), a key is promoted to L1 once it was accessed in L2 promote_after_accesses times
+# Each L1 entry keeps the time at which L2 would expire it (or refresh it coupled to get), after that the next hit goes through L2 again
+
+
+class TierMode:
+    INCLUSIVE = 'INCLUSIVE'                             # Promoted keys stay in L2, anything dropped from L2 is dropped from L1 too
+    EXCLUSIVE = 'EXCLUSIVE'                             # Promoted keys leave L2, keys dropped from L1 are demoted back to L2
+
+
+# Checked by the decorator too, so a wrong tier setting fails when it is applied
+def validate_tier_settings(l1_max_allowed_size: int = 100, tier_mode: str = TierMode.INCLUSIVE, refresh_enabled: bool = False):
+    if l1_max_allowed_size < 1:
+        raise RuntimeError('l1_max_allowed_size cannot be less than 1')
+    if tier_mode not in (TierMode.INCLUSIVE, TierMode.EXCLUSIVE):
+        raise RuntimeError('Tier mode ' + str(tier_mode) + ' is not implemented yet')
+    if tier_mode == TierMode.EXCLUSIVE and refresh_enabled:
+        raise RuntimeError('Tier mode EXCLUSIVE cannot be used with refresh, promoted keys would never be refreshed')
+
+
+class _L1:
+    __slots__ = ('entries', 'lock', '__weakref__')
+
+    def __init__(self):
+        self.entries = {}                               # {key -> (result, deadline in nano-seconds or None, arguments kept for demotion or None, computed timestamp in nano-seconds)}
+        self.lock = threading.Lock()
+
+
+# Keeps L1 tiers of an inclusive tiered cache consistent with its L2
+class _InclusiveTierObserver(CacheObserver):
+    def __init__(self, tiered_cache):
+        self.tiered_cache = tiered_cache
+
+    def on_evict(self, cache, key: str, cause: str):
+        self.tiered_cache._drop_from_l1_tiers(key)
+
+    def on_refresh(self, cache, key: str, duration_ns: int):
+        self.tiered_cache._drop_from_l1_tiers(key)
+
+
+class TieredCache:
+    def __init__(self, l2_cache: Cache, l1_max_allowed_size: int = 100, l1_per_thread: bool = False,
+                 tier_mode: str = TierMode.INCLUSIVE, promote_after_accesses: int = 1):
+        validate_tier_settings(l1_max_allowed_size=l1_max_allowed_size, tier_mode=tier_mode, refresh_enabled=l2_cache.refresh_enabled)
+
+        self.l2_cache = l2_cache
+        self.l1_max_allowed_size = l1_max_allowed_size
+        self.l1_per_thread = l1_per_thread
+        self.tier_mode = tier_mode
+        self.promote_after_accesses = promote_after_accesses
+
+        # All L1 tiers (one, or one per live thread), so invalidation can reach each of them
+        self._l1_tiers = weakref.WeakSet()
+        self._l1_tiers_lock = threading.Lock()
+        if self.l1_per_thread:
+            self._l1_local = threading.local()
+        else:
+            self._l1_shared = self._create_l1()
+
+        # In inclusive mode L1 follows L2, so expiry, eviction and invalidation of L2 reach L1 as well
+        # Refreshed (or replaced) results are dropped from L1 too, so they are re-promoted with the new value
+        # L1 hits are recorded in L2 (last accessed time and access counter), so L2 doesn't evict or expire keys that are in use
+        if self.tier_mode == TierMode.INCLUSIVE:
+            self.l2_cache.observers.append(_InclusiveTierObserver(self))
+
+        # In exclusive mode promoted keys are only known to L1, so invalidations from other processes are received by the tiered cache instead of L2
+        # Arguments of promoted keys are kept in L1 (in the form given by arguments retention of L2) to demote them, keys without them are just dropped
+        if self.tier_mode == TierMode.EXCLUSIVE and self.l2_cache.invalidation_bus is not None:
+            self.l2_cache.invalidation_bus.detach(self.l2_cache, self.l2_cache.invalidation_channel)
+            self.l2_cache.invalidation_bus.attach(self, self.l2_cache.invalidation_channel)
+
+        # Expiry of L2 that is checked on L1 hits, only the clock is read on a hit if either is enabled
+        self._deadline_enabled = self.l2_cache.expire_by_computed_enabled or self.l2_cache._refresh_coupled_enabled
+
+    def _create_l1(self) -> _L1:
+        l1 = _L1()
+        with self._l1_tiers_lock:
+            self._l1_tiers.add(l1)
+        return l1
+
+    def _get_l1(self) -> _L1:
+        if not self.l1_per_thread:
+            return self._l1_shared
+        l1 = getattr(self._l1_local, 'l1', None)
+        if l1 is None:
+            l1 = self._create_l1()
+            self._l1_local.l1 = l1
+        return l1
+
+    def _get_l1_tiers(self) -> List[_L1]:
+        with self._l1_tiers_lock:
+            return list(self._l1_tiers)
+
+    def _drop_from_l1_tiers(self, key: str) -> bool:
+        dropped = False
+        for l1 in self._get_l1_tiers():
+            if l1.entries.pop(key, None) is not None:
+                dropped = True
+        return dropped
+
+    def get(self, positional_arguments: List, keyword_arguments: Dict = {}):
+        key = self.l2_cache._build_key(positional_arguments, keyword_arguments)
+        l1 = self._get_l1()
+
+        # Fast path, streams are replayed to each caller (or computed again by L2 if they can't be replayed anymore)
+        entry = l1.entries.get(key)
+        if entry is not None:
+            if entry[1] is not None and self.l2_cache.clock.time_ns() >= entry[1]:
+                with l1.lock:
+                    if l1.entries.get(key) is entry:
+                        del l1.entries[key]
+            elif type(entry[0]) is not RecordedStream:
+                if self.tier_mode == TierMode.INCLUSIVE:
+                    self._record_l1_hit(key)
+                return entry[0]
+            else:
+                reader = entry[0].replay()
+                if reader is not None:
+                    if self.tier_mode == TierMode.INCLUSIVE:
+                        self._record_l1_hit(key)
+                    return reader
+
+        # Slow path, promote the key if it's accessed often enough
+        result = self.l2_cache.get(positional_arguments, keyword_arguments)
+        if self.l2_cache.access_counter_map.get(key, 0) >= self.promote_after_accesses:
+            self._promote(l1, key)
+        return result
+
+    # Keys that were dropped from L2 in the meantime are not recorded
+    def _record_l1_hit(self, key: str):
+        l2_cache = self.l2_cache
+        with l2_cache.last_accessed_map_lock:
+            if key in l2_cache.last_accessed_map:
+                l2_cache.last_accessed_map[key] = l2_cache.clock.time_ns()
+        with l2_cache.access_counter_map_lock:
+            access_counter = l2_cache.access_counter_map.get(key)
+            if access_counter is not None:
+                l2_cache.access_counter_map[key] = access_counter + 1
+
+    # Time at which L2 would expire the key (or refresh it coupled to get), or None if it never does
+    def _deadline_ns(self, key: str, computed_ns: int) -> int:
+        l2_cache = self.l2_cache
+        deadline_ns = None
+        if l2_cache.expire_by_computed_enabled:
+            deadline_ns = computed_ns + l2_cache._jittered_duration_ns(key, l2_cache.expire_by_computed_duration_ns)
+        if l2_cache._refresh_coupled_enabled:
+            refresh_deadline_ns = computed_ns + l2_cache._jittered_duration_ns(key, l2_cache.refresh_duration_ns)
+            deadline_ns = refresh_deadline_ns if deadline_ns is None else min(deadline_ns, refresh_deadline_ns)
+        return deadline_ns
+
+    # Result is taken from L2 as it's stored there (streams as recordings), a refresh that finished during get() is not missed
+    def _promote(self, l1: _L1, key: str):
+        computed_ns = self.l2_cache.last_computed_map.get(key)
+        result = self.l2_cache.results_map.get(key, _MISSING)
+        if computed_ns is None or result is _MISSING:
+            return
+        deadline_ns = self._deadline_ns(key, computed_ns) if self._deadline_enabled else None
+        arguments = self.l2_cache.arguments_map.get(key) if self.tier_mode == TierMode.EXCLUSIVE else None
+        entry = (result, deadline_ns, arguments, computed_ns)
+        demoted_entries = []
+        with l1.lock:
+            l1.entries[key] = entry
+            while len(l1.entries) > self.l1_max_allowed_size:
+                oldest_key = next(iter(l1.entries))
+                demoted_entries.append((oldest_key, l1.entries.pop(oldest_key)))
+
+        # Invalidation drops the key from L2 before L1, so one that ran after L2 was read above either finds the entry in L1,
+        # or has already changed L2, which is checked again once the entry is in place
+        promoted = self.l2_cache.last_computed_map.get(key) == computed_ns
+        if not promoted:
+            with l1.lock:
+                if l1.entries.get(key) is entry:
+                    del l1.entries[key]
+
+        if self.tier_mode == TierMode.EXCLUSIVE:
+            if promoted:
+                self.l2_cache._invalidate_keys([key], EvictCause.PROMOTED)
+            for demoted_key, demoted_entry in demoted_entries:
+                self._demote(demoted_key, demoted_entry[0], demoted_entry[1], demoted_entry[2])
+
+    def _demote(self, key: str, result, deadline_ns: int, arguments):
+        if arguments is None or (deadline_ns is not None and self.l2_cache.clock.time_ns() >= deadline_ns):
+            return
+        arguments = self.l2_cache._resolve_arguments(arguments)
+        if arguments is not None:
+            self.l2_cache._put_local(key, arguments[0], arguments[1], result)
+
+    def is_cached(self, positional_arguments: List, keyword_arguments: Dict = {}) -> bool:
+        key = self.l2_cache._build_key(positional_arguments, keyword_arguments)
+        return key in self._get_l1().entries or key in self.l2_cache.results_map
+
+    # New result goes to L2, and is promoted again on the next accesses
+    def put(self, positional_arguments: List, keyword_arguments: Dict, result):
+        self.l2_cache.put(positional_arguments, keyword_arguments, result)
+        self._drop_from_l1_tiers(self.l2_cache._build_key(positional_arguments, keyword_arguments))
+
+    # Invalidation reaches every tier, each method returns the number of dropped keys
+    #-------------------------------------------------------------------------------------------------------------------
+    def invalidate(self, positional_arguments: List, keyword_arguments: Dict = {}) -> int:
+        key = self.l2_cache._build_key(positional_arguments, keyword_arguments)
+        dropped_from_l2 = self.l2_cache.invalidate(positional_arguments, keyword_arguments)
+        dropped_from_l1 = self._drop_from_l1_tiers(key)
+        return max(dropped_from_l2, 1 if dropped_from_l1 else 0)
+
+    def invalidate_many(self, positional_arguments_list: List[List], keyword_arguments: Dict = {}) -> int:
+        return sum(self.invalidate(positional_arguments, keyword_arguments) for positional_arguments in positional_arguments_list)
+
+    # Tags and arguments are only known to L2, so in exclusive mode promoted keys can't be matched and L1 is cleared completely
+    def invalidate_by_tag(self, tag) -> int:
+        number_of_keys = self.l2_cache.invalidate_by_tag(tag)
+        if self.tier_mode == TierMode.EXCLUSIVE:
+            number_of_keys = number_of_keys + self._clear_l1_tiers()
+        return number_of_keys
+
+    def invalidate_where(self, predicate: Callable[[List, Dict], bool]) -> int:
+        number_of_keys = self.l2_cache.invalidate_where(predicate)
+        if self.tier_mode == TierMode.EXCLUSIVE:
+            number_of_keys = number_of_keys + self._clear_l1_tiers()
+        return number_of_keys
+
+    def clear(self) -> int:
+        number_of_keys = self.l2_cache.clear()
+        if self.tier_mode == TierMode.EXCLUSIVE:
+            number_of_keys = number_of_keys + self._clear_l1_tiers()
+        return number_of_keys
+
+    # Invalidation received from another process (see InvalidationBus), only attached in exclusive mode
+    def _invalidate_keys_computed_before(self, keys: List[str], version_ns: int) -> int:
+        number_of_keys = self.l2_cache._invalidate_keys_computed_before(keys, version_ns)
+        for l1 in self._get_l1_tiers():
+            with l1.lock:
+                candidate_keys = list(l1.entries) if keys is None else keys
+                for key in candidate_keys:
+                    entry = l1.entries.get(key)
+                    if entry is not None and entry[3] < version_ns:
+                        del l1.entries[key]
+                        number_of_keys = number_of_keys + 1
+        return number_of_keys
+
+    def _clear_l1_tiers(self) -> int:
+        number_of_keys = 0
+        for l1 in self._get_l1_tiers():
+            with l1.lock:
+                number_of_keys = number_of_keys + len(l1.entries)
+                l1.entries = {}
+        return number_of_keys
+    #-------------------------------------------------------------------------------------------------------------------
+
+    def close(self, timeout_s: float = 5.0) -> bool:
+        if self.tier_mode == TierMode.EXCLUSIVE and self.l2_cache.invalidation_bus is not None:
+            self.l2_cache.invalidation_bus.detach(self, self.l2_cache.invalidation_channel)
+        return self.l2_cache.close(timeout_s)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def terminate(self):
+        self.close(timeout_s=0)
+
+    # Same as Cache, so the objects that own a tiered cache can still be pickled
+    def __reduce__(self):
+        return self.l2_cache.__reduce__()
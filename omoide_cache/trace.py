@@ -0,0 +1,74 @@
+import struct
+import hashlib
+import threading
+from typing import Iterator, Tuple
+
+
+# Compact binary log of cache accesses, used to replay production traffic in the simulator
+# File starts with a header, followed by fixed size records: key hash (unsigned 64 bit), timestamp in nano-seconds (signed 64 bit), hit flag (1 byte)
+
+TRACE_HEADER = b'OMOIDETRACE1'
+TRACE_RECORD = struct.Struct('<QqB')
+
+
+# Stable across processes (unlike built-in hash()), so traces from different workers can be merged
+def hash_key(key) -> int:
+    if isinstance(key, str):
+        key = key.encode('utf-8', 'surrogatepass')
+    elif not isinstance(key, (bytes, bytearray)):
+        key = str(key).encode('utf-8', 'surrogatepass')
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little')
+
+
+class TraceRecorder:
+    def __init__(self, path: str, buffer_size: int = 4096):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.number_of_records = 0
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._file = open(path, 'wb')
+        self._file.write(TRACE_HEADER)
+
+    # Records are kept in memory and written in batches
+    # Appended under the lock, so a record made while flush() swaps the buffer is never lost
+    def record(self, key, timestamp_ns: int, hit: bool):
+        data = TRACE_RECORD.pack(hash_key(key), timestamp_ns, 1 if hit else 0)
+        with self._lock:
+            self._buffer.append(data)
+            full = len(self._buffer) >= self.buffer_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            buffer, self._buffer = self._buffer, []
+            if buffer and not self._file.closed:
+                self._file.write(b''.join(buffer))
+                self._file.flush()
+                self.number_of_records = self.number_of_records + len(buffer)
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+
+# Yields (key hash, timestamp in nano-seconds, hit) for each record
+def read_trace(path: str) -> Iterator[Tuple[int, int, bool]]:
+    with open(path, 'rb') as file:
+        header = file.read(len(TRACE_HEADER))
+        if header != TRACE_HEADER:
+            raise RuntimeError('File ' + str(path) + ' is not an omoide cache trace')
+        while True:
+            chunk = file.read(TRACE_RECORD.size * 4096)
+            if not chunk:
+                return
+            for key_hash, timestamp_ns, hit in TRACE_RECORD.iter_unpack(chunk[:len(chunk) - len(chunk) % TRACE_RECORD.size]):
+                yield key_hash, timestamp_ns, hit == 1
@@ -0,0 +1,145 @@
+import time
+import atexit
+import weakref
+import threading
+from typing import List, Tuple, Callable
+from omoide_cache.log import logger, RateLimitedWarning
+
+
+# Queue of writes to a slow backend (e.g. a database), done in batches on a background thread instead of on the caller's thread
+# Writes of the same key are coalesced, only the last value is written. Batches are written every flush interval, or as soon as max batch size is pending
+# A failed batch is logged and retried with the next one (unless a newer value of the key was submitted meanwhile)
+# Pending writes are flushed by close(), and at interpreter exit for queues that were not closed
+# Reads stay consistent if the new value is also put into the read cache (see omoide_cache_put), or if the read method checks get_pending() first
+class WriteBehindQueue:
+    def __init__(self, write_batch: Callable[[List[Tuple[object, object]]], None],
+                 flush_interval_ms: float = 100, max_batch_size: int = 100, max_pending: int = 10000):
+        if max_batch_size < 1 or max_pending < max_batch_size:
+            raise RuntimeError('max_batch_size must be at least 1, and max_pending at least max_batch_size')
+
+        # Called as write_batch([(key, value), ...]) on the background thread
+        self.write_batch = write_batch
+        self.flush_interval_s = flush_interval_ms / 1000
+        self.max_batch_size = max_batch_size
+
+        # Submits block while that many keys are waiting to be written
+        self.max_pending = max_pending
+
+        self.number_of_batches = 0
+        self.number_of_coalesced = 0
+        self.number_of_failed_batches = 0
+
+        self._pending = {}                              # {key -> last submitted value}, in order of first submission
+        self._in_flight = {}                            # Batch that is being written right now
+        self._condition = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._closed = False
+        self._failed_write_warning = RateLimitedWarning()
+
+        self._worker = threading.Thread(target=self._run, name='omoide_cache-write-behind', daemon=True)
+        self._worker.start()
+        _live_queues.add(self)
+
+    def submit(self, key, value):
+        with self._condition:
+            while len(self._pending) >= self.max_pending and key not in self._pending and not self._closed:
+                self._condition.wait()
+            if self._closed:
+                raise RuntimeError('WriteBehindQueue is closed')
+            if key in self._pending:
+                self.number_of_coalesced = self.number_of_coalesced + 1
+            self._pending[key] = value
+            if len(self._pending) == 1 or len(self._pending) >= self.max_batch_size:
+                self._condition.notify_all()
+
+    # Last submitted value of the key that is not written yet, or default if there is none
+    def get_pending(self, key, default=None):
+        with self._condition:
+            if key in self._pending:
+                return self._pending[key]
+            return self._in_flight.get(key, default)
+
+    def number_of_pending(self) -> int:
+        with self._condition:
+            return len(self._pending) + len(self._in_flight)
+
+    # Writes everything that is pending on the caller's thread, returns False if some batch failed
+    def flush(self) -> bool:
+        while True:
+            with self._condition:
+                if not self._pending:
+                    return True
+            if not self._write_pending():
+                return False
+
+    def close(self, timeout_s: float = 5.0) -> bool:
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._worker.join(timeout_s)
+        _live_queues.discard(self)
+        flushed = self.flush()
+        if not flushed:
+            logger.error('WriteBehindQueue.close(): Failed to flush, %d writes are lost', self.number_of_pending())
+        return flushed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                deadline = time.monotonic() + self.flush_interval_s
+                while not self._closed and len(self._pending) < self.max_batch_size:
+                    remaining_s = deadline - time.monotonic()
+                    if remaining_s <= 0:
+                        break
+                    self._condition.wait(remaining_s)
+                if self._closed:
+                    return
+            if not self._write_pending():
+                # Backend is failing, wait a full interval before the retry
+                with self._condition:
+                    if not self._closed:
+                        self._condition.wait(self.flush_interval_s)
+
+    # Writes one batch, returns False if it failed
+    def _write_pending(self) -> bool:
+        with self._write_lock:
+            with self._condition:
+                keys = list(self._pending)[:self.max_batch_size]
+                self._in_flight = {key: self._pending.pop(key) for key in keys}
+                batch = list(self._in_flight.items())
+                self._condition.notify_all()
+            if not batch:
+                return True
+            try:
+                self.write_batch(batch)
+                self.number_of_batches = self.number_of_batches + 1
+                succeeded = True
+            except Exception:
+                self.number_of_failed_batches = self.number_of_failed_batches + 1
+                self._failed_write_warning.warning('WriteBehindQueue._write_pending(): Failed to write a batch of %d keys, will retry', len(batch), exc_info=True)
+                succeeded = False
+            with self._condition:
+                if not succeeded:
+                    # Put failed writes back in front, unless a newer value was submitted meanwhile
+                    requeued = {key: value for key, value in batch if key not in self._pending}
+                    requeued.update(self._pending)
+                    self._pending = requeued
+                self._in_flight = {}
+            return succeeded
+
+
+_live_queues = weakref.WeakSet()
+
+
+@atexit.register
+def _close_live_queues():
+    for queue in list(_live_queues):
+        queue.close(timeout_s=1.0)